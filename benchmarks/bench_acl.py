@@ -0,0 +1,90 @@
+""" Lookups per second by the authorizer, see `secbot/acl.py`, against the
+lookup it replaced, which found the card's access level and parsed its
+hours on every scan.
+
+Each ACL has cards spread across a handful of access levels, and is looked
+up with a mix of known and unknown cards.  Compiling is the time taken to
+build the `AccessList` when the ACL is loaded.
+
+Reloading after one card changed, as the TUI does, is timed as finding the
+change with `AccessList.changes`, which the authorizer does in a thread,
+and applying it with `update`, which holds up the event loop.  Compare
+those with compiling the ACL afresh.  None include reading the files.
+
+Run from the repository root:
+    `$ python benchmarks/bench_acl.py [number]`
+"""
+import sys
+import time
+import timeit
+from datetime import datetime
+
+from secbot.acl import AccessList
+
+
+NUMBER = 100_000
+SIZES = (10_000, 100_000, 1_000_000)
+
+HOURS = {
+    "allhours": ["0", "24"],
+    "daytime": ["11", "22"],
+    "evening": ["17", "24"],
+    "morning": ["6", "12"],
+}
+
+
+def make_rfids(size):
+    levels = list(HOURS)
+    return {f"{i:010d}": {"access_times": levels[i % len(levels)],
+                          "sponsor": "bench"}
+            for i in range(size)}
+
+
+def parsed_lookup(hours, rfids, identity):
+    if identity not in rfids:
+        return False
+    start_time, end_time = map(int, hours[rfids[identity]['access_times']])
+    this_hour = datetime.now().hour
+    return start_time <= this_hour < end_time
+
+
+def compiled_lookup(acl, identity):
+    return acl.allowed(identity, datetime.now().hour)
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else NUMBER
+    print(f"{'cards':>9} {'compile ms':>11} {'parsed/s':>10}"
+          f" {'compiled/s':>11} {'diff ms':>8} {'update ms':>10}")
+    for size in SIZES:
+        rfids = make_rfids(size)
+        # every other lookup is for a card which isn't in the ACL
+        identities = [f"{(i * 7919) % (2 * size):010d}"
+                      for i in range(number)]
+
+        start = time.perf_counter()
+        acl = AccessList(HOURS, rfids)
+        compile_ms = (time.perf_counter() - start) * 1e3
+
+        parsed = timeit.timeit(
+            lambda: [parsed_lookup(HOURS, rfids, i) for i in identities],
+            number=1)
+        compiled = timeit.timeit(
+            lambda: [compiled_lookup(acl, i) for i in identities], number=1)
+        new_rfids = dict(rfids)
+        new_rfids[f"{size:010d}"] = {"access_times": "daytime",
+                                     "sponsor": "bench"}
+        start = time.perf_counter()
+        changes = acl.changes(HOURS, new_rfids)
+        diff_ms = (time.perf_counter() - start) * 1e3
+        start = time.perf_counter()
+        acl.update(*changes)
+        update_ms = (time.perf_counter() - start) * 1e3
+
+        print(f"{size:>9} {compile_ms:>11.1f} {number / parsed:>10.0f}"
+              f" {number / compiled:>11.0f} {diff_ms:>8.1f}"
+              f" {update_ms:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+""" Time to read the ACL when the authorizer starts or reloads, see
+`secbot/database.py`, at 10k, 100k and 1M cards.
+
+    csv: parsing the CSV files, as before snapshots.
+    rebuild: parsing them and writing the snapshot, as the first start
+        after the files change does.
+    snapshot: reading the snapshot, as every other start does.
+    sqlite: reading the same ACL from a SQLite database.
+
+Each is the best of `REPEAT` runs, in milliseconds, and includes reading
+the files.  Startup also compiles the ACL, see `bench_acl.py`.
+
+Run from the repository root:
+    `$ python benchmarks/bench_acl_startup.py [repeat]`
+"""
+import os
+import sys
+import tempfile
+import time
+
+from secbot.database import (
+    migrate_csv,
+    read_acl_data,
+    SNAPSHOT_FILE,
+    write_hours_data,
+    write_rfid_data,
+)
+
+
+REPEAT = 5
+SIZES = (10_000, 100_000, 1_000_000)
+
+HOURS = {
+    "allhours": ["0", "24"],
+    "daytime": ["11", "22"],
+    "evening": ["17", "24"],
+    "morning": ["6", "12"],
+}
+
+
+def best_ms(run, repeat, setup=None):
+    best = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        run()
+        elapsed = (time.perf_counter() - start) * 1e3
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else REPEAT
+    print(f"{'cards':>9} {'csv ms':>9} {'rebuild ms':>11} {'snapshot ms':>12}"
+          f" {'sqlite ms':>10}")
+    levels = list(HOURS)
+    for size in SIZES:
+        rfids = {f"{i:010d}": {"access_times": levels[i % len(levels)],
+                               "sponsor": f"member{i % 500}"}
+                 for i in range(size)}
+        with tempfile.TemporaryDirectory() as data_dir:
+            write_hours_data(HOURS, data_dir)
+            write_rfid_data(rfids, data_dir)
+            snapshot = os.path.join(data_dir, SNAPSHOT_FILE)
+
+            def remove_snapshot():
+                if os.path.exists(snapshot):
+                    os.unlink(snapshot)
+
+            parsed = best_ms(
+                lambda: read_acl_data(data_dir, snapshot=False), repeat)
+            rebuild = best_ms(lambda: read_acl_data(data_dir), repeat,
+                              setup=remove_snapshot)
+            cached = best_ms(lambda: read_acl_data(data_dir), repeat)
+
+            database = os.path.join(data_dir, "acl.sqlite3")
+            migrate_csv(data_dir, database)
+            sqlite = best_ms(
+                lambda: read_acl_data(database=database), repeat)
+
+        print(f"{size:>9} {parsed:>9.1f} {rebuild:>11.1f} {cached:>12.1f}"
+              f" {sqlite:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
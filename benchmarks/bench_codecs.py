@@ -0,0 +1,60 @@
+""" Microbenchmarks of the JSON codecs installed for `secbot.comms` with
+the request, response, grant and event messages described in
+`secbot/schema.py`.
+
+Each message is encoded to and decoded from `bytes`, as on the wire.
+
+Run from the repository root:
+    `$ python benchmarks/bench_codecs.py [number]`
+"""
+import sys
+import timeit
+
+from secbot.comms import JSON_CODECS
+
+
+NUMBER = 100_000
+
+MESSAGES = {
+    "request": {
+        "source_id": "front_door_rfid",
+        "target_id": "front_door_latch",
+        "request_id": 1234,
+        "permissions": [{
+            "perm": "/open",
+            "ctx": {"identity": "0123456789"}}]},
+    "response": {
+        "source_id": "front_door_rfid",
+        "target_id": "front_door_latch",
+        "request_id": 1234,
+        "code": 0,
+        "msg": "OK"},
+    "grant": {
+        "source_id": "front_door_rfid",
+        "target_id": "front_door_latch",
+        "request_id": 1234,
+        "permissions": [{
+            "perm": "/open",
+            "ctx": {},
+            "grant": True}]},
+    "event": {
+        "source_id": "front_door_latch",
+        "event": "/front_door/open"},
+}
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else NUMBER
+    print(f"{'codec':>8} {'message':>10} {'encode us':>10} {'decode us':>10}")
+    for name, codec in JSON_CODECS.items():
+        for shape, msg in MESSAGES.items():
+            data = codec.dumps(msg)
+            encode = timeit.timeit(lambda: codec.dumps(msg), number=number)
+            decode = timeit.timeit(lambda: codec.loads(data), number=number)
+            print(f"{name:>8} {shape:>10} "
+                  f"{encode / number * 1e6:>10.2f} "
+                  f"{decode / number * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
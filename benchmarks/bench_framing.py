@@ -0,0 +1,87 @@
+""" Compares the wire framings supported by `secbot.comms` over the same
+unix domain socket.
+
+A server component answers every request, and a client pipelines
+`COUNT` requests at it in windows of `WINDOW`.  Both sides run in this
+process, so the CPU time reported per message covers encoding and decoding
+at both ends.
+
+Run from the repository root:
+    `$ python benchmarks/bench_framing.py [count]`
+"""
+import asyncio
+import logging
+import sys
+import tempfile
+import time
+
+from secbot.comms import (
+    Comms,
+    FRAMINGS,
+)
+
+
+COUNT = 20_000
+WINDOW = 100
+
+
+def make_request(i):
+    return {
+        "source_id": "bench_client",
+        "target_id": "bench_server",
+        "permissions": [{
+            "perm": "/open",
+            "ctx": {"identity": f"{i:010d}"}}]}
+
+
+async def serve(comms):
+    while True:
+        req = await comms.in_q.get()
+        resp = dict(req)
+        resp.pop('permissions')
+        resp['code'] = 0
+        resp['msg'] = "OK"
+        await comms.out_q.put(resp)
+
+
+async def run(framing, socket_root, count):
+    server = Comms("bench_server")
+    server.socket_root = socket_root
+    server.start()
+    await asyncio.sleep(0.1)
+    serving = asyncio.create_task(serve(server))
+
+    client = Comms("bench_client")
+    client.socket_root = socket_root
+    client.framing = framing
+    conn = await client.connect("bench_server")
+    assert conn.framing.name == framing
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    for start in range(0, count, WINDOW):
+        await asyncio.gather(*[
+            client.request("bench_server", make_request(i))
+            for i in range(start, min(start + WINDOW, count))])
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+
+    await client.disconnect("bench_server")
+    await asyncio.sleep(0.1)  # let the server see the disconnect
+    serving.cancel()
+    server.stop()
+    return count / wall, cpu / count * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else COUNT
+    logging.basicConfig(level=logging.ERROR)
+    print(f"{'framing':>10} {'msgs/s':>12} {'cpu us/msg':>12}")
+    with tempfile.TemporaryDirectory() as socket_root:
+        for framing in FRAMINGS:
+            rate, cpu = asyncio.run(run(framing, socket_root, count))
+            print(f"{framing:>10} {rate:>12.0f} {cpu:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
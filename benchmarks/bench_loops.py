@@ -0,0 +1,150 @@
+""" Compares the event loops installed, see `secbot/eventloop.py`, on the
+traffic the services see.
+
+    round trip: a client makes `COUNT` requests of a server over its unix
+        domain socket one at a time, as a reader does per scan.
+    pipelined: the same in windows of `WINDOW` requests.
+    fan-out: a server publishes `COUNT` events to `SUBSCRIBERS` clients
+        subscribed over their sockets, as the latch does to the broadcast
+        service and TUIs, in bursts of `BURST`.
+
+Both sides run in this process, so the CPU time per message covers both
+ends.  Latencies are the 50th and 99th percentile round trips.
+
+Run from the repository root:
+    `$ python benchmarks/bench_loops.py [count]`
+"""
+import asyncio
+import logging
+import sys
+import tempfile
+import time
+
+from secbot.comms import Comms
+from secbot.eventloop import (
+    EVENT_LOOPS,
+    new_event_loop,
+)
+from secbot.tracing import percentiles
+
+
+COUNT = 10_000
+WINDOW = 32
+SUBSCRIBERS = 4
+BURST = 32
+
+
+def make_request(i):
+    return {
+        "source_id": "bench_client",
+        "target_id": "bench_server",
+        "permissions": [{
+            "perm": "/open",
+            "ctx": {"identity": f"{i:010d}"}}]}
+
+
+async def serve(comms):
+    while True:
+        req = await comms.in_q.get()
+        resp = dict(req)
+        resp.pop('permissions')
+        resp['code'] = 0
+        resp['msg'] = "OK"
+        await comms.out_q.put(resp)
+
+
+async def start_server(socket_root):
+    server = Comms("bench_server")
+    server.socket_root = socket_root
+    server.buffered = True
+    server.start()
+    await asyncio.sleep(0.1)
+    return server
+
+
+async def round_trip(socket_root, count, window):
+    server = await start_server(socket_root)
+    serving = asyncio.create_task(serve(server))
+    client = Comms("bench_client")
+    client.socket_root = socket_root
+    await client.connect("bench_server")
+
+    async def timed(i):
+        start = time.perf_counter()
+        await client.request("bench_server", make_request(i))
+        return time.perf_counter() - start
+
+    latencies = []
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    for start in range(0, count, window):
+        latencies += await asyncio.gather(*[
+            timed(i) for i in range(start, min(start + window, count))])
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+
+    await client.shutdown()
+    await server.shutdown()
+    serving.cancel()
+    return count / wall, cpu / count * 1e6, percentiles(latencies)
+
+
+async def fan_out(socket_root, count, subscribers):
+    server = await start_server(socket_root)
+    clients, queues = [], []
+    for i in range(subscribers):
+        client = Comms(f"bench_subscriber_{i}")
+        client.socket_root = socket_root
+        clients.append(client)
+        queues.append(await client.subscribe_remote("bench_server", "/*"))
+    await asyncio.sleep(0.1)
+
+    async def receive(queue, n):
+        for _ in range(n):
+            await queue.get()
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    for start in range(0, count, BURST):
+        n = min(BURST, count - start)
+        for i in range(n):
+            server.publish("/front_door/open", {"n": start + i})
+        await asyncio.gather(*[receive(queue, n) for queue in queues])
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+
+    delivered = count * subscribers
+    await asyncio.gather(*[client.shutdown() for client in clients])
+    await server.shutdown()
+    return delivered / wall, cpu / delivered * 1e6, None
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else COUNT
+    logging.basicConfig(level=logging.ERROR)
+    benchmarks = {
+        "round trip": lambda root: round_trip(root, count, 1),
+        "pipelined": lambda root: round_trip(root, count, WINDOW),
+        "fan-out": lambda root: fan_out(root, count, SUBSCRIBERS),
+    }
+    print(f"{'loop':>8} {'benchmark':>12} {'msgs/s':>10} {'cpu us/msg':>11}"
+          f" {'p50 us':>8} {'p99 us':>8}")
+    with tempfile.TemporaryDirectory() as socket_root:
+        for name in EVENT_LOOPS:
+            for benchmark, run in benchmarks.items():
+                loop = new_event_loop(name)
+                try:
+                    rate, cpu, latency = loop.run_until_complete(
+                        run(socket_root))
+                finally:
+                    loop.close()
+                p50 = p99 = ""
+                if latency:
+                    p50 = f"{latency['p50'] * 1e6:.0f}"
+                    p99 = f"{latency['p99'] * 1e6:.0f}"
+                print(f"{name:>8} {benchmark:>12} {rate:>10.0f} {cpu:>11.1f}"
+                      f" {p50:>8} {p99:>8}")
+
+
+if __name__ == "__main__":
+    main()
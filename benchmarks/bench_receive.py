@@ -0,0 +1,85 @@
+""" Compares the two receive paths of a `secbot.comms` server: the
+StreamReader of `Comms.set_callback` and the buffered `FrameProtocol`.
+
+A raw client writes `COUNT` requests down a unix domain socket in bursts of
+`BURST`, and the time is taken until the server has put them all on its
+in_q.  Both sides run in this process, so the CPU time per message includes
+the client's writes, which are the same for both paths.
+
+Run from the repository root:
+    `$ python benchmarks/bench_receive.py [count]`
+"""
+import asyncio
+import logging
+import sys
+import tempfile
+import time
+
+from secbot.comms import (
+    Comms,
+    FRAMINGS,
+    negotiate_framing,
+)
+
+
+COUNT = 100_000
+BURST = 100
+
+
+def make_request(i):
+    return {
+        "source_id": "bench_client",
+        "target_id": "bench_server",
+        "permissions": [{
+            "perm": "/open",
+            "ctx": {"identity": f"{i:010d}"}}]}
+
+
+async def run(buffered, framing, socket_root, count):
+    server = Comms("bench_server")
+    server.socket_root = socket_root
+    server.buffered = buffered
+    server.start()
+    await asyncio.sleep(0.1)
+
+    reader, writer = await asyncio.open_unix_connection(
+        f"{socket_root}/bench_server.sock")
+    wire = await negotiate_framing(reader, writer, framing)
+    bursts = [b"".join(wire.encode(make_request(i))
+                       for i in range(start, min(start + BURST, count)))
+              for start in range(0, count, BURST)]
+
+    async def consume():
+        for _ in range(count):
+            await server.in_q.get()
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    consumer = asyncio.create_task(consume())
+    for burst in bursts:
+        writer.write(burst)
+        await writer.drain()
+    await consumer
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+
+    writer.close()
+    await asyncio.sleep(0.1)  # let the server see the disconnect
+    server.stop()
+    return count / wall, cpu / count * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else COUNT
+    logging.basicConfig(level=logging.ERROR)
+    print(f"{'path':>10} {'framing':>10} {'msgs/s':>12} {'cpu us/msg':>12}")
+    with tempfile.TemporaryDirectory() as socket_root:
+        for framing in FRAMINGS:
+            for path, buffered in (("stream", False), ("protocol", True)):
+                rate, cpu = asyncio.run(
+                    run(buffered, framing, socket_root, count))
+                print(f"{path:>10} {framing:>10} {rate:>12.0f} {cpu:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+""" Microbenchmarks of the validators compiled from `secbot/schema.py`,
+with the messages of `bench_codecs.py`, against `jsonschema` if it is
+installed.
+
+A valid message is checked in full, so this is the cost paid for every
+message with VALIDATE on.
+
+Run from the repository root:
+    `$ python benchmarks/bench_validation.py [number]`
+"""
+import sys
+import timeit
+
+from bench_codecs import MESSAGES
+from secbot import schema
+from secbot.comms import VALIDATORS
+from secbot.metrics import message_type
+
+try:
+    import jsonschema
+except ImportError:
+    jsonschema = None
+
+
+NUMBER = 100_000
+
+SCHEMAS = {
+    "request": schema.request_schema,
+    "response": schema.response_schema,
+    "event": schema.event_schema,
+}
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else NUMBER
+    print(f"{'message':>10} {'compiled us':>12} {'jsonschema us':>14}")
+    for shape, msg in MESSAGES.items():
+        kind = message_type(msg)
+        validate = VALIDATORS[kind]
+        compiled = timeit.timeit(lambda: validate(msg), number=number)
+        compiled = f"{compiled / number * 1e6:>12.2f}"
+        reference = "-"
+        if jsonschema:
+            validator = jsonschema.Draft202012Validator(SCHEMAS[kind])
+            reference = timeit.timeit(
+                lambda: validator.validate(msg), number=number // 10)
+            reference = f"{reference / (number // 10) * 1e6:.2f}"
+        print(f"{shape:>10} {compiled} {reference:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+""" The access control list compiled for lookups.
+
+`read_acl_data` gives the ACL as it is stored: access levels by name, each
+a `[start_hour, end_hour]` pair of strings, and cards by rfid, each naming
+its access level.  Deciding a scan from that means finding the card, then
+its level, then parsing the level's hours, every time.
+
+`AccessList` does that work once, when the ACL is loaded.  Each access level
+becomes a 24 bit mask with bit `h` set if the hour `h` is allowed, and each
+card points to the mask of its level, so a decision is a dict probe and a
+bit test:
+
+    acl = AccessList(data['hours'], data['rfids'])
+    acl.allowed(rfid, datetime.now().hour)
+
+`end_hour` is the first hour a card should not have access, so `[11, 22]`
+allows 11:00 to 21:59 and `[0, 24]` allows all day.
+
+A reload needn't compile the whole ACL again.  `diff` finds the entries
+which changed, and `AccessList.update` applies just those:
+
+    hours, rfids = acl.changes(data['hours'], data['rfids'])
+    acl.update(hours, rfids)
+"""
+
+ALL_HOURS = (1 << 24) - 1
+
+
+def hour_mask(start_hour, end_hour):
+    """ The mask of the hours from `start_hour` up to but not including
+    `end_hour`, raising a ValueError if they aren't hours.
+    """
+    start_hour, end_hour = int(start_hour), int(end_hour)
+    if not 0 <= start_hour <= 24 or not 0 <= end_hour <= 24:
+        raise ValueError(f"Hours out of range: {start_hour}, {end_hour}")
+    return ALL_HOURS & ~((1 << start_hour) - 1) & ((1 << end_hour) - 1)
+
+
+def diff(old, new):
+    """ The entries of `new` which aren't the same in `old`, by key, and
+    None for each key of `old` no longer in `new`.
+    """
+    changes = {key: value for key, value in new.items()
+               if old.get(key) != value}
+    changes.update(dict.fromkeys(old.keys() - new.keys()))
+    return changes
+
+
+class AccessList:
+    """ The ACL data `hours` and `rfids`, compiled into `masks`, the hours
+    each card may open the door, by rfid.
+
+    Cards whose access level is missing or malformed are never allowed in,
+    and are listed in `invalid` with the reason.  `cards` indexes the rfids
+    by access level, so `update` can find the cards of a level without
+    scanning them all.  `version` counts the updates made.
+    """
+    def __init__(self, hours, rfids):
+        self.hours = dict(hours)
+        self.rfids = dict(rfids)
+        self.invalid = {}
+        self.levels = {}
+        self.masks = {}
+        self.cards = {}
+        self.card_levels = {}
+        self.version = 0
+        for level, allowed_hours in self.hours.items():
+            self.set_level(level, allowed_hours)
+        for rfid, rules in self.rfids.items():
+            self.set_card(rfid, rules)
+
+    def set_level(self, level, allowed_hours):
+        self.invalid.pop(level, None)
+        try:
+            start_hour, end_hour = allowed_hours
+            self.levels[level] = hour_mask(start_hour, end_hour)
+        except (TypeError, ValueError) as e:
+            self.levels[level] = 0
+            self.invalid[level] = f"Bad hours for {level}: {e}"
+
+    def set_card(self, rfid, rules):
+        self.remove_card(rfid)
+        level = rules.get('access_times')
+        if level not in self.levels:
+            self.invalid[rfid] = f"Unknown access level {level}"
+        self.masks[rfid] = self.levels.get(level, 0)
+        self.card_levels[rfid] = level
+        self.cards.setdefault(level, set()).add(rfid)
+
+    def remove_card(self, rfid):
+        self.masks.pop(rfid, None)
+        self.invalid.pop(rfid, None)
+        level = self.card_levels.pop(rfid, None)
+        cards = self.cards.get(level)
+        if cards is not None:
+            cards.discard(rfid)
+            if not cards:
+                del self.cards[level]
+
+    def changes(self, hours, rfids):
+        """ The changes from this ACL to the data `hours` and `rfids`, as
+        the `diff` of each, for `update`.
+        """
+        return diff(self.hours, hours), diff(self.rfids, rfids)
+
+    def update(self, hours, rfids):
+        """ Applies the changes `hours` and `rfids`, see `changes`, in
+        place, returning the keys added, removed and changed of each as
+        `{"hours": {"added": [...], ...}, "rfids": {...}}`.
+
+        This costs as much as the cards changed, plus the cards of any
+        access level whose hours changed, found through `cards`, however
+        large the ACL is.
+        """
+        delta = {"hours": self.apply(self.hours, hours),
+                 "rfids": self.apply(self.rfids, rfids)}
+        for level, allowed_hours in hours.items():
+            if allowed_hours is None:
+                self.levels.pop(level, None)
+                self.invalid.pop(level, None)
+            else:
+                self.set_level(level, allowed_hours)
+        for level in hours:
+            for rfid in list(self.cards.get(level, ())):
+                if rfid not in rfids:
+                    self.set_card(rfid, self.rfids[rfid])
+        for rfid, rules in rfids.items():
+            if rules is None:
+                self.remove_card(rfid)
+            else:
+                self.set_card(rfid, rules)
+        self.version += 1
+        return delta
+
+    @staticmethod
+    def apply(data, changes):
+        delta = {"added": [], "removed": [], "changed": []}
+        for key, value in changes.items():
+            if value is None:
+                data.pop(key, None)
+                delta["removed"].append(key)
+            else:
+                delta["changed" if key in data else "added"].append(key)
+                data[key] = value
+        return delta
+
+    def __contains__(self, rfid):
+        return rfid in self.masks
+
+    def __len__(self):
+        return len(self.masks)
+
+    def allowed(self, rfid, hour):
+        """ True if the card `rfid` may open the door during `hour` """
+        return bool(self.masks.get(rfid, 0) >> hour & 1)
@@ -0,0 +1,67 @@
+""" Listening sockets passed in by systemd socket activation.
+
+With a `.socket` unit, systemd creates a service's sockets itself and hands
+them over when it starts the service, as file descriptors from 3 on, see
+`sd_listen_fds(3)`.  systemd keeps the sockets open while the service
+restarts, so connections made in the meantime wait in the kernel's backlog
+rather than failing with `FileNotFoundError` or `ConnectionRefusedError`.
+
+`Comms` looks here for each socket it listens on, see `take_socket`, and
+only creates one itself if systemd didn't pass it in.  A unit lists the
+sockets of its service by path, e.g.
+
+    [Socket]
+    ListenStream=/run/queeriouslabs/authorizer.sock
+    ListenStream=/run/queeriouslabs/authorizer.stats.sock
+
+and is matched to the socket by the address it is bound to, so one process
+running several components, see `services/embedded.py`, can be passed all
+of their sockets.
+"""
+import os
+import socket
+
+
+SD_LISTEN_FDS_START = 3
+
+INHERITED = None  #: sockets passed in, by address, once read
+
+
+def listen_fds(environ=None):
+    """ The sockets passed to this process, keyed by `socket_address`.
+
+    The variables systemd sets are removed from `environ`, by default
+    `os.environ`, so child processes don't take them for their own.
+    """
+    environ = os.environ if environ is None else environ
+    pid = environ.pop('LISTEN_PID', None)
+    count = environ.pop('LISTEN_FDS', None)
+    environ.pop('LISTEN_FDNAMES', None)
+    if not pid or not count or int(pid) != os.getpid():
+        return {}
+
+    sockets = {}
+    for fd in range(SD_LISTEN_FDS_START, SD_LISTEN_FDS_START + int(count)):
+        sock = socket.socket(fileno=fd)
+        sock.set_inheritable(False)
+        sockets[socket_address(sock.getsockname())] = sock
+    return sockets
+
+
+def socket_address(address):
+    """ Normalizes a unix socket path or a TCP `(host, port)` so sockets
+    can be matched to the addresses they are bound to.
+    """
+    if isinstance(address, str):
+        return os.path.abspath(address)
+    return tuple(address[:2])
+
+
+def take_socket(address):
+    """ Removes and returns the socket passed in for `address`, a unix
+    socket path or a TCP `(host, port)`, or None if there isn't one.
+    """
+    global INHERITED
+    if INHERITED is None:
+        INHERITED = listen_fds()
+    return INHERITED.pop(socket_address(address), None)
@@ -11,16 +11,1241 @@ calls.
 Abstracting out the commuication allows easy replacement as needed.
 """
 import asyncio
+import atexit
+import copy
 import datetime
+import itertools
 import json
-from json import JSONDecodeError
 import logging
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    TimedRotatingFileHandler,
+)
 import os
+import queue
+import random
 from signal import (
     SIGTERM,
     SIGINT,
 )
+import ssl
+import struct
+import time
+
+from secbot import schema
+from secbot.activation import (
+    socket_address,
+    take_socket,
+)
+from secbot.eventloop import event_loop_name
+from secbot import inotify
+from secbot.metrics import (
+    BATCH_BUCKETS,
+    MeteredQueue,
+    Metrics,
+    message_type,
+)
+from secbot.tracing import Tracer
+from secbot.validation import ValidationError
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+FRAMING_TIMEOUT = 1  #: seconds a client waits for a server to accept framing
+DRAIN_INTERVAL = 0.01  #: seconds between checks of in_q when shutting down
+PROTOCOL_VERSION = 1  #: announced to the registry, see `Registry`
+MAX_FRAME_SIZE = 2 ** 16  #: bytes, the longest frame a server accepts
+
+
+def topic_matches(pattern, topic):
+    """ A pattern ending in `*` matches every topic it prefixes, e.g.
+    `/front_door/*` matches `/front_door/open`.  Other patterns only match
+    the same topic.
+    """
+    if pattern.endswith('*'):
+        return topic.startswith(pattern[:-1])
+    return topic == pattern
+
+
+#: Validators of each message type, see `Comms.check`
+VALIDATORS = {
+    "request": schema.validate_request,
+    "response": schema.validate_response,
+    "event": schema.validate_event,
+}
+
+
+class RequestTimeout(asyncio.TimeoutError):
+    """ A request was not answered within its deadline.  The request was
+    abandoned, and a late response to it will be dropped.
+    """
+
+
+class FrameTooLarge(ValueError):
+    """ A frame is longer than the receiver accepts, see `MAX_FRAME_SIZE`.
+    Raised as soon as that is known, without waiting for the whole frame.
+    """
+
+
+class RequestNotSent(ConnectionError):
+    """ The connection was found closed before the request was written, so
+    the request can always be sent again on a new connection.
+    """
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """ A client SSLContext which offers the session of the previous
+    connection to a host when connecting to it again, so a reconnect can
+    skip the full handshake while the server still holds the session.
+
+    asyncio has no way to pass a session in, so the context remembers the
+    last SSLObject it made for each host and reuses its session.
+    """
+    def wrap_bio(self, incoming, outgoing, server_side=False,
+                 server_hostname=None, session=None):
+        ssl_objects = self.__dict__.setdefault('ssl_objects', {})
+        last = ssl_objects.get(server_hostname)
+        if session is None and last is not None:
+            session = last.session
+        ssl_object = super().wrap_bio(
+            incoming, outgoing, server_side=server_side,
+            server_hostname=server_hostname, session=session)
+        ssl_objects[server_hostname] = ssl_object
+        return ssl_object
+
+
+def create_ssl_contexts(cert, key, ca=None, check_hostname=True):
+    """ Creates the (server, client) SSLContexts for TCP connections.
+
+    Both sides present `cert` and, when `ca` is given, require the peer to
+    present a certificate signed by it, so only our own devices can talk to
+    each other.
+    """
+    server_ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_ctx.load_cert_chain(cert, key)
+
+    client_ctx = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    client_ctx.load_cert_chain(cert, key)
+    client_ctx.check_hostname = check_hostname
+
+    if ca:
+        server_ctx.load_verify_locations(ca)
+        server_ctx.verify_mode = ssl.CERT_REQUIRED
+        client_ctx.load_verify_locations(ca)
+    else:
+        client_ctx.load_default_certs()
+
+    return server_ctx, client_ctx
+
+
+class StdlibJsonCodec:
+    """ A JSON codec encodes a message to `bytes` and decodes one from
+    `bytes` or a `memoryview`, raising a ValueError on bad data.
+
+    This one uses the standard library and is always available.
+    """
+    name = "json"
+
+    def dumps(self, msg):
+        return json.dumps(msg).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(bytes(data))
+
+
+class OrjsonCodec:
+    """ orjson works directly with `bytes` and `memoryview` """
+    name = "orjson"
+
+    def dumps(self, msg):
+        return orjson.dumps(msg)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class UjsonCodec:
+    """ ujson decodes from `bytes` but encodes to a `str`, and can't read a
+    `memoryview` """
+    name = "ujson"
+
+    def dumps(self, msg):
+        return ujson.dumps(
+            msg, ensure_ascii=False, escape_forward_slashes=False
+        ).encode('utf-8')
+
+    def loads(self, data):
+        return ujson.loads(bytes(data))
+
+
+JSON_CODECS = {StdlibJsonCodec.name: StdlibJsonCodec()}
+if ujson:
+    JSON_CODECS[UjsonCodec.name] = UjsonCodec()
+if orjson:
+    JSON_CODECS[OrjsonCodec.name] = OrjsonCodec()
+
+
+def best_json_codec():
+    """ The fastest JSON codec installed """
+    for name in (OrjsonCodec.name, UjsonCodec.name, StdlibJsonCodec.name):
+        if name in JSON_CODECS:
+            return JSON_CODECS[name]
+
+
+class JsonFraming:
+    """ Newline delimited, 'utf-8' encoded JSON.  This is the default
+    framing and is what every connection starts with.
+
+    Messages are encoded by `codec`, the fastest installed by default, see
+    `set_json_codec`.
+    """
+    name = "json"
+
+    def __init__(self, codec):
+        self.codec = codec
+
+    def encode(self, msg):
+        return self.codec.dumps(msg) + b'\n'
+
+    def decode(self, frame):
+        return self.codec.loads(frame)
+
+    async def read(self, reader, limit=MAX_FRAME_SIZE):
+        """ Returns the next frame, or b'' at EOF.  Raises `FrameTooLarge`
+        for a frame over `limit` bytes, or over the reader's own limit.
+        """
+        try:
+            frame = await reader.readline()
+        except ValueError as e:
+            raise FrameTooLarge(f"{e}") from None
+        if len(frame) > limit + 1:
+            raise FrameTooLarge(f"Frame of {len(frame)} bytes")
+        return frame
+
+    def split(self, buffer, start, end, limit=MAX_FRAME_SIZE):
+        """ Finds the next whole frame in `buffer[start:end]`, returning the
+        (start, end) of its body and where the frame after it starts, or
+        `None` if it's not all there yet.  Raises `FrameTooLarge` once the
+        frame is known to be over `limit` bytes.
+        """
+        newline = buffer.find(b'\n', start, min(end, start + limit + 1))
+        if newline < 0:
+            if end - start > limit:
+                raise FrameTooLarge(f"No newline in {end - start} bytes")
+            return None
+        return start, newline, newline + 1
+
+
+class MsgpackFraming:
+    """ A 4 byte, big-endian length header followed by a msgpack body.
+
+    Avoids scanning for the line ending and the intermediate `str` of the
+    JSON framing.  Only available when msgpack is installed.
+    """
+    name = "msgpack"
+    header = struct.Struct("!I")
+
+    def encode(self, msg):
+        body = msgpack.packb(msg)
+        return self.header.pack(len(body)) + body
+
+    def decode(self, frame):
+        return msgpack.unpackb(frame)
+
+    async def read(self, reader, limit=MAX_FRAME_SIZE):
+        """ See `JsonFraming.read` """
+        try:
+            header = await reader.readexactly(self.header.size)
+            size = self.header.unpack(header)[0]
+            if size > limit:
+                raise FrameTooLarge(f"Frame of {size} bytes")
+            return await reader.readexactly(size)
+        except asyncio.IncompleteReadError:
+            return b''
+
+    def split(self, buffer, start, end, limit=MAX_FRAME_SIZE):
+        """ See `JsonFraming.split` """
+        if end - start < self.header.size:
+            return None
+        body = start + self.header.size
+        size = self.header.unpack_from(buffer, start)[0]
+        if size > limit:
+            raise FrameTooLarge(f"Frame of {size} bytes")
+        stop = body + size
+        if stop > end:
+            return None
+        return body, stop, stop
+
+
+FRAMINGS = {JsonFraming.name: JsonFraming(best_json_codec())}
+if msgpack:
+    FRAMINGS[MsgpackFraming.name] = MsgpackFraming()
+
+
+def json_codec():
+    """ The JSON codec in use by this process """
+    return FRAMINGS[JsonFraming.name].codec
+
+
+def set_json_codec(name):
+    """ Selects the JSON codec used by this process by name, one of
+    `JSON_CODECS`.  All codecs produce JSON any other can read.
+    """
+    if name not in JSON_CODECS:
+        raise ValueError(f"JSON codec {name} is not installed")
+    FRAMINGS[JsonFraming.name].codec = JSON_CODECS[name]
+
+
+async def negotiate_framing(reader, writer, name):
+    """ Client side of the framing negotiation.
+
+    The first frame on a connection is always JSON.  A client which wants
+    another framing sends `{"framing": <name>}` as that first frame, and the
+    server answers with the framing it accepted.  Servers which predate
+    negotiation never answer, in which case the connection stays JSON.
+    """
+    json_framing = FRAMINGS[JsonFraming.name]
+    if name == json_framing.name or name not in FRAMINGS:
+        return json_framing
+
+    writer.write(json_framing.encode({"framing": name}))
+    await writer.drain()
+    try:
+        ack = await asyncio.wait_for(reader.readline(), FRAMING_TIMEOUT)
+        ack = json_framing.decode(ack)
+    except (asyncio.TimeoutError, ValueError):
+        return json_framing
+    return FRAMINGS.get(ack.get('framing'), json_framing)
+
+
+class Client:
+    """ A client connected to this component's server, along with the
+    framing negotiated for its connection.
+
+    Messages for the client are put on its own bounded queue and written by
+    its own writer task, so a slow or stuck client only delays itself.
+    When the queue is full the `overflow` policy applies:
+
+        "block": wait for room in the queue
+        "drop_oldest": drop the oldest queued message to make room
+        "disconnect": close the connection to the client
+
+    Each overflow is counted in `overflows` and, per policy, in the
+    `counters` dict shared by all clients of a server.
+
+    Messages queued by the time the writer task runs, or within
+    `flush_delay` seconds of the first, are written together with one
+    `writelines` and one `drain`.  The batch sizes are recorded in `metrics`
+    under `write_batch/<name>`.
+
+    A queue which fills up while the connection is keeping up, e.g. with a
+    burst of responses to a pipelining client, is written out straight away
+    rather than overflowing.  The overflow policy is for clients which have
+    stopped reading.
+
+    Once the client is `closed`, messages for it are dropped, and senders
+    blocked on its full queue are let go rather than waiting for a writer
+    task which is gone.
+    """
+    OVERFLOW_POLICIES = ("block", "drop_oldest", "disconnect")
+
+    def __init__(self, name, reader, writer, framing, maxsize=64,
+                 overflow="drop_oldest", counters=None, metrics=None,
+                 flush_delay=0):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.name = name
+        self.reader = reader
+        self.writer = writer
+        self.framing = framing
+        self.overflow = overflow
+        self.overflows = 0
+        self.counters = counters if counters is not None else {}
+        self.metrics = metrics
+        self.flush_delay = flush_delay
+        self.closed = False
+        self.pending = []
+        self.queue = asyncio.Queue(maxsize)
+        self.task = asyncio.create_task(self.write_messages())
+
+    def writable(self):
+        """ True while the transport's write buffer is below its high water
+        mark, i.e. the client is reading what is sent.
+        """
+        transport = self.writer.transport
+        return (transport.get_write_buffer_size()
+                < transport.get_write_buffer_limits()[1])
+
+    def overflowed(self):
+        """ Counts an overflow and applies the policy to the full queue """
+        self.overflows += 1
+        self.counters[self.overflow] = self.counters.get(self.overflow, 0) + 1
+        if self.overflow == "drop_oldest":
+            self.queue.get_nowait()
+        elif self.overflow == "disconnect":
+            self.abort()
+
+    async def send(self, msg):
+        """ Queues `msg` for the writer task, applying the overflow policy
+        when the queue is full.
+        """
+        if self.closed:
+            return
+        if self.queue.full() and self.writable():
+            self.write_queued()
+        if self.queue.full():
+            self.overflowed()
+            if self.overflow == "disconnect":
+                return
+        await self.queue.put(msg)
+        if self.closed:
+            # closed while blocked, so let the next blocked sender go too
+            self.discard_queued()
+
+    def send_nowait(self, msg):
+        """ Queues `msg` without waiting.  Under the "block" policy a full
+        queue drops `msg`, as there is no waiting for room.
+        """
+        if self.closed:
+            return
+        if self.queue.full() and self.writable():
+            self.write_queued()
+        if self.queue.full():
+            self.overflowed()
+            if self.overflow != "drop_oldest":
+                return
+        self.queue.put_nowait(msg)
+
+    async def write_messages(self):
+        """ Writes queued messages to the client until it goes away """
+        try:
+            while True:
+                msg = await self.queue.get()
+                self.pending.append(msg)
+                if self.flush_delay:
+                    await asyncio.sleep(self.flush_delay)
+                self.write_queued()
+                await self.writer.drain()
+        except ConnectionError:
+            self.writer.close()
+
+    def write_queued(self):
+        """ Writes every queued message in one go, in order """
+        msgs, self.pending = self.pending, []
+        while not self.queue.empty():
+            msgs.append(self.queue.get_nowait())
+        if not msgs:
+            return
+        self.writer.writelines([self.framing.encode(msg) for msg in msgs])
+        if self.metrics:
+            self.metrics.observe(f"write_batch/{self.name}", len(msgs),
+                                 BATCH_BUCKETS)
+
+    def discard_queued(self):
+        """ Empties the queue, waking the senders blocked on it """
+        self.pending = []
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    def abort(self):
+        self.closed = True
+        self.task.cancel()
+        self.writer.close()
+        self.discard_queued()
+
+    async def close(self):
+        self.abort()
+        await self.writer.wait_closed()
+
+    async def finish(self):
+        """ Writes out whatever is still queued, then closes the connection
+        """
+        self.task.cancel()
+        try:
+            self.write_queued()
+            await self.writer.drain()
+            await self.close()
+        except ConnectionError:
+            pass
+
+
+class ServerSession:
+    """ The server's side of one client connection: the framing in use, the
+    source_ids the connection carries and the `Client` replies to them go
+    through.  Used by both receive paths, see `Comms.set_callback` and
+    `FrameProtocol`.
+    """
+    def __init__(self, comms, reader, writer):
+        self.comms = comms
+        self.reader = reader
+        self.writer = writer
+        self.framing = FRAMINGS[JsonFraming.name]
+        self.first = True
+        self.client = None
+        self.src_id = None
+        self.src_ids = set()
+
+    def decode(self, frame):
+        """ Decodes `frame` with the connection's framing, raising a
+        ValueError unless it's a message, i.e. an object.
+        """
+        req = self.framing.decode(frame)
+        if not isinstance(req, dict):
+            raise ValueError(f"Not a message: {type(req).__name__}")
+        return req
+
+    def negotiate(self, req):
+        """ If `req` is a framing request in the first frame, switches to
+        that framing and returns the answer to send back, see
+        `negotiate_framing`.  Returns `None` for any other message.
+        """
+        first, self.first = self.first, False
+        if not (first and 'framing' in req):
+            return None
+        self.framing = FRAMINGS.get(req['framing'], self.framing)
+        json_framing = FRAMINGS[JsonFraming.name]
+        return json_framing.encode({"framing": self.framing.name})
+
+    async def handle(self, req):
+        """ Registers the sender of `req` as a client, then hands `req` to
+        `Comms.receive`.  Messages without a `source_id` are dropped.
+        """
+        comms = self.comms
+        if not (src_id := req.get('source_id')):
+            return
+        self.src_id = src_id
+
+        # A connection usually carries one source_id, but a bridge carries
+        # all those of the components behind it.
+        if src_id not in self.src_ids:
+            self.src_ids.add(src_id)
+            known = comms.clients.get(src_id)
+            if known and known.writer is not self.writer:
+                comms.logger.error(f"Duplicate connection from {src_id}")
+                comms.metrics.incr("connections/duplicate")
+                comms.clients.pop(src_id)
+                try:
+                    await known.close()
+                except Exception as e:
+                    comms.logger.error(f"{e}")
+            if self.client is None:
+                self.client = Client(
+                    src_id, self.reader, self.writer, self.framing,
+                    comms.client_queue_size, comms.overflow,
+                    comms.overflows, comms.metrics,
+                    comms.flush_delays.get(src_id, comms.flush_delay))
+            comms.clients[src_id] = self.client
+
+        await comms.receive(self.client, req)
+
+    def close(self):
+        """ Forgets the clients of a connection which has closed """
+        comms = self.comms
+        comms.logger.warning(f"Done with {self.src_id}")
+        for src_id in self.src_ids:
+            if comms.clients.get(src_id) is self.client:
+                comms.clients.pop(src_id)
+        if self.client:
+            comms.drop_subscriber(self.client)
+            self.client.abort()
+        comms.metrics.incr("connections/closed")
+
+
+class ProtocolWriter:
+    """ The parts of asyncio.StreamWriter a `Client` needs, for a
+    `FrameProtocol` connection.
+    """
+    def __init__(self, transport, protocol):
+        self.transport = transport
+        self.protocol = protocol
+
+    def write(self, data):
+        self.transport.write(data)
+
+    def writelines(self, data):
+        self.transport.writelines(data)
+
+    async def drain(self):
+        if self.protocol.drain_waiter is not None:
+            # shared by every writer waiting, so one being cancelled mustn't
+            # cancel it for the others
+            await asyncio.shield(self.protocol.drain_waiter)
+        if self.transport.is_closing():
+            raise ConnectionResetError("Connection lost")
+
+    def is_closing(self):
+        return self.transport.is_closing()
+
+    def close(self):
+        self.transport.close()
+
+    async def wait_closed(self):
+        await self.protocol.closed
+
+    def get_extra_info(self, name, default=None):
+        return self.transport.get_extra_info(name, default)
+
+
+class FrameProtocol(asyncio.BufferedProtocol):
+    """ A receive path for servers which reads straight into one reused
+    buffer rather than through a StreamReader.
+
+    Every whole frame in the buffer after a read is decoded from a
+    memoryview of it, without copying it out first, and the messages are
+    handed over as one batch to a task which passes them on to
+    `ServerSession.handle`.  A burst of messages costs one wake up of that
+    task, not one per message.
+
+    A partial frame is moved to the front of the buffer, which grows when a
+    frame won't fit.  A frame over the `max_frame_size` of `comms` closes
+    the connection, so the buffer never grows much beyond that.  Reading
+    pauses while more than `max_batch` messages wait to be handled.
+
+    Enabled with `BUFFERED_RECEIVE` in the config.  Clients see no
+    difference from the StreamReader path of `Comms.set_callback`.
+    """
+    min_read = 4096  #: bytes free in the buffer for each read
+    max_batch = 1024
+
+    def __init__(self, comms, size=65536):
+        self.comms = comms
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+        self.batch = []
+        self.ready = asyncio.Event()
+        self.paused = False
+        self.drain_waiter = None
+        self.closed = asyncio.get_running_loop().create_future()
+        self.transport = None
+        self.session = None
+        self.task = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.session = ServerSession(
+            self.comms, None, ProtocolWriter(transport, self))
+        self.comms.metrics.incr("connections/accepted")
+        self.task = asyncio.create_task(self.handle_batches())
+
+    def get_buffer(self, sizehint):
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif len(self.buffer) - self.end < self.min_read:
+            size = self.end - self.start
+            if size + self.min_read > len(self.buffer):
+                buffer = bytearray(2 * len(self.buffer))
+                buffer[:size] = self.view[self.start:self.end]
+                self.view.release()
+                self.buffer = buffer
+                self.view = memoryview(buffer)
+            else:
+                self.buffer[:size] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, size
+        return self.view[self.end:]
+
+    def buffer_updated(self, nbytes):
+        self.end += nbytes
+        framing = self.session.framing
+        limit = self.comms.max_frame_size
+        while True:
+            try:
+                frame = framing.split(self.buffer, self.start, self.end, limit)
+                if frame is None:
+                    break
+                body, stop, self.start = frame
+                with self.view[body:stop] as data:
+                    req = self.session.decode(data)
+            except ValueError as e:
+                self.comms.logger.error(f"Bad frame, disconnecting: {e}")
+                self.comms.metrics.incr("connections/bad_frame")
+                self.transport.close()
+                return
+            if (ack := self.session.negotiate(req)) is not None:
+                self.transport.write(ack)
+                framing = self.session.framing
+                continue
+            self.batch.append(req)
+
+        if self.batch:
+            self.ready.set()
+            if len(self.batch) > self.max_batch and not self.paused:
+                self.paused = True
+                self.transport.pause_reading()
+
+    async def handle_batches(self):
+        """ Hands each batch of messages to the session, and cleans up once
+        the connection is lost and the last batch is handled.
+        """
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                batch, self.batch = self.batch, []
+                if self.paused:
+                    self.paused = False
+                    self.transport.resume_reading()
+                for req in batch:
+                    if req is None:
+                        return
+                    await self.session.handle(req)
+        finally:
+            self.session.close()
+            self.transport.close()
+
+    def connection_lost(self, exc):
+        self.batch.append(None)
+        self.ready.set()
+        if not self.closed.done():
+            self.closed.set_result(None)
+        self.resume_writing()
+
+    def pause_writing(self):
+        self.drain_waiter = asyncio.get_running_loop().create_future()
+
+    def resume_writing(self):
+        waiter, self.drain_waiter = self.drain_waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+
+class Connection:
+    """ A client connection to a server component.
+
+    Every request which expects a response is tagged with a `request_id`
+    which is unique to this connection.  Servers build responses as copies
+    of the request, so the `request_id` comes back with the response.
+
+    One reader task per connection reads all responses and resolves the
+    future of the caller waiting on that `request_id`.  Any number of
+    requests may be in flight at once without waiting on each other's round
+    trip.
+
+    A response without a `request_id` is handed to the oldest outstanding
+    request, which matches the behavior of servers that do not echo it.
+
+    `framing` is the framing negotiated for the connection, see
+    `negotiate_framing`.
+
+    Events published by the server, see `Comms.publish`, are handed to
+    `on_event`.
+
+    `last_seen` is the `time.monotonic()` time the server was last heard
+    from, see `Comms.watch`.
+
+    Requests made in the same loop iteration, or within `flush_delay`
+    seconds of the first, are written together with one `writelines`, see
+    `send`.  The batch sizes are recorded in `metrics` under
+    `write_batch/<name>`.
+    """
+    def __init__(self, name, reader, writer, logger, framing=None,
+                 on_event=None, metrics=None, flush_delay=0):
+        self.name = name
+        self.reader = reader
+        self.writer = writer
+        self.logger = logger
+        self.framing = framing or FRAMINGS[JsonFraming.name]
+        self.on_event = on_event
+        self.metrics = metrics
+        self.flush_delay = flush_delay
+        self.outbox = []
+        self.flushed = None
+        self.last_seen = time.monotonic()
+        self.pending = {}
+        self.request_ids = itertools.count(1)
+        self.task = asyncio.create_task(self.read_responses())
+
+    @property
+    def closed(self):
+        return self.task.done() or self.writer.is_closing()
+
+    async def request(self, req, resp=True):
+        """ Writes the request and, if `resp`, waits for the matching
+        response.  Returns `{}` when no response is expected.
+
+        Raises `RequestNotSent` if the connection is already closed, and
+        `ConnectionResetError` if it closes before the response arrives.
+        """
+        if self.closed:
+            raise RequestNotSent(f"Connection to {self.name} closed")
+
+        if not resp:
+            await asyncio.shield(self.send(self.framing.encode(req)))
+            await self.writer.drain()
+            return {}
+
+        request_id = next(self.request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            msg = self.framing.encode(dict(req, request_id=request_id))
+            await asyncio.shield(self.send(msg))
+            await self.writer.drain()
+            self.logger.debug("Waiting on response from %s", self.name)
+            return await future
+        finally:
+            self.pending.pop(request_id, None)
+
+    def send(self, frame):
+        """ Queues `frame` to be written along with the others sent before
+        the flush, returning a future which is done once they are written.
+        """
+        self.outbox.append(frame)
+        if self.flushed is None:
+            loop = asyncio.get_running_loop()
+            self.flushed = loop.create_future()
+            self.flushed.add_done_callback(
+                lambda f: f.cancelled() or f.exception())
+            if self.flush_delay:
+                loop.call_later(self.flush_delay, self.flush)
+            else:
+                loop.call_soon(self.flush)
+        return self.flushed
+
+    def flush(self):
+        """ Writes the queued frames in one go.  If the connection closed
+        since they were queued they were never sent, see `RequestNotSent`.
+        """
+        frames, self.outbox = self.outbox, []
+        flushed, self.flushed = self.flushed, None
+        if self.closed:
+            flushed.set_exception(
+                RequestNotSent(f"Connection to {self.name} closed"))
+            return
+        self.writer.writelines(frames)
+        if self.metrics:
+            self.metrics.observe(f"write_batch/{self.name}", len(frames),
+                                 BATCH_BUCKETS)
+        flushed.set_result(None)
+
+    async def read_responses(self):
+        """ Reads responses until the server closes the connection, handing
+        each to the future waiting on it.  Outstanding requests fail with
+        `ConnectionResetError` when the connection closes.
+        """
+        try:
+            while True:
+                data = await self.framing.read(self.reader)
+                if data == b'':
+                    self.logger.warning(f"{self.name} closed the connection")
+                    break
+                try:
+                    data = self.framing.decode(data)
+                except ValueError as e:
+                    self.logger.error(f"{e}")
+                    continue
+                self.deliver(data)
+        finally:
+            self.fail_pending()
+
+    def deliver(self, data):
+        """ Hands a message from the server to the request waiting on it, or
+        to `on_event` if it's an event.  Heartbeats only count as hearing
+        from the server.
+        """
+        self.last_seen = time.monotonic()
+        if 'heartbeat' in data:
+            return
+        if 'event' in data and 'request_id' not in data:
+            if self.on_event:
+                self.on_event(data)
+            return
+
+        request_id = data.pop('request_id', None)
+        if request_id is None:
+            waiting = [f for f in self.pending.values() if not f.done()]
+            future = waiting[0] if waiting else None
+        else:
+            future = self.pending.get(request_id)
+
+        if future is None or future.done():
+            self.logger.warning(
+                f"Dropping late or unexpected response from {self.name}")
+            return
+        future.set_result(data)
+
+    def fail_pending(self):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionResetError(
+                    f"{self.name} closed before responding"))
+
+    def abort(self):
+        """ Closes the connection without waiting """
+        self.task.cancel()
+        self.writer.close()
+
+    async def close(self):
+        """ Closes the connection and waits for it to finish closing """
+        self.abort()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def finish(self):
+        """ Writes out requests still waiting to be flushed, then closes the
+        connection
+        """
+        if self.outbox:
+            self.flush()
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+        await self.close()
+
+
+class MemoryHub:
+    """ An in-memory transport between the Comms instances of one process.
+
+    Comms configured with the same hub (`MEMORY_HUB` in the config) reach
+    each other through it rather than their sockets, see `MemoryConnection`.
+    They still listen on their sockets for other processes.
+    """
+    def __init__(self):
+        self.members = {}
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def get(self, name):
+        return self.members.get(name)
+
+    def register(self, comms):
+        self.members[comms.address] = comms
+
+    def unregister(self, comms):
+        if self.members.get(comms.address) is comms:
+            self.members.pop(comms.address)
+
+
+class MemoryClient:
+    """ The server's side of a `MemoryConnection`, which hands messages
+    straight back to the connection.
+    """
+    writer = None
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.name = connection.name
+
+    async def send(self, msg):
+        self.connection.deliver(msg)
+
+    def send_nowait(self, msg):
+        self.connection.deliver(msg)
+
+    def abort(self):
+        self.connection.abort()
+
+    async def close(self):
+        self.abort()
+
+    async def finish(self):
+        self.abort()
+
+
+class MemoryConnection(Connection):
+    """ A connection to a server in this process, through a `MemoryHub`.
+
+    Requests are put straight onto the server's in_q and responses handed
+    straight back, as the message objects themselves with no encoding.
+    Messages are not copied beyond the top level `dict`, so neither side
+    may change a message after sending it.
+    """
+    def __init__(self, name, server, logger, on_event=None):
+        self.name = name
+        self.server = server
+        self.logger = logger
+        self.framing = None
+        self.on_event = on_event
+        self.last_seen = time.monotonic()
+        self.pending = {}
+        self.request_ids = itertools.count(1)
+        self.client = MemoryClient(self)
+        self.open = True
+
+    @property
+    def closed(self):
+        if not self.open:
+            return True
+        return self.server.hub.get(self.name) is not self.server
+
+    async def request(self, req, resp=True):
+        if self.closed:
+            raise RequestNotSent(f"Connection to {self.name} closed")
+
+        src_id = req.get('source_id')
+        if src_id and self.server.clients.get(src_id) is not self.client:
+            self.server.clients[src_id] = self.client
+
+        if not resp:
+            await self.server.receive(self.client, req)
+            return {}
+
+        request_id = next(self.request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            await self.server.receive(
+                self.client, dict(req, request_id=request_id))
+            return await future
+        finally:
+            self.pending.pop(request_id, None)
+
+    def abort(self):
+        if not self.open:
+            return
+        self.open = False
+        for src_id, client in list(self.server.clients.items()):
+            if client is self.client:
+                self.server.clients.pop(src_id)
+        self.server.drop_subscriber(self.client)
+        self.fail_pending()
+
+    async def close(self):
+        self.abort()
+
+    async def finish(self):
+        self.abort()
+
+
+class ConnectionPool:
+    """ Keeps one healthy `Connection` per server.
+
+    A connection is healthy while its reader task runs and its transport is
+    open.  When a server restarts, its old connection sees EOF and is
+    replaced the next time it is asked for.
+
+    Opening a connection is retried `attempts` times with exponential
+    backoff, starting at `delay` seconds and capped at `max_delay`, each
+    wait jittered so restarted peers are not hit by every client at once.
+    """
+    def __init__(self, opener, logger, attempts=5, delay=0.05, max_delay=1.0):
+        self.opener = opener
+        self.logger = logger
+        self.attempts = attempts
+        self.delay = delay
+        self.max_delay = max_delay
+        self.connections = {}
+        self.locks = {}
+
+    async def get(self, addr):
+        """ Returns a healthy connection to `addr`, opening a new one if the
+        cached connection is missing or closed.  Concurrent callers share
+        the one connection.
+        """
+        conn = self.connections.get(addr)
+        if conn and not conn.closed:
+            return conn
+
+        async with self.locks.setdefault(addr, asyncio.Lock()):
+            conn = self.connections.get(addr)
+            if conn and not conn.closed:
+                return conn
+            if conn:
+                self.logger.warning(f"Lost connection to {addr}, reconnecting")
+                self.discard(addr, conn)
+            conn = await self.open(addr)
+            self.connections[addr] = conn
+            return conn
+
+    async def open(self, addr):
+        """ Opens a connection to `addr`, backing off between failures and
+        raising the last error once out of attempts.
+        """
+        for attempt in range(self.attempts):
+            try:
+                return await self.opener(addr)
+            except OSError as e:
+                if attempt + 1 >= self.attempts:
+                    raise
+                delay = min(self.max_delay, self.delay * 2 ** attempt)
+                delay = random.uniform(delay / 2, delay)
+                self.logger.warning(
+                    f"Connecting to {addr} failed ({e}), "
+                    f"retry in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    def discard(self, addr, conn=None):
+        """ Drops the connection to `addr`, if it is `conn` when given """
+        if addr in self.connections:
+            if conn is None or self.connections[addr] is conn:
+                self.connections.pop(addr).abort()
+
+    async def close(self, addr):
+        if addr in self.connections:
+            await self.connections.pop(addr).close()
+
+    async def finish(self):
+        """ Closes every connection once its queued requests are written """
+        connections = list(self.connections.values())
+        self.connections.clear()
+        await asyncio.gather(*[conn.finish() for conn in connections])
+
+    def abort(self):
+        while self.connections:
+            _, conn = self.connections.popitem()
+            conn.abort()
+
+
+class Registry:
+    """ The components running on this device.
+
+    A component announces itself once it is listening by writing
+    `<socket_root>/<name>.json`, and removes it when it stops, see
+    `Comms.announce`.  An announcement holds the component's name, pid,
+    transport, protocol version and the framings and JSON codec it speaks.
+    An announcement left behind by a process which died is ignored.
+
+    `watch` keeps `services` up to date from inotify events on
+    `socket_root`, and calls `on_change(name, info)` when a component
+    appears, changes or disappears, `info` being None for the latter.
+    A component which dies without removing its announcement makes no
+    event, so the pids announced are checked every `poll_interval` seconds
+    too, see `reap`.  Where there is no inotify, `socket_root` is scanned
+    every `poll_interval` seconds instead.
+    """
+    def __init__(self, socket_root, on_change=None, poll_interval=1):
+        self.socket_root = socket_root
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.services = {}
+        self.waiters = {}
+
+    def __contains__(self, name):
+        return name in self.services
+
+    def get(self, name):
+        return self.services.get(name)
+
+    def path(self, name):
+        return f"{self.socket_root}/{name}.json"
+
+    def announce(self, info):
+        """ Writes the announcement `info` of a component, all at once so
+        readers never see part of it.
+        """
+        path = self.path(info['name'])
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(json_codec().dumps(info))
+        os.replace(f"{path}.tmp", path)
+
+    def withdraw(self, name):
+        if os.path.exists(self.path(name)):
+            os.unlink(self.path(name))
+
+    @staticmethod
+    def alive(pid):
+        """ True if the process `pid` exists """
+        try:
+            os.kill(pid, 0)
+        except PermissionError:
+            pass  # the process exists, but isn't ours to signal
+        except (OSError, ValueError, TypeError):
+            return False
+        return True
+
+    def load(self, name):
+        """ The announcement of `name`, or None if there is none or its
+        process has gone.
+        """
+        try:
+            with open(self.path(name), "rb") as f:
+                info = json_codec().loads(f.read())
+            pid = info['pid']
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return info if self.alive(pid) else None
+
+    def update(self, name):
+        """ Reloads the announcement of `name`, noting any change """
+        info = self.load(name)
+        if info == self.services.get(name):
+            return
+        if info is None:
+            self.services.pop(name)
+        else:
+            self.services[name] = info
+            for waiter in self.waiters.pop(name, []):
+                if not waiter.done():
+                    waiter.set_result(info)
+        if self.on_change:
+            self.on_change(name, info)
+
+    def scan(self):
+        names = {f[:-len(".json")] for f in os.listdir(self.socket_root)
+                 if f.endswith(".json")}
+        for name in names | set(self.services):
+            self.update(name)
+
+    def reap(self):
+        """ Forgets the components whose process has gone, though their
+        announcement is still there.
+        """
+        for name, info in list(self.services.items()):
+            if not self.alive(info['pid']):
+                self.update(name)
+
+    async def reap_every(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            self.reap()
+
+    async def watch(self):
+        if not inotify.AVAILABLE:
+            while True:
+                self.scan()
+                await asyncio.sleep(self.poll_interval)
+
+        watcher = inotify.Inotify()
+        reaper = None
+        try:
+            watcher.add_watch(self.socket_root, inotify.IN_CLOSE_WRITE
+                              | inotify.IN_MOVED_TO | inotify.IN_MOVED_FROM
+                              | inotify.IN_DELETE)
+            self.scan()
+            reaper = asyncio.create_task(self.reap_every())
+            while True:
+                mask, name = await watcher.get()
+                if name.endswith(".json"):
+                    self.update(name[:-len(".json")])
+        finally:
+            if reaper is not None:
+                reaper.cancel()
+            watcher.close()
+
+    async def wait_for(self, name, timeout=None):
+        """ The announcement of `name`, once it has been made, or None if
+        that takes longer than `timeout` seconds.
+        """
+        if name in self.services:
+            return self.services[name]
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(name, []).append(waiter)
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            if waiter in self.waiters.get(name, []):
+                self.waiters[name].remove(waiter)
 
 
 class Comms:
@@ -29,10 +1254,6 @@ class Comms:
     Components on the same unix-like device use unix domain sockets.
     Components on different devices use IP/TCP sockets.
 
-    Note:
-        This class is specific for unix domain sockets.  The intention is to
-    extent it for IP/TCP.
-
     To use, instanciate an instance with a device-unique name.  This impies a
     component specific socket at `<socket_root>/<name>.sock`.  `start` will
     create the socket if a server is necessary, i.e. if this components listens
@@ -47,73 +1268,489 @@ class Comms:
 
     The rest of the communication is abstracted.
 
+    To serve components on other devices, set `tcp_address` to a
+    `(host, port)` and `start` listens there too.  To reach a component on
+    another device, add its `(host, port)` to `routes` under its name.  TCP
+    connections use TLS when `server_ssl`/`client_ssl` are set, see
+    `create_ssl_contexts`.  Otherwise both transports behave the same.
+
+    With `buffered` on, the servers receive through `FrameProtocol` rather
+    than the StreamReader of `client_callback`.
+
+    Messages to a peer are written in batches, see `Client` and
+    `Connection`.  A peer in `flush_delays`, or any peer if `flush_delay`
+    is set, is written to at most once per that many seconds, trading
+    latency for throughput.
+
+    A component can also be reached through a bridge, see
+    `services/bridge.py`, which forwards local names to other devices.  A
+    bridge serves at `<socket_root>/<address>.sock` on behalf of the
+    component named `address`, under a `name` of its own.  Otherwise
+    `address` is `name`.
+
+    Traffic, queue waits and request round trips are recorded in
+    `self.metrics`, see `secbot/metrics.py` and `stats`.  With
+    `stats_socket` set, `start` serves them at
+    `<socket_root>/<name>.stats.sock`.
+
+    With `tracing` on, `start_trace` begins a trace for a message to carry
+    through the components it passes, see `secbot/tracing.py`.
+
+    With `validate` on, messages are checked against `secbot/schema.py` as
+    they are received, requested and responded, see `check`.
+
+    Sockets passed in by systemd socket activation are listened on rather
+    than created, see `secbot/activation.py`.
+
+    `shutdown` stops a component without losing the responses and events
+    already on their way out, and is what SIGTERM and SIGINT do.  Run the
+    component's main coroutine with `serve` so it returns once stopped.
+
     You can subclass this if you are a monster, or just instanciate it via
     the `create_comms` helper function below.
-
-    FIXME: Haven't decided if this will be ONLY unix domain scokets and there
-    will be another class for IP/TCP, and a bridge will be required, or
-    if this can be stuffed with all types of connections and bridges
-    explicitly manged via the user of the instance.
     """
+    running = set()
+
     def __init__(self, name):
         self.name = name
+        self.address = name
+        self.activated = set()
+        self.announcing = True
         self.callback = None
         self.clients = {}
         self.config = None
+        self.client_queue_size = 64
+        self.buffered = False
+        self.max_frame_size = MAX_FRAME_SIZE
+        self.client_ssl = None
         self.connections = {}
+        self.discovery = True
+        self.discovery_wait = 1
+        self.flush_delay = 0
+        self.flush_delays = {}
+        self.framing = JsonFraming.name
+        self.heartbeat_interval = 5
+        self.heartbeat_misses = 3
+        self.heartbeat_peers = []
+        self.hub = None
+        self.liveness = {}
+        self.log_listener = None
         self.logger = logging.getLogger(name)
+        self.metrics = Metrics()
+        self.overflow = "drop_oldest"
+        self.overflows = {policy: 0 for policy in Client.OVERFLOW_POLICIES}
+        self.pool = ConnectionPool(self.open_connection, self.logger)
+        self.registry = None
+        self.request_retries = 2
+        self.request_timeout = None
+        self.routes = {}
         self.server = None
-        self.servers = {}
+        self.server_ssl = None
+        self.shutdown_timeout = 5
+        self.shutting_down = None
         self.socket_root = "."
-        self.in_q = asyncio.Queue()
-        self.out_q = asyncio.Queue()
+        self.stats_server = None
+        self.stats_socket = False
+        self.tcp_address = None
+        self.tcp_server = None
+        self.tracer = Tracer(name)
+        self.tracing = False
+        self.validate = False
+        self.in_q = MeteredQueue(self.metrics, "in_q_wait")
+        self.out_q = MeteredQueue(self.metrics, "out_q_wait")
         self.set_callback()
+        self.remote_patterns = {}
+        self.subscribers = {}
+        self.subscriptions = {}
+        self.stopped = asyncio.Event()
         self.tasks = {}
+        self.timeouts = {}
+        self.metrics.gauge("in_q", self.in_q.qsize)
+        self.metrics.gauge("out_q", self.out_q.qsize)
+        self.metrics.gauge("clients", lambda: len(set(self.clients.values())))
+        self.metrics.gauge("servers", lambda: len(self.servers))
+        self.metrics.gauge("client_queues", self.client_queue_depths)
+        self.metrics.gauge("peers", lambda: dict(self.liveness))
 
     def set_config(self, config):
         self.config = config
         self.socket_root = config.SOCKET_ROOT
+        self.framing = getattr(config, 'FRAMING', self.framing)
+        self.buffered = getattr(config, 'BUFFERED_RECEIVE', self.buffered)
+        self.max_frame_size = getattr(config, 'MAX_FRAME_SIZE',
+                                      self.max_frame_size)
+        self.flush_delay = getattr(config, 'FLUSH_DELAY', self.flush_delay)
+        self.flush_delays.update(getattr(config, 'FLUSH_DELAYS', {}))
+        self.hub = getattr(config, 'MEMORY_HUB', self.hub)
+        if getattr(config, 'JSON_CODEC', None):
+            set_json_codec(config.JSON_CODEC)
+        self.client_queue_size = getattr(config, 'CLIENT_QUEUE_SIZE',
+                                         self.client_queue_size)
+        self.overflow = getattr(config, 'OVERFLOW_POLICY', self.overflow)
+        self.request_retries = getattr(config, 'REQUEST_RETRIES',
+                                       self.request_retries)
+        self.request_timeout = getattr(config, 'REQUEST_TIMEOUT',
+                                       self.request_timeout)
+        self.timeouts.update(getattr(config, 'REQUEST_TIMEOUTS', {}))
+        self.pool.attempts = getattr(config, 'RECONNECT_ATTEMPTS',
+                                     self.pool.attempts)
+        self.pool.delay = getattr(config, 'RECONNECT_DELAY', self.pool.delay)
+        self.pool.max_delay = getattr(config, 'RECONNECT_MAX_DELAY',
+                                      self.pool.max_delay)
+        self.routes.update(getattr(config, 'ROUTES', {}))
+        self.shutdown_timeout = getattr(config, 'SHUTDOWN_TIMEOUT',
+                                        self.shutdown_timeout)
+        self.heartbeat_interval = getattr(config, 'HEARTBEAT_INTERVAL',
+                                          self.heartbeat_interval)
+        self.heartbeat_misses = getattr(config, 'HEARTBEAT_MISSES',
+                                        self.heartbeat_misses)
+        self.heartbeat_peers = getattr(config, 'HEARTBEAT_PEERS', {}).get(
+            self.name, self.heartbeat_peers)
+        self.discovery = getattr(config, 'DISCOVERY', self.discovery)
+        self.discovery_wait = getattr(config, 'DISCOVERY_WAIT',
+                                      self.discovery_wait)
+        self.stats_socket = getattr(config, 'STATS_SOCKET', self.stats_socket)
+        self.metrics.max_peers = getattr(config, 'METRICS_MAX_PEERS',
+                                         self.metrics.max_peers)
+        self.tracing = getattr(config, 'TRACING', self.tracing)
+        self.validate = getattr(config, 'VALIDATE', self.validate)
+        if getattr(config, 'TRACE_BUFFER_SIZE', None):
+            self.tracer = Tracer(self.name, config.TRACE_BUFFER_SIZE)
+        self.tcp_address = getattr(config, 'TCP_ADDRESS', self.tcp_address)
+        if getattr(config, 'TLS_CERT', None):
+            self.server_ssl, self.client_ssl = create_ssl_contexts(
+                config.TLS_CERT, config.TLS_KEY,
+                getattr(config, 'TLS_CA', None),
+                getattr(config, 'TLS_CHECK_HOSTNAME', True))
+
+    @property
+    def servers(self):
+        """ Connections to servers, keyed by server name """
+        return self.pool.connections
 
     def start(self):
         """ Start's a server listening to a unix domain socket which is
         located in the `self.socket_root` directory with filename
-        `{self.name}.sock`.
+        `{self.address}.sock`, and on `self.tcp_address` if it is set.
+
+        Joins `self.hub`, if set, so components in this process can reach
+        this one without the socket.
+
+        Serves `stats` at `{self.name}.stats.sock` if `self.stats_socket`,
+        see `start_stats`.
+
+        Announces this component to the other components on the device once
+        it is listening, if `self.announcing`, and keeps track of them if
+        `self.discovery` is on, see `discover`.
+
+        Watches `self.heartbeat_peers`, see `watch`.
 
         Adds signal handlers for SIGTERM and SIGINT to call self.cleanup.
         """
-        self.server = asyncio.start_unix_server(
-            self.callback,
-            f"{self.socket_root}/{self.name}.sock"
-        )
-        self.tasks['receiver'] = asyncio.create_task(self.server)
+        self.logger.info(f"Running on the {event_loop_name()} event loop")
+        self.stopped.clear()
+        self.shutting_down = None
+        Comms.running.add(self)
+        if self.registry is None:
+            self.registry = Registry(self.socket_root, self.registry_changed)
+        self.tasks['receiver'] = asyncio.create_task(self.start_unix_server())
+        if self.discovery:
+            self.discover()
+        if self.hub is not None:
+            self.hub.register(self)
+        if self.tcp_address:
+            self.tasks['tcp_receiver'] = asyncio.create_task(
+                self.start_tcp_server(*self.tcp_address))
+        self.start_stats()
         self.tasks['responder'] = asyncio.create_task(self.response())
+        self.watch_peers()
         loop = asyncio.get_event_loop()
         loop.add_signal_handler(SIGTERM, self.cleanup)
         loop.add_signal_handler(SIGINT, self.cleanup)
 
+    def start_stats(self):
+        """ Serves `stats` at `{self.name}.stats.sock` if `self.stats_socket`
+        is set, see `start_stats_server`.  `start` does this, so it's only
+        needed by components which make requests without serving any, e.g.
+        the rfid reader.
+        """
+        if self.stats_socket and 'stats' not in self.tasks:
+            self.tasks['stats'] = asyncio.create_task(
+                self.start_stats_server())
+
     def stop(self):
         """ Stops the server and all associated tasks, removing the socket
-        from the filesystem"""
-        if self.server:
-            self.server.close()
-
-        sock_path = f"{self.name}.sock"
-        if sock_path in os.listdir(self.socket_root):
-            os.unlink(f"{self.socket_root}/{sock_path}")
+        from the filesystem.  Anything not yet written is lost, see
+        `shutdown`.
+        """
+        self.stop_listening()
 
         task_names = list(self.tasks.keys())
         while self.tasks:
             task = self.tasks.pop(task_names.pop())
             task.cancel()
 
+        for client in list(self.clients.values()):
+            client.abort()
+
+        self.pool.abort()
+        Comms.running.discard(self)
+        self.stopped.set()
+
+    def stop_listening(self):
+        """ Closes the servers, so no new connections are accepted, and
+        removes the sockets it created from the filesystem.  Open
+        connections are left be.
+        """
+        if self.server:
+            self.server.close()
+        if self.tcp_server:
+            self.tcp_server.close()
+        if self.stats_server:
+            self.stats_server.close()
+        if self.hub is not None:
+            self.hub.unregister(self)
+        if self.server and self.registry and self.announcing:
+            self.registry.withdraw(self.name)
+
+        for sock_path in (f"{self.address}.sock", f"{self.name}.stats.sock"):
+            path = f"{self.socket_root}/{sock_path}"
+            if socket_address(path) in self.activated:
+                continue
+            if sock_path in os.listdir(self.socket_root):
+                os.unlink(path)
+
+    def shutdown(self, timeout=None):
+        """ Stops gracefully, returning the task doing so.  Calling it again
+        returns the same task.
+
+        Stops accepting connections, then within `timeout` seconds, by
+        default `shutdown_timeout`:
+          - waits for the requests in `in_q` to be picked up,
+          - waits for the responses in `out_q` to be handed to their clients,
+          - writes out each client's queued messages and closes it, and
+          - writes out queued requests to servers and closes the connections.
+
+        Whatever is left at the deadline is dropped by `stop`, which
+        finishes the shutdown either way.  A request picked up from `in_q`
+        but not yet responded to when `out_q` empties is not waited for.
+        """
+        if self.shutting_down is None:
+            self.shutting_down = asyncio.create_task(self.drain_and_stop(
+                self.shutdown_timeout if timeout is None else timeout))
+        return self.shutting_down
+
+    async def drain_and_stop(self, timeout):
+        if self.stopped.is_set():
+            return
+        self.logger.warning("Shutting down")
+        self.stop_listening()
+        for name in [name for name in self.tasks
+                     if name.startswith("heartbeat_")]:
+            self.tasks.pop(name).cancel()
+        try:
+            await asyncio.wait_for(self.drain(), timeout)
+        except asyncio.TimeoutError:
+            self.logger.error(
+                f"Shutdown timed out after {timeout}s with "
+                f"{self.in_q.qsize()} requests, {self.out_q.qsize()} "
+                f"responses and {sum(self.client_queue_depths().values())} "
+                "client messages left")
+        self.stop()
+        self.logger.warning("Stopped")
+
+    async def drain(self):
+        while not self.in_q.empty():
+            await asyncio.sleep(DRAIN_INTERVAL)
+        await self.out_q.join()
+        await asyncio.gather(*[client.finish()
+                               for client in set(self.clients.values())])
+        await self.pool.finish()
+
+    async def serve(self, main):
+        """ Runs the coroutine `main`, e.g. a component's `process`, until
+        it returns or this component stops.  `main` is cancelled if it's
+        still running, so e.g.
+            `loop.run_until_complete(comms.serve(component.process()))`
+        returns once the component has shut down after a SIGTERM.
+        """
+        task = asyncio.ensure_future(main)
+        stopped = asyncio.create_task(self.stopped.wait())
+        try:
+            await asyncio.wait((task, stopped),
+                               return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stopped.cancel()
+            if not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        return task.result() if not task.cancelled() else None
+
+    def listen_socket(self, address):
+        """ The socket systemd passed in to listen on at `address`, or None
+        to create it, see `secbot/activation.py`.  Sockets passed in are
+        left in place when stopping, for systemd to keep while restarting.
+        """
+        sock = take_socket(address)
+        if sock is not None:
+            self.activated.add(socket_address(address))
+            self.logger.info(f"Listening on {address} passed in by systemd")
+        return sock
+
+    async def start_unix_server(self):
+        path = f"{self.socket_root}/{self.address}.sock"
+        sock = self.listen_socket(path)
+        if sock is not None:
+            path = None
+        if self.buffered:
+            self.server = await asyncio.get_running_loop().create_unix_server(
+                self.new_protocol, path, sock=sock)
+        else:
+            self.server = await asyncio.start_unix_server(
+                self.callback, path, sock=sock, limit=self.max_frame_size)
+        if self.announcing:
+            self.announce()
+
+    def announce(self):
+        """ Tells the other components on this device that this one is
+        running, and how to talk to it, see `Registry`.
+        """
+        self.registry.announce({
+            "name": self.name,
+            "pid": os.getpid(),
+            "transport": {
+                "unix": f"{self.socket_root}/{self.name}.sock",
+                "tcp": list(self.tcp_address) if self.tcp_address else None,
+            },
+            "version": PROTOCOL_VERSION,
+            "framings": sorted(FRAMINGS),
+            "json_codec": json_codec().name,
+            "started": time.time(),
+        })
+
+    def discover(self):
+        """ Keeps track of the components running on this device in
+        `self.registry`.  Components appearing and disappearing are published
+        as `/registry/<name>/up` events, with the announcement as context,
+        and `/registry/<name>/down` events.
+
+        Connecting to a component which isn't running yet waits up to
+        `discovery_wait` seconds for it to appear, rather than failing.
+        """
+        if self.registry is None:
+            self.registry = Registry(self.socket_root, self.registry_changed)
+        if 'registry' not in self.tasks:
+            self.tasks['registry'] = asyncio.create_task(self.registry.watch())
+
+    def registry_changed(self, name, info):
+        if name == self.name:
+            return
+        if info is None:
+            self.logger.info(f"{name} has gone")
+            self.publish(f"/registry/{name}/down")
+        else:
+            self.logger.info(f"{name} is running, pid {info['pid']}")
+            self.publish(f"/registry/{name}/up", info)
+
+    async def start_tcp_server(self, host, port):
+        """ Listens for TCP connections, using TLS if `server_ssl` is set.
+        Clients are handled exactly as over the unix domain socket.
+        """
+        sock = self.listen_socket((host, port))
+        address = (host, port) if sock is None else (None, None)
+        if self.buffered:
+            self.tcp_server = await asyncio.get_running_loop().create_server(
+                self.new_protocol, *address, sock=sock, ssl=self.server_ssl)
+        else:
+            self.tcp_server = await asyncio.start_server(
+                self.callback, *address, sock=sock, ssl=self.server_ssl,
+                limit=self.max_frame_size)
+        self.logger.info(f"Listening on {host}:{port}")
+
+    def new_protocol(self):
+        """ A `FrameProtocol` for a new client connection """
+        return FrameProtocol(self)
+
+    async def start_stats_server(self):
+        """ Listens on `<socket_root>/<name>.stats.sock`.  A connection
+        sends one line, `traces` for the finished traces kept by
+        `self.tracer` or anything else, even just EOF, for `stats`.  The
+        answer is written as JSON, newline terminated, and the connection
+        closed.  e.g.
+            `$ socat - UNIX-CONNECT:/run/queeriouslabs/authorizer.stats.sock \
+                < /dev/null`
+        """
+        async def send_stats(reader, writer):
+            try:
+                command = await reader.readline()
+                if command.strip() == b"traces":
+                    data = self.tracer.dump()
+                else:
+                    data = self.stats()
+                writer.write(json_codec().dumps(data) + b'\n')
+                await writer.drain()
+            finally:
+                writer.close()
+
+        path = f"{self.socket_root}/{self.name}.stats.sock"
+        sock = self.listen_socket(path)
+        self.stats_server = await asyncio.start_unix_server(
+            send_stats, None if sock else path, sock=sock)
+
+    def stats(self):
+        """ A snapshot of `self.metrics` along with the overflow counts of
+        this server's clients, see `Client`, and a summary of the traces
+        kept by `self.tracer`.
+        """
+        stats = self.metrics.snapshot()
+        stats['name'] = self.name
+        stats['pid'] = os.getpid()
+        stats['loop'] = event_loop_name()
+        for policy, count in self.overflows.items():
+            stats['counters'][f"overflow/{policy}"] = count
+        stats['traces'] = self.tracer.summary()
+        return stats
+
+    def check(self, msg):
+        """ Raises `ValidationError` if `msg` is not a valid request,
+        response or event.  Subscription changes and heartbeats are not
+        checked.
+        """
+        kind = message_type(msg)
+        if kind in ("subscribe", "heartbeat"):
+            return
+        try:
+            if kind not in VALIDATORS:
+                raise ValidationError("$: not a request, response or event")
+            VALIDATORS[kind](msg)
+        except ValidationError:
+            peer = self.metrics.peer(msg.get('source_id'))
+            self.metrics.incr(f"invalid/{peer}/{kind}")
+            raise
+
+    def start_trace(self):
+        """ A new trace to add to a message, or `None` if tracing is off """
+        return self.tracer.start() if self.tracing else None
+
+    def client_queue_depths(self):
+        return {name: client.queue.qsize()
+                for name, client in self.clients.items()
+                if isinstance(client, Client)}
+
     def cleanup(self):
-        """ When a signal is received, this function is called to stop the
-        server and exit gracefully
+        """ When a signal is received, this function is called to shut down
+        every running Comms of the process, see `shutdown`.  A second signal
+        while they are shutting down stops them straight away.
         """
         self.logger.warning("Cleaning up")
-        self.stop()
-        self.logger.warning("Exiting")
-        exit()
+        for comms in list(Comms.running):
+            if comms.shutting_down is None:
+                comms.shutdown()
+            else:
+                comms.stop()
 
     def set_callback(self):
         """ Constructs the client callback for an asyncio server, which
@@ -142,79 +1779,103 @@ class Comms:
 
             This is looped for all incoming client data.
 
+            A message with `subscribe` or `unsubscribe` lists of topic
+            patterns manages the client's event subscriptions instead, see
+            `publish`, and is not placed in the self.in_q.
+
+            A client MAY instead send `{"framing": <name>}` as its first
+            frame to switch the connection to another framing, see
+            `negotiate_framing`.  The server answers with the framing it
+            will use, which stays JSON if the one asked for is unavailable.
+
             The server will close connections on errors in the incoming
-            data.
+            data, and on frames over `max_frame_size` bytes.
             """
-            req = await reader.readline()
-            if reader.at_eof():
-                return
-            if (req == b''):
-                return
-            try:
-                req = json.loads(req.decode('utf-8'))
-            except (AttributeError, JSONDecodeError) as e:
-                writer.close()
-                await writer.wait_closed()
-                raise e
-
-            if (src_id := req.get('source_id')):
-                if src_id in self.clients:
-                    self.logger.error(f"Duplicate connection from {src_id}")
-                    temp_r, temp_w = self.clients.pop(src_id)
-                    try:
-                        temp_w.close()
-                        await temp_w.wait_closed()
-                    except Exception as e:
-                        self.logger(f"{e}")
-
-                if src_id not in self.clients:
-                    self.clients[src_id] = (reader, writer)
-                await self.in_q.put(req)
+            session = ServerSession(self, reader, writer)
+            self.metrics.incr("connections/accepted")
 
             while True:
-                req = await reader.readline()
-                self.logger.debug(f"{src_id} -> {req}")
-                if reader.at_eof():
-                    self.logger.warning(f"Done with {src_id}")
-                    reader, writer = self.clients.pop(src_id)
+                try:
+                    req = await session.framing.read(
+                        reader, self.max_frame_size)
+                    self.logger.debug("%s -> %s", session.src_id, req)
+                    if (req == b''):
+                        session.close()
+                        writer.close()
+                        await writer.wait_closed()
+                        break
+                    req = session.decode(req)
+                except (AttributeError, ValueError) as e:
+                    self.logger.error(f"Bad frame, disconnecting: {e}")
+                    self.metrics.incr("connections/bad_frame")
+                    session.close()
                     writer.close()
                     await writer.wait_closed()
                     break
-                if (req == b''):
-                    self.logger.error("Empty request")
+
+                if (ack := session.negotiate(req)) is not None:
+                    writer.write(ack)
+                    await writer.drain()
                     continue
-                try:
-                    req = json.loads(req.decode('utf-8'))
-                except (AttributeError, JSONDecodeError) as e:
-                    writer.close()
-                    await writer.wait_closed()
-                    raise e
 
-                if (src_id := req.get('source_id')):
-                    if src_id not in self.clients:
-                        self.clients[src_id] = (reader, writer)
-                    await self.in_q.put(req)
+                await session.handle(req)
 
         self.callback = client_callback
 
+    async def open_connection(self, server):
+        """ Opens a new connection to a local unix domain socket in the
+        socket_root directory, negotiating the configured framing.
+
+        Servers in `self.hub` are in this process and are connected to in
+        memory.  Servers in `self.routes` are on other devices and are
+        connected to over TCP.  A local server which isn't running yet is
+        waited for, see `discover`.
+        """
+        if self.hub is not None and server in self.hub:
+            self.logger.debug("New in-memory connection made to %s", server)
+            conn = MemoryConnection(server, self.hub.get(server), self.logger,
+                                    self.dispatch_event)
+            if (patterns := self.remote_patterns.get(server)):
+                await conn.request(
+                    {"source_id": self.name, "subscribe": sorted(patterns)},
+                    False)
+            return conn
+
+        if server in self.routes:
+            host, port = self.routes[server]
+            reader, writer = await asyncio.open_connection(
+                host, port, ssl=self.client_ssl,
+                server_hostname=host if self.client_ssl else None)
+        else:
+            sock_path = f"{self.socket_root}/{server}.sock"
+            if self.registry is not None and server not in self.registry \
+                    and not os.path.exists(sock_path):
+                await self.registry.wait_for(server, self.discovery_wait)
+            reader, writer = await asyncio.open_unix_connection(sock_path)
+        framing = await negotiate_framing(reader, writer, self.framing)
+        self.logger.debug("New connection made to %s", server)
+        if (patterns := self.remote_patterns.get(server)):
+            writer.write(framing.encode(
+                {"source_id": self.name, "subscribe": sorted(patterns)}))
+        return Connection(server, reader, writer, self.logger, framing,
+                          self.dispatch_event, self.metrics,
+                          self.flush_delays.get(server, self.flush_delay))
+
     async def connect(self, server):
         """ Make a connection to a local unix domain socket in the
         socket_root directory and keeps the connection in self.servers.
+
+        A closed connection is replaced, see `ConnectionPool`.
         """
-        if server not in self.servers:
-            sock_path = self.socket_root + "/" + server + ".sock"
-            reader, writer = await asyncio.open_unix_connection(sock_path)
-            self.servers[server] = (reader, writer)
+        return await self.pool.get(server)
 
     async def disconnect(self, conn_name):
         """ Disconnects from a local unix domain socket in self.servers.
         """
-        if conn_name in self.servers:
-            reader, writer = self.servers.pop(conn_name)
-            writer.close()
-            await writer.wait_closed()
+        await self.pool.close(conn_name)
 
-    async def request(self, addr, req, resp=True):
+    async def request(self, addr, req, resp=True, idempotent=False,
+                      timeout=None):
         """ A one-off request to a server.
 
         A user of this comms instance makes requests to other components on
@@ -230,40 +1891,271 @@ class Comms:
 
         That string MUST end with a b'\n'.
 
-        Expects a single response returned to the caller.
-        """
+        Expects a single response returned to the caller.  Requests are
+        pipelined over a single connection per server, see `Connection`.
 
-        if addr not in self.servers:
-            sock_path = f"{self.socket_root}/{addr}.sock"
-            reader, writer = await asyncio.open_unix_connection(sock_path)
-            self.servers[addr] = (reader, writer)
-            self.logger.debug(f"New connection made to {addr}")
-        else:
-            self.logger.debug(f"Found connection: {addr}")
-            reader, writer = self.servers[addr]
+        A request which never made it onto the connection is retried on a
+        new connection up to `request_retries` times.  One which was written
+        but not answered before the connection closed is only retried if it
+        is `idempotent`, e.g. a reload, as the server may have acted on it.
 
-        self.logger.debug(f"Sending req to {addr}")
-        msg = json.dumps(req).encode('utf-8')
-        writer.write(msg + b'\n')
-        await writer.drain()
-        if not resp:
-            return {}
+        The whole request, reconnects and retries included, must finish
+        within `timeout` seconds, else `RequestTimeout` is raised.  Without
+        a `timeout` the deadline for `addr` in `self.timeouts` is used, then
+        `self.request_timeout`.  `None` waits forever.  A timed out or
+        cancelled request leaves the connection usable for other requests.
 
-        self.logger.debug(f"Waiting on response from {addr}")
-        data = await reader.readline()
+        With `self.validate` on, an invalid `req` raises `ValidationError`
+        without being sent.
 
-        self.logger.debug(f"Got response from {addr}")
-        if data == b'':
-            return {}
-        try:
-            data = json.loads(data)
-        except JSONDecodeError as e:
-            self.logger.error(f"{e}")
+        Round trips are recorded under `request_rtt/<addr>/<message type>`
+        in `self.metrics`, and failures counted.
+        """
+        if timeout is None:
+            timeout = self.timeouts.get(addr, self.request_timeout)
 
-        self.logger.debug(f"{addr} said: {data}")
+        if self.validate:
+            self.check(req)
 
+        kind = message_type(req)
+        self.metrics.incr(f"requests/{addr}/{kind}")
+        start = time.monotonic()
+        try:
+            data = await asyncio.wait_for(
+                self.send_request(addr, req, resp, idempotent), timeout)
+        except asyncio.TimeoutError as e:
+            self.metrics.incr(f"request_timeouts/{addr}")
+            self.logger.error(f"No response from {addr} within {timeout}s")
+            raise RequestTimeout(
+                f"No response from {addr} within {timeout}s") from e
+        except OSError:
+            self.metrics.incr(f"request_errors/{addr}")
+            raise
+        self.metrics.observe(f"request_rtt/{addr}/{kind}",
+                             time.monotonic() - start)
         return data
 
+    async def send_request(self, addr, req, resp, idempotent):
+        """ Sends the request, retrying as described in `request` """
+        for attempt in range(self.request_retries + 1):
+            conn = await self.connect(addr)
+            self.logger.debug("Sending req to %s", addr)
+            try:
+                data = await conn.request(req, resp)
+                break
+            except ConnectionError as e:
+                self.pool.discard(addr, conn)
+                retry = idempotent or isinstance(e, RequestNotSent)
+                if not retry or attempt >= self.request_retries:
+                    raise
+                self.metrics.incr(f"request_retries/{addr}")
+                self.logger.warning(
+                    f"Request to {addr} failed ({e}), retrying")
+
+        self.logger.debug("%s said: %s", addr, data)
+        return data
+
+    async def receive(self, client, req):
+        """ Takes in a message from a client.  Subscription changes are
+        handled here and heartbeats sent straight back, see `watch`.
+        Everything else goes to the self.in_q.
+
+        A traced message gets a `receive` span, on a copy of the message as
+        the sender may still hold the original, see `MemoryConnection`.
+
+        With `self.validate` on, invalid messages are dropped, and an invalid
+        request is answered with an error response, code 1, if it can be.
+        """
+        peer = self.metrics.peer(req.get('source_id'))
+        self.metrics.incr(f"received/{peer}/{message_type(req)}")
+        if 'heartbeat' in req:
+            client.send_nowait(req)
+            return
+        if self.validate:
+            try:
+                self.check(req)
+            except ValidationError as e:
+                await self.reject(client, req, e)
+                return
+        if (trace := req.get('trace')) is not None:
+            now = time.time()
+            trace = dict(trace, spans=[*trace['spans']])
+            self.tracer.record(trace, "receive", now, now)
+            req = dict(req, trace=trace)
+        if 'subscribe' in req or 'unsubscribe' in req:
+            self.update_subscribers(client, req)
+            return
+        await self.in_q.put(req)
+
+    async def reject(self, client, req, error):
+        """ Answers an invalid request with an error response """
+        self.logger.error(f"Invalid message from {client.name}: {error}")
+        if not isinstance(req.get('source_id'), str) or \
+                'permissions' not in req:
+            return
+        resp = {
+            "source_id": req['source_id'],
+            "target_id": self.address,
+            "code": 1,
+            "msg": f"Invalid request: {error}",
+        }
+        if 'request_id' in req:
+            resp['request_id'] = req['request_id']
+        await client.send(resp)
+
+    def subscribe(self, pattern, queue=None):
+        """ Subscribes to events published by this component with topics
+        matching `pattern`, see `topic_matches`.  Events are put on `queue`,
+        a new asyncio.Queue if one isn't given, which is returned.
+        """
+        queue = queue if queue is not None else asyncio.Queue()
+        self.subscriptions.setdefault(pattern, []).append(queue)
+        return queue
+
+    def unsubscribe(self, pattern, queue):
+        queues = self.subscriptions.get(pattern, [])
+        if queue in queues:
+            queues.remove(queue)
+        if not queues:
+            self.subscriptions.pop(pattern, None)
+
+    async def subscribe_remote(self, addr, pattern, queue=None):
+        """ Subscribes to events published by the component `addr` with
+        topics matching `pattern`.  Events arrive directly from `addr` and
+        are put on the returned queue, see `subscribe`.
+
+        The subscription is renewed whenever the connection is replaced.
+        """
+        queue = self.subscribe(pattern, queue)
+        self.remote_patterns.setdefault(addr, set()).add(pattern)
+        await self.request(
+            addr, {"source_id": self.name, "subscribe": [pattern]}, False)
+        return queue
+
+    def publish(self, topic, context=None):
+        """ Publishes an event on `topic` to this component's subscribers.
+
+        Local subscribers get the event on their queues, and clients which
+        subscribed over the socket get it straight from this component.
+        Publishing never waits, a subscriber which can't keep up is subject
+        to the overflow policy, see `Client`.
+        """
+        event = {"source_id": self.name, "event": topic}
+        if context is not None:
+            event['context'] = context
+        self.logger.debug("Publishing %s", topic)
+        self.metrics.incr("published")
+        self.dispatch_event(event)
+
+        clients = set()
+        for pattern, subscribers in self.subscribers.items():
+            if topic_matches(pattern, topic):
+                clients.update(subscribers)
+        for client in clients:
+            client.send_nowait(event)
+        return event
+
+    def dispatch_event(self, event):
+        """ Puts an event on the queues of matching local subscriptions """
+        for pattern, queues in self.subscriptions.items():
+            if topic_matches(pattern, event['event']):
+                for queue in queues:
+                    queue.put_nowait(event)
+
+    def update_subscribers(self, client, req):
+        for pattern in req.get('subscribe', []):
+            self.subscribers.setdefault(pattern, set()).add(client)
+        for pattern in req.get('unsubscribe', []):
+            self.subscribers.get(pattern, set()).discard(client)
+
+    def drop_subscriber(self, client):
+        for subscribers in self.subscribers.values():
+            subscribers.discard(client)
+
+    def forward_events(self, addr, pattern="*"):
+        """ Forwards events published by this component with topics matching
+        `pattern` to the component `addr`, in order, over one connection.
+        e.g. to the broadcast service for its TCP clients.
+        """
+        events = self.subscribe(pattern)
+
+        async def forward():
+            while True:
+                event = await events.get()
+                try:
+                    await self.request(addr, event, False)
+                except (OSError, RequestTimeout) as e:
+                    self.logger.error(
+                        f"Forwarding event to {addr} failed: {e}")
+
+        self.tasks[f"forward_{addr}"] = asyncio.create_task(forward())
+
+    def watch_peers(self):
+        for addr in self.heartbeat_peers:
+            self.watch(addr)
+
+    def watch(self, addr):
+        """ Keeps a connection to the component `addr` open and checks it is
+        alive with heartbeats, see `heartbeat`.
+
+        Whether `addr` is alive is kept in `liveness`, see `alive`.  Changes
+        are published as `/health/<addr>/up` and `/health/<addr>/down`
+        events, so e.g. the broadcast service can pass them on.
+        """
+        name = f"heartbeat_{addr}"
+        if name not in self.tasks:
+            self.tasks[name] = asyncio.create_task(self.heartbeat(addr))
+
+    def alive(self, addr):
+        """ True if `addr` is answering heartbeats, False if it isn't, and
+        None if it isn't watched or hasn't been heard from yet.
+        """
+        return self.liveness.get(addr)
+
+    async def heartbeat(self, addr):
+        """ Sends `addr` a heartbeat every `heartbeat_interval` seconds,
+        which it sends straight back.
+
+        `addr` is down once its connection closes, or once it has let
+        `heartbeat_misses` heartbeats in a row go by without being heard
+        from, by heartbeat or otherwise, within the interval.  The connection
+        is then dropped, and reopened for the next heartbeat, so requests
+        after `addr` comes back find a connection ready.
+        """
+        interval = self.heartbeat_interval
+        beats = itertools.count(1)
+        missed = 0
+        while True:
+            sent = time.monotonic()
+            try:
+                conn = await self.pool.get(addr)
+                await asyncio.wait_for(conn.request(
+                    {"source_id": self.name, "heartbeat": next(beats)},
+                    False), interval)
+            except (OSError, asyncio.TimeoutError):
+                self.set_liveness(addr, False)
+                await asyncio.sleep(interval)
+                continue
+
+            await asyncio.sleep(interval)
+            missed = 0 if conn.last_seen >= sent else missed + 1
+            if conn.closed or missed >= self.heartbeat_misses:
+                self.set_liveness(addr, False)
+                self.pool.discard(addr, conn)
+                missed = 0
+            elif missed == 0:
+                self.set_liveness(addr, True)
+
+    def set_liveness(self, addr, alive):
+        if self.liveness.get(addr) == alive:
+            return
+        self.liveness[addr] = alive
+        state = "up" if alive else "down"
+        self.logger.log(logging.INFO if alive else logging.WARNING,
+                        f"{addr} is {state}")
+        self.metrics.incr(f"peer_{state}/{addr}")
+        self.publish(f"/health/{addr}/{state}", {"peer": addr})
+
     async def response(self):
         """ A response is always sent back to a connected client.
 
@@ -279,16 +2171,75 @@ class Comms:
         Note that the response must be generated by the user of this
         comm instance.
 
+        Responses are handed to the client's own queue and writer task,
+        see `Client`, so a stalled client does not hold up the others.
+
+        With `self.validate` on, invalid responses are logged and dropped.
         """
         while True:
             data = await self.out_q.get()
+            try:
+                await self.respond(data)
+            finally:
+                self.out_q.task_done()
 
-            client_id = data['source_id']
-            msg = json.dumps(data).encode('utf-8')
-            if client_id in self.clients:
-                _, client = self.clients[client_id]
-                client.write(msg + b'\n')
-                await client.drain()
+    async def respond(self, data):
+        if self.validate:
+            try:
+                self.check(data)
+            except ValidationError as e:
+                self.logger.error(f"Dropping invalid response: {e}")
+                return
+
+        client_id = data.get('source_id')
+        if client_id in self.clients:
+            peer = self.metrics.peer(client_id)
+            self.metrics.incr(f"sent/{peer}/{message_type(data)}")
+            await self.clients[client_id].send(data)
+        else:
+            self.metrics.incr(f"undeliverable/{self.metrics.peer(client_id)}")
+
+
+class LazyQueueHandler(QueueHandler):
+    """ Queues log records for a QueueListener thread to format and write.
+
+    Only the message and its arguments are merged here, so later changes to
+    mutable arguments can't leak into the log.  The rest of the formatting
+    (timestamps, paths, layout) happens on the listener's thread.
+    """
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """ Keeps 1 in `rate` records of each message at or below `level`,
+    counted separately per message.  Messages above `level` all pass.
+
+    Counting is by the unformatted message, so log with arguments, e.g.
+    `logger.debug("%s -> %s", src, msg)`, rather than f-strings.  Only the
+    `max_keys` messages logged most recently are counted, any other starts
+    counting again from its next record.
+    """
+    def __init__(self, rate, level=logging.DEBUG, max_keys=1024):
+        super().__init__()
+        self.rate = rate
+        self.level = level
+        self.max_keys = max_keys
+        self.counts = {}
+
+    def filter(self, record):
+        if record.levelno > self.level:
+            return True
+        key = (record.name, record.msg)
+        # re-inserted, so the dict is in order of use, least recent first
+        count = self.counts.pop(key, 0)
+        self.counts[key] = count + 1
+        if len(self.counts) > self.max_keys:
+            del self.counts[next(iter(self.counts))]
+        return count % self.rate == 0
 
 
 def config_logging(comms, comms_config):
@@ -297,6 +2248,13 @@ def config_logging(comms, comms_config):
     Uses a TimedRotatingFileHandler to rotate logs automatically
     once a week, keeping a years worth of logs by default.
 
+    With `LOG_QUEUE` set in the config, the service only queues records and
+    a QueueListener thread formats and writes them, so the event loop never
+    waits on the disk, not even when the log rotates.
+
+    `LOG_SAMPLE_RATE` of N keeps only 1 in N of each DEBUG message, see
+    `SamplingFilter`.
+
     Pass in a Comm instance and a Config from settings.py.
     """
     handler = TimedRotatingFileHandler(
@@ -312,11 +2270,33 @@ def config_logging(comms, comms_config):
     formatter = logging.Formatter(comms_config.LOG_FORMAT)
     handler.setLevel(comms_config.LOG_LEVEL)
     handler.setFormatter(formatter)
+
+    if getattr(comms_config, 'LOG_QUEUE', False):
+        comms.log_listener = QueueListener(
+            queue.SimpleQueue(), handler, respect_handler_level=True)
+        comms.log_listener.start()
+        atexit.register(comms.log_listener.stop)
+        handler = LazyQueueHandler(comms.log_listener.queue)
+        handler.setLevel(comms_config.LOG_LEVEL)
+
+    if getattr(comms_config, 'LOG_SAMPLE_RATE', 1) > 1:
+        handler.addFilter(SamplingFilter(comms_config.LOG_SAMPLE_RATE))
+
     comms.logger.addHandler(handler)
     comms.logger.setLevel(comms_config.LOG_LEVEL)
     comms.logger.info("Logging enabled")
 
 
+def stop_logging(comms):
+    """ Writes out any queued log records and stops the listener thread
+    started by `config_logging`, if there is one.
+    """
+    if comms.log_listener:
+        atexit.unregister(comms.log_listener.stop)
+        comms.log_listener.stop()
+        comms.log_listener = None
+
+
 def create_comms(name, comms_config):
     """ Helper function to create a configured Comms instance.
 
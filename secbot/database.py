@@ -1,29 +1,190 @@
+""" Persistent access control data.
+
+The ACL is stored either as CSV files in a data directory, `hours.csv` and
+`rfids.csv`, or in a SQLite database when a `database` path is given.  Both
+are read with `read_acl_data` and written with `write_rfid_data` and
+`write_hours_data`, so callers switch between them with a path.
+
+The database runs in WAL mode, so the authorizer can read it while the TUI
+writes to it.  Cards are indexed by rfid and by sponsor, and single cards
+can be changed in a transaction of their own with `put_rfid` and
+`delete_rfid`.  Existing CSV files are copied into a database with
+`migrate_csv`, see `services/migrate_acl.py`.
+
+Parsing large CSV files row by row is slow, so what they held is also kept
+in a compiled snapshot, `acl.snapshot` in the data directory, see
+`read_snapshot`.  The CSV files are only parsed again when they change.
+"""
+from contextlib import closing
 import csv
+import hashlib
+import io
+import os
+import sqlite3
+import struct
+
+
+ACL_FILES = ("hours.csv", "rfids.csv")
+
+SNAPSHOT_FILE = "acl.snapshot"
+SNAPSHOT_MAGIC = b"SBACL\0\0\1"
+#: magic, mtime_ns and size of each of ACL_FILES, their digest, and the
+#: numbers of rfids columns, access levels and cards
+SNAPSHOT_HEADER = struct.Struct("<8s4q32sIII")
+
+SCHEMA_VERSION = 1
 
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS hours (
+        name TEXT PRIMARY KEY,
+        start_hour INTEGER NOT NULL,
+        end_hour INTEGER NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS rfids (
+        rfid TEXT PRIMARY KEY,
+        access_times TEXT NOT NULL,
+        sponsor TEXT NOT NULL DEFAULT '')""",
+    "CREATE INDEX IF NOT EXISTS rfids_sponsor ON rfids (sponsor)",
+]
 
-def read_acl_data():
-    """ reads persistent acl data from the filesystem
+
+def read_acl_data(data_dir="data", database=None, snapshot=True):
+    """ reads persistent acl data from the filesystem, or from `database`
+    if it is set.  With `snapshot` on, the CSV files are read from their
+    snapshot when it is up to date, and it is rebuilt when it isn't.
     """
+    if database is not None:
+        return read_sqlite_acl_data(database)
+
+    sources, key = read_sources(data_dir)
+    if snapshot:
+        acl_data = read_snapshot(data_dir, key)
+        if acl_data is not None:
+            return acl_data
+
     hours = {}
     rfids = {}
 
-    with open("data/hours.csv", 'r') as f:
+    with io.TextIOWrapper(io.BytesIO(sources[0])) as f:
         hours_csv = csv.reader(f)
         next(hours_csv)  # drop header
         for row in hours_csv:
             hours[row.pop(0)] = row
 
-    with open("data/rfids.csv", 'r') as f:
+    with io.TextIOWrapper(io.BytesIO(sources[1])) as f:
         rfids_csv = csv.DictReader(f)
         for row in rfids_csv:
             rfids[row.pop('rfid')] = row
 
+    acl_data = {'hours': hours, 'rfids': rfids}
+    if snapshot:
+        write_snapshot(data_dir, key, acl_data)
+    return acl_data
+
+
+def read_sources(data_dir):
+    """ The contents of `ACL_FILES` in `data_dir`, and the key their
+    snapshot is kept under: the mtime and size of each, and a digest of
+    their contents.
+    """
+    sources, stats = [], []
+    digest = hashlib.blake2b(digest_size=32)
+    for name in ACL_FILES:
+        with open(os.path.join(data_dir, name), 'rb') as f:
+            st = os.fstat(f.fileno())
+            data = f.read()
+        sources.append(data)
+        stats += [st.st_mtime_ns, st.st_size]
+        digest.update(struct.pack("<q", len(data)))
+        digest.update(data)
+    return sources, (*stats, digest.digest())
+
+
+def read_snapshot(data_dir, key):
+    """ The ACL data in the snapshot in `data_dir` if it was made from the
+    files `key` describes, see `read_sources`, or None.
+
+    A snapshot is `SNAPSHOT_HEADER`, then the rfids column names, the
+    access levels and the cards, with every field in one UTF-8 string
+    separated by NULs, so it is decoded and split in two calls.
+    """
+    try:
+        with open(os.path.join(data_dir, SNAPSHOT_FILE), 'rb') as f:
+            data = f.read()
+        magic, *header = SNAPSHOT_HEADER.unpack_from(data)
+    except (OSError, struct.error):
+        return None
+    if magic != SNAPSHOT_MAGIC or tuple(header[:5]) != key:
+        return None
+
+    n_columns, n_hours, n_rfids = header[5:]
+    body = data[SNAPSHOT_HEADER.size:]
+    try:
+        fields = body.decode('utf-8').split('\0') if body else []
+    except UnicodeDecodeError:
+        return None
+    width = 1 + n_columns
+    if len(fields) != n_columns + 3 * n_hours + width * n_rfids:
+        return None
+
+    columns = fields[:n_columns]
+    levels = fields[n_columns:n_columns + 3 * n_hours]
+    cards = fields[n_columns + 3 * n_hours:]
+    hours = {name: [start_hour, end_hour] for name, start_hour, end_hour
+             in zip(levels[0::3], levels[1::3], levels[2::3])}
+    if columns == ['access_times', 'sponsor']:
+        rfids = {rfid: {'access_times': access_times, 'sponsor': sponsor}
+                 for rfid, access_times, sponsor
+                 in zip(cards[0::3], cards[1::3], cards[2::3])}
+    else:
+        rfids = {row[0]: dict(zip(columns, row[1:])) for row
+                 in zip(*(cards[i::width] for i in range(width)))}
     return {'hours': hours, 'rfids': rfids}
 
 
-def write_rfid_data(rfids):
-    """ writes the rfids.csv file in the data directory """
-    with open('data/rfids.csv', 'w') as csvfile:
+def write_snapshot(data_dir, key, acl_data):
+    """ Writes a snapshot of `acl_data`, read from the files `key`
+    describes, if it can be.  Data a snapshot can't hold exactly, and a
+    data directory which can't be written to, are passed over.
+    """
+    hours, rfids = acl_data['hours'], acl_data['rfids']
+    columns = list(next(iter(rfids.values()), {}))
+    fields = list(columns)
+    for name, allowed_hours in hours.items():
+        if len(allowed_hours) != 2:
+            return
+        fields += [name, *allowed_hours]
+    for rfid, rules in rfids.items():
+        if list(rules) != columns:
+            return
+        fields.append(rfid)
+        fields += rules.values()
+    if not all(isinstance(field, str) and '\0' not in field
+               for field in fields):
+        return
+
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, *key, len(columns),
+                                  len(hours), len(rfids))
+    path = os.path.join(data_dir, SNAPSHOT_FILE)
+    try:
+        with open(f"{path}.tmp", 'wb') as f:
+            f.write(header + '\0'.join(fields).encode('utf-8'))
+        os.replace(f"{path}.tmp", path)
+    except OSError:
+        pass
+
+
+def write_rfid_data(rfids, data_dir="data", database=None):
+    """ writes the rfids.csv file in the data directory, or the cards in
+    `database` if it is set
+    """
+    if database is not None:
+        with closing(connect(database)) as db, db:
+            replace_rfids(db, rfids)
+        return
+
+    with open(os.path.join(data_dir, 'rfids.csv'), 'w') as csvfile:
         writer = csv.writer(csvfile, delimiter=',',
                             quotechar='"', quoting=csv.QUOTE_MINIMAL)
         writer.writerow(['rfid', 'access_times', 'sponsor'])
@@ -33,13 +194,142 @@ def write_rfid_data(rfids):
                              rfids[rfid]['sponsor']])
 
 
-def write_hours_data(hours):
-    """ writes the hours.csv file in the data directory """
-    with open('data/hours.csv', 'w') as csvfile:
+def write_hours_data(hours, data_dir="data", database=None):
+    """ writes the hours.csv file in the data directory, or the access
+    levels in `database` if it is set
+    """
+    if database is not None:
+        with closing(connect(database)) as db, db:
+            replace_hours(db, hours)
+        return
+
+    with open(os.path.join(data_dir, 'hours.csv'), 'w') as csvfile:
         writer = csv.writer(csvfile, delimiter=',',
                             quotechar='"', quoting=csv.QUOTE_MINIMAL)
         writer.writerow(['name', 'start_hour', 'end_hour'])
         for level in hours:
-            writer.writerow(level,
-                            hours[level][0],
-                            hours[level][1])
+            writer.writerow([level,
+                             hours[level][0],
+                             hours[level][1]])
+
+
+def connect(database):
+    """ Opens the ACL database at `database`, creating its tables if it is
+    new.  Raises a ValueError for a database written by a newer schema.
+    """
+    db = sqlite3.connect(database, timeout=5)
+    try:
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        with db:
+            for statement in SCHEMA:
+                db.execute(statement)
+            row = db.execute("SELECT version FROM schema_version").fetchone()
+            if row is None:
+                db.execute("INSERT INTO schema_version VALUES (?)",
+                           (SCHEMA_VERSION,))
+            elif row[0] > SCHEMA_VERSION:
+                raise ValueError(f"ACL database {database} has schema "
+                                 f"{row[0]}, newer than {SCHEMA_VERSION}")
+    except Exception:
+        db.close()
+        raise
+    return db
+
+
+def read_sqlite_acl_data(database):
+    """ The ACL in `database`, in the shape of the CSV files' """
+    with closing(connect(database)) as db:
+        db.execute("BEGIN")  # one snapshot of both tables
+        hours = {name: [str(start_hour), str(end_hour)]
+                 for name, start_hour, end_hour in db.execute(
+                     "SELECT name, start_hour, end_hour FROM hours")}
+        rfids = {rfid: {'access_times': access_times, 'sponsor': sponsor}
+                 for rfid, access_times, sponsor in db.execute(
+                     "SELECT rfid, access_times, sponsor FROM rfids")}
+        db.rollback()
+    return {'hours': hours, 'rfids': rfids}
+
+
+def replace_hours(db, hours):
+    """ Makes the access levels in `db` those of `hours`, writing only the
+    rows which differ.
+    """
+    rows = {name: (int(start_hour), int(end_hour))
+            for name, (start_hour, end_hour) in hours.items()}
+    current = {name: (start_hour, end_hour)
+               for name, start_hour, end_hour in db.execute(
+                   "SELECT name, start_hour, end_hour FROM hours")}
+    db.executemany("DELETE FROM hours WHERE name = ?",
+                   [(name,) for name in current.keys() - rows.keys()])
+    db.executemany(
+        "INSERT INTO hours VALUES (?, ?, ?) ON CONFLICT (name) DO UPDATE"
+        " SET start_hour = excluded.start_hour, end_hour = excluded.end_hour",
+        [(name, *row) for name, row in rows.items()
+         if current.get(name) != row])
+
+
+def replace_rfids(db, rfids):
+    """ Makes the cards in `db` those of `rfids`, writing only the rows
+    which differ.
+    """
+    rows = {rfid: (rules['access_times'], rules.get('sponsor') or '')
+            for rfid, rules in rfids.items()}
+    current = {rfid: (access_times, sponsor)
+               for rfid, access_times, sponsor in db.execute(
+                   "SELECT rfid, access_times, sponsor FROM rfids")}
+    db.executemany("DELETE FROM rfids WHERE rfid = ?",
+                   [(rfid,) for rfid in current.keys() - rows.keys()])
+    db.executemany(
+        "INSERT INTO rfids VALUES (?, ?, ?) ON CONFLICT (rfid) DO UPDATE"
+        " SET access_times = excluded.access_times,"
+        " sponsor = excluded.sponsor",
+        [(rfid, *row) for rfid, row in rows.items()
+         if current.get(rfid) != row])
+
+
+def find_rfid(database, rfid):
+    """ The rules of the card `rfid` in `database`, or None """
+    with closing(connect(database)) as db:
+        row = db.execute(
+            "SELECT access_times, sponsor FROM rfids WHERE rfid = ?",
+            (rfid,)).fetchone()
+    if row is None:
+        return None
+    return {'access_times': row[0], 'sponsor': row[1]}
+
+
+def find_sponsored(database, sponsor):
+    """ The cards in `database` sponsored by `sponsor`, by rfid """
+    with closing(connect(database)) as db:
+        return {rfid: {'access_times': access_times, 'sponsor': sponsor}
+                for rfid, access_times in db.execute(
+                    "SELECT rfid, access_times FROM rfids"
+                    " WHERE sponsor = ?", (sponsor,))}
+
+
+def put_rfid(database, rfid, access_times, sponsor):
+    """ Adds or changes the card `rfid` in `database` """
+    with closing(connect(database)) as db, db:
+        db.execute(
+            "INSERT INTO rfids VALUES (?, ?, ?) ON CONFLICT (rfid) DO UPDATE"
+            " SET access_times = excluded.access_times,"
+            " sponsor = excluded.sponsor",
+            (rfid, access_times, sponsor))
+
+
+def delete_rfid(database, rfid):
+    """ Removes the card `rfid` from `database` """
+    with closing(connect(database)) as db, db:
+        db.execute("DELETE FROM rfids WHERE rfid = ?", (rfid,))
+
+
+def migrate_csv(data_dir, database):
+    """ Copies the ACL in the CSV files in `data_dir` into `database`, in
+    one transaction, returning the numbers of access levels and cards.
+    """
+    acl_data = read_acl_data(data_dir)
+    with closing(connect(database)) as db, db:
+        replace_hours(db, acl_data['hours'])
+        replace_rfids(db, acl_data['rfids'])
+    return len(acl_data['hours']), len(acl_data['rfids'])
@@ -0,0 +1,51 @@
+""" Event loop selection for the services.
+
+uvloop, a drop-in replacement for asyncio's event loop, is used when it is
+installed, unless `EVENT_LOOP` in the config says otherwise.  Services start
+their loop with `setup_event_loop` rather than `asyncio.get_event_loop`, and
+`Comms.start` logs which loop is running, see also `Comms.stats`.
+
+To compare the loops on a device, see `benchmarks/bench_loops.py`.
+"""
+import asyncio
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+EVENT_LOOPS = ("asyncio", "uvloop") if uvloop else ("asyncio",)
+
+
+def best_event_loop():
+    """ The fastest event loop installed """
+    return EVENT_LOOPS[-1]
+
+
+def new_event_loop(name=None):
+    """ Creates a new event loop by name, one of `EVENT_LOOPS`, or the
+    fastest installed if `name` is None, and sets it as the current loop.
+    """
+    name = name or best_event_loop()
+    if name not in EVENT_LOOPS:
+        raise ValueError(f"Event loop {name} is not installed")
+    if name == "uvloop":
+        loop = uvloop.new_event_loop()
+    else:
+        loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    return loop
+
+
+def event_loop_name(loop=None):
+    """ The name of `loop`, by default the running loop """
+    loop = loop or asyncio.get_running_loop()
+    if uvloop and isinstance(loop, uvloop.Loop):
+        return "uvloop"
+    return "asyncio"
+
+
+def setup_event_loop(config):
+    """ The event loop for a service, as chosen by `config.EVENT_LOOP` """
+    return new_event_loop(getattr(config, 'EVENT_LOOP', None))
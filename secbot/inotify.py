@@ -0,0 +1,85 @@
+""" Watches directories for changes with Linux's inotify, through ctypes so
+there is nothing to install.
+
+    inotify = Inotify()
+    inotify.add_watch("/run/queeriouslabs", IN_CLOSE_WRITE | IN_DELETE)
+    while True:
+        mask, name = await inotify.get()
+
+Events are read as the event loop sees the inotify file descriptor become
+readable, so waiting for a change costs nothing.  `AVAILABLE` is False where
+there is no inotify, e.g. on macOS, and users fall back to polling.
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED = 0x00008000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+EVENT = struct.Struct("iIII")  #: wd, mask, cookie, len, then the name
+
+try:
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    AVAILABLE = hasattr(libc, "inotify_init1")
+except OSError:
+    libc = None
+    AVAILABLE = False
+
+
+class Inotify:
+    """ An inotify instance, with its events put on `queue` as
+    `(mask, name)`, `name` being the file in the watched directory.
+    """
+    def __init__(self):
+        if not AVAILABLE:
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        self.queue = asyncio.Queue()
+        self.loop = asyncio.get_running_loop()
+        self.loop.add_reader(self.fd, self.read)
+
+    def add_watch(self, path, mask):
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        self.watches[wd] = path
+        return wd
+
+    def read(self):
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            self.queue.put_nowait((mask, os.fsdecode(name)))
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        if self.fd >= 0:
+            self.loop.remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = -1
@@ -0,0 +1,160 @@
+""" Lightweight instrumentation for `secbot.comms`.
+
+`Metrics` keeps counters, fixed-bucket histograms and gauges, each named by
+a `/` separated path, usually `<what>/<peer>/<message type>`, e.g.
+`request_rtt/authorizer/request`.  Recording is a dict lookup and an add, so
+it is always on.
+
+`snapshot` gathers everything into a `dict` which can be encoded as JSON,
+which is what a component's stats socket serves, see `Comms.start`.
+"""
+import asyncio
+from bisect import bisect_left
+import time
+
+
+#: Upper bounds, in seconds, of the latency histogram buckets.  A last
+#: bucket catches everything slower.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1, 2.5, 5)
+
+#: Upper bounds of the histogram buckets of batch sizes, in messages
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def message_type(msg):
+    """ Classifies a message as one of the shapes in `secbot/schema.py`, or
+    as a subscription change or heartbeat.
+    """
+    if 'event' in msg:
+        return "event"
+    if 'code' in msg:
+        return "response"
+    if 'permissions' in msg:
+        return "request"
+    if 'subscribe' in msg or 'unsubscribe' in msg:
+        return "subscribe"
+    if 'heartbeat' in msg:
+        return "heartbeat"
+    return "other"
+
+
+def quantile(histogram, q):
+    """ Estimates the `q` quantile of a `Histogram.snapshot` as the upper
+    bound of the bucket it falls in.  Returns `None` without observations,
+    and "inf" if it falls past the last bucket.
+    """
+    if not histogram['count']:
+        return None
+    rank = q * histogram['count']
+    seen = 0
+    for bound, count in histogram['buckets']:
+        seen += count
+        if seen >= rank:
+            return bound
+    return "inf"
+
+
+class Histogram:
+    """ Counts observations into fixed buckets, see `BUCKETS` """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        return quantile(self.snapshot(), q)
+
+    def snapshot(self):
+        bounds = [*self.buckets, "inf"]
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": [[b, c] for b, c in zip(bounds, self.counts)],
+        }
+
+
+class Metrics:
+    """ Counters, histograms and gauges for one component.
+
+    Gauges are functions, called for their current value at snapshot time,
+    e.g. `metrics.gauge("in_q", comms.in_q.qsize)`.
+
+    Peers name themselves in the messages they send, so names built from a
+    message's `source_id` go through `peer`, which keeps to `max_peers` of
+    them however many a peer makes up.
+    """
+    def __init__(self, buckets=BUCKETS, max_peers=64):
+        self.buckets = buckets
+        self.max_peers = max_peers
+        self.peers = set()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    def peer(self, name):
+        """ The peer `name` as it goes in metric names: itself for the first
+        `max_peers` names seen, and `other` for any after those.
+        """
+        if isinstance(name, str):
+            if name in self.peers:
+                return name
+            if len(self.peers) < self.max_peers:
+                self.peers.add(name)
+                return name
+        return "other"
+
+    def incr(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value, buckets=None):
+        """ Adds `value` to the histogram `name`, which is created with
+        `buckets`, by default the latency `BUCKETS`, on first use.
+        """
+        try:
+            self.histograms[name].observe(value)
+        except KeyError:
+            self.histograms[name] = Histogram(buckets or self.buckets)
+            self.histograms[name].observe(value)
+
+    def gauge(self, name, func):
+        self.gauges[name] = func
+
+    def snapshot(self):
+        return {
+            "started": self.started,
+            "uptime": time.time() - self.started,
+            "counters": dict(self.counters),
+            "gauges": {name: func() for name, func in self.gauges.items()},
+            "histograms": {name: hist.snapshot()
+                           for name, hist in self.histograms.items()},
+        }
+
+
+class MeteredQueue(asyncio.Queue):
+    """ An asyncio.Queue of messages which records, in `metrics`, how long
+    each message waited in the queue under
+    `<name>/<source_id>/<message type>`, see `Metrics.peer`.
+    """
+    def __init__(self, metrics, name, maxsize=0):
+        super().__init__(maxsize)
+        self.metrics = metrics
+        self.name = name
+
+    def _put(self, item):
+        super()._put((time.monotonic(), item))
+
+    def _get(self):
+        queued, item = super()._get()
+        self.metrics.observe(
+            f"{self.name}/{self.metrics.peer(item.get('source_id'))}/"
+            f"{message_type(item)}",
+            time.monotonic() - queued)
+        return item
@@ -9,12 +9,14 @@ passed in that protocol are validated by these schema.
 See the documentation for jsonschema to understand the syntax.
 
 nb(matt):
-    These are not used.  jsonschema is a reference,
-    but as it install rust for some dumb reason, and that
-    takes forever, I removed this functionality even as
-    the passed messages do conform to this schema.
+    jsonschema is a reference, but as it install rust for some dumb
+    reason, and that takes forever, the validators below are compiled
+    from these schema into plain python by `secbot.validation` instead.
+    They raise `secbot.validation.ValidationError`, a ValueError, and
+    return the message when it's valid.  Comms uses them when VALIDATE is
+    set in the config.
 """
-from jsonschema import validate
+from secbot.validation import compile_schema
 
 
 permission_schema = {
@@ -92,33 +94,17 @@ event_schema = {
 
     "type": "object",
     "properties": {
-        "src_id": {"type": "string"},
+        "source_id": {"type": "string"},
         "event": {"type": "string"},
         "context": {"type": "object"}
     },
-    "required": ["src_id", "event"]
+    "required": ["source_id", "event"]
 }
 
 
-def validate_permission(data):
-    validate(data, permission_schema)
-
-
-def validate_request(data):
-    validate(data, request_schema)
-
-
-def validate_grant(data):
-    validate(data, grant_schema)
-
-
-def validate_response(data):
-    validate(data, response_schema)
-
-
-def validate_error(data):
-    validate(data, error_schema)
-
-
-def validate_event(data):
-    validate(data, event_schema)
+validate_permission = compile_schema(permission_schema)
+validate_request = compile_schema(request_schema)
+validate_grant = compile_schema(grant_schema)
+validate_response = compile_schema(response_schema)
+validate_error = compile_schema(error_schema)
+validate_event = compile_schema(event_schema)
@@ -0,0 +1,92 @@
+""" End-to-end tracing of requests across components.
+
+A trace is carried in a message under `trace`, as
+`{"id": <hex>, "spans": [[name, service, start, end], ...]}`.  `start` and
+`end` are `time.time()` wall clock seconds, so spans recorded by different
+processes on the same device line up.
+
+Components forward the trace by copying it into the messages they send on,
+and each records its own spans with its `Tracer`, e.g.
+
+    with comms.tracer.span(req.get('trace'), "acl_lookup"):
+        ...
+
+A `None` trace records nothing, so code paths are the same whether or not
+tracing is on.  Traces a component is done with are kept in its ring buffer,
+which `dump` and `summary` report on, see `Comms.start_stats_server`.
+"""
+from collections import deque
+from contextlib import contextmanager
+import os
+import time
+
+
+def percentiles(values, qs=(0.5, 0.9, 0.99)):
+    """ Nearest rank percentiles of `values`, with the count and max """
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    summary = {"count": len(values), "max": values[-1]}
+    for q in qs:
+        rank = max(0, min(len(values) - 1, round(q * len(values)) - 1))
+        summary[f"p{q * 100:g}"] = values[rank]
+    return summary
+
+
+class Tracer:
+    """ Starts traces, records spans in them for `service`, and keeps the
+    last `size` finished traces.
+    """
+    def __init__(self, service, size=1024):
+        self.service = service
+        self.traces = deque(maxlen=size)
+
+    def start(self):
+        return {"id": os.urandom(8).hex(), "spans": []}
+
+    def record(self, trace, name, start, end=None):
+        """ Adds a span to `trace`, ending now unless `end` is given """
+        if trace is not None:
+            end = time.time() if end is None else end
+            trace['spans'].append([name, self.service, start, end])
+
+    @contextmanager
+    def span(self, trace, name):
+        """ Records the enclosed block as a span of `trace` """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(trace, name, start)
+
+    def finish(self, trace):
+        """ Keeps `trace` in the ring buffer, as a copy so later changes by
+        other components don't show up in it.
+        """
+        if trace is not None:
+            self.traces.append(
+                {"id": trace['id'], "spans": [*trace['spans']]})
+
+    def dump(self):
+        return list(self.traces)
+
+    def summary(self):
+        """ Percentiles, in seconds, of each span's duration by
+        `<service>/<name>`, and of each trace's `total` from the start of its
+        first span to the end of its last.
+        """
+        durations = {}
+        totals = []
+        for trace in self.traces:
+            if not trace['spans']:
+                continue
+            for name, service, start, end in trace['spans']:
+                durations.setdefault(f"{service}/{name}", []).append(
+                    end - start)
+            totals.append(max(span[3] for span in trace['spans'])
+                          - min(span[2] for span in trace['spans']))
+        return {
+            "total": percentiles(totals),
+            "spans": {name: percentiles(values)
+                      for name, values in durations.items()},
+        }
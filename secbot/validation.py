@@ -0,0 +1,179 @@
+""" Compiles the JSON Schema dicts of `secbot/schema.py` into plain Python
+validator functions, so messages can be validated without `jsonschema` and
+fast enough for every message.
+
+`compile_schema` writes the checks for a schema out as the source of one
+function, e.g. for `{"type": "object", "required": ["perm"], ...}`
+
+    def validate_permission(data):
+        if not isinstance(data, dict):
+            raise ValidationError(f"$: expected object")
+        if "perm" not in data:
+            raise ValidationError(f"$: missing 'perm'")
+        ...
+        return data
+
+and has Python compile it.  The source is kept on the function as `source`.
+
+Only the keywords the schemas use, and a few simple ones alongside, are
+supported.  Anything else raises a ValueError when compiling rather than
+being silently ignored.
+"""
+
+
+class ValidationError(ValueError):
+    """ A message does not match its schema """
+
+
+TYPE_CHECKS = {
+    "object": "isinstance({v}, dict)",
+    "array": "isinstance({v}, list)",
+    "string": "isinstance({v}, str)",
+    "integer": "type({v}) is int",
+    "number": "type({v}) in (int, float)",
+    "boolean": "type({v}) is bool",
+    "null": "{v} is None",
+}
+
+SUPPORTED = {"$id", "$schema", "title", "description", "type", "properties",
+             "required", "additionalProperties", "items", "minItems",
+             "maxItems", "enum", "minContains", "maxContains"}
+
+
+class Generator:
+    """ Writes out the lines of a validator function """
+    def __init__(self):
+        self.lines = []
+        self.constants = {}
+        self.names = 0
+
+    def name(self, prefix):
+        self.names += 1
+        return f"{prefix}{self.names}"
+
+    def constant(self, value):
+        name = self.name("_c")
+        self.constants[name] = value
+        return name
+
+    def emit(self, line, depth):
+        self.lines.append("    " * depth + line)
+
+    def fail(self, path, message, depth):
+        self.emit(f"raise ValidationError(f{path + ': ' + message!r})", depth)
+
+    def schema(self, schema, v, path, depth):
+        """ Writes the checks of `schema` for the value named `v`, found at
+        `path` in the message.  `path` is the text of an f-string.
+        """
+        unknown = set(schema) - SUPPORTED
+        if unknown or "contains" in schema:
+            raise ValueError(
+                f"Unsupported schema keywords at {path}: {sorted(unknown)}")
+
+        types = schema.get("type")
+        if types is not None:
+            types = [types] if isinstance(types, str) else types
+            check = " or ".join(
+                TYPE_CHECKS[t].format(v=v) for t in types)
+            if len(types) > 1:
+                check = f"({check})"
+            self.emit(f"if not {check}:", depth)
+            self.fail(path, f"expected {' or '.join(types)}", depth + 1)
+
+        if "enum" in schema:
+            self.emit(f"if {v} not in {self.constant(schema['enum'])}:",
+                      depth)
+            self.fail(path, "not one of the allowed values", depth + 1)
+
+        if any(k in schema for k in ("required", "properties",
+                                     "additionalProperties")):
+            self.object(schema, v, path, depth, types == ["object"])
+
+        if any(k in schema for k in ("items", "minItems", "maxItems")):
+            self.array(schema, v, path, depth, types == ["array"])
+
+    def object(self, schema, v, path, depth, checked):
+        """ `checked` is True when `v` is already known to be a dict """
+        if not checked:
+            self.emit(f"if isinstance({v}, dict):", depth)
+            depth += 1
+
+        required = schema.get("required", [])
+        for key in required:
+            self.emit(f"if {key!r} not in {v}:", depth)
+            self.fail(path, f"missing {key!r}", depth + 1)
+
+        properties = schema.get("properties", {})
+        for key, subschema in properties.items():
+            sub = self.name("v")
+            subpath = f"{path}.{escape(key)}"
+            start = len(self.lines)
+            if key in required:
+                self.emit(f"{sub} = {v}[{key!r}]", depth)
+                self.schema(subschema, sub, subpath, depth)
+            else:
+                self.emit(f"if {key!r} in {v}:", depth)
+                self.emit(f"{sub} = {v}[{key!r}]", depth + 1)
+                self.schema(subschema, sub, subpath, depth + 1)
+            if len(self.lines) == start + 1 + (key not in required):
+                del self.lines[start:]  # nothing to check beyond presence
+
+        if schema.get("additionalProperties") is False:
+            allowed = self.constant(frozenset(properties))
+            self.emit(f"for {(k := self.name('k'))} in {v}:", depth)
+            self.emit(f"if {k} not in {allowed}:", depth + 1)
+            self.fail(path, f"unexpected {{{k}!r}}", depth + 2)
+        elif isinstance(schema.get("additionalProperties"), dict):
+            raise ValueError(
+                f"Unsupported schema keywords at {path}: "
+                "['additionalProperties']")
+
+    def array(self, schema, v, path, depth, checked):
+        """ `checked` is True when `v` is already known to be a list """
+        if not checked:
+            self.emit(f"if isinstance({v}, list):", depth)
+            depth += 1
+
+        if "minItems" in schema:
+            self.emit(f"if len({v}) < {int(schema['minItems'])}:", depth)
+            self.fail(path, f"fewer than {schema['minItems']} items",
+                      depth + 1)
+        if "maxItems" in schema:
+            self.emit(f"if len({v}) > {int(schema['maxItems'])}:", depth)
+            self.fail(path, f"more than {schema['maxItems']} items",
+                      depth + 1)
+
+        if "items" in schema:
+            i, item = self.name("i"), self.name("v")
+            self.emit(f"for {i}, {item} in enumerate({v}):", depth)
+            start = len(self.lines)
+            self.schema(schema["items"], item, f"{path}[{{{i}}}]", depth + 1)
+            if len(self.lines) == start:
+                self.lines.pop()
+
+
+def escape(text):
+    """ Escapes `text` for the static part of an f-string """
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def compile_schema(schema, name=None):
+    """ Compiles `schema` into a function which returns the message it is
+    given if it matches, and raises `ValidationError` if not.
+
+    The function is named `validate_<name>`, by default from the last part
+    of the schema's `$id`.
+    """
+    name = name or schema["$id"].rstrip("/").rsplit("/", 1)[-1]
+    generator = Generator()
+    generator.schema(schema, "data", "$", 1)
+    source = "\n".join([f"def validate_{name}(data):",
+                        *generator.lines,
+                        "    return data", ""])
+
+    namespace = {"ValidationError": ValidationError, **generator.constants}
+    exec(compile(source, f"<schema {name}>", "exec"), namespace)
+    validator = namespace[f"validate_{name}"]
+    validator.source = source
+    return validator
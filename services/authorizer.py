@@ -1,9 +1,24 @@
 import os
 import asyncio
+import csv
+import sqlite3
+import time
 from copy import deepcopy
 from datetime import datetime
-from secbot.comms import create_comms
-from secbot.database import read_acl_data
+from secbot.acl import (
+    AccessList,
+    diff,
+)
+from secbot.comms import (
+    create_comms,
+    RequestTimeout,
+)
+from secbot.database import (
+    ACL_FILES,
+    read_acl_data,
+)
+from secbot.eventloop import setup_event_loop
+from secbot import inotify
 
 
 class Authorizer:
@@ -11,23 +26,188 @@ class Authorizer:
     def __init__(self, config):
         self.name = "authorizer"
         self.comms = create_comms(self.name, config)
-        self.hours = None
-        self.rfids = None
+        self.data_dir = getattr(config, 'ACL_DATA_DIR', "data")
+        self.database = getattr(config, 'ACL_DATABASE', None)
+        self.watch_acl = getattr(config, 'ACL_WATCH', True)
+        self.reload_delay = getattr(config, 'ACL_RELOAD_DELAY', 0.5)
+        self.acl = None
+        self.reload_lock = asyncio.Lock()
         self.authorities = ['/open']
         self.load_acl_data()
 
+    @property
+    def hours(self):
+        return self.acl.hours
+
+    @property
+    def rfids(self):
+        return self.acl.rfids
+
+    def compile_acl_data(self):
+        """ Reads the access control data, compiled for `lookup`, see
+        `AccessList`.
+        """
+        new_data = read_acl_data(self.data_dir, self.database)
+        return AccessList(new_data['hours'], new_data['rfids'])
+
+    def read_acl_changes(self, hours, rfids):
+        """ Reads the access control data, returning its changes from the
+        data `hours` and `rfids`, see `AccessList.changes`.  Run in a thread,
+        so these must be copies the event loop won't change meanwhile.
+        """
+        new_data = read_acl_data(self.data_dir, self.database)
+        return (diff(hours, new_data['hours']),
+                diff(rfids, new_data['rfids']))
+
     def load_acl_data(self):
         """ Load or reload the access control data """
-        new_data = read_acl_data()
-        self.hours = new_data['hours']
-        self.rfids = new_data['rfids']
+        if self.acl is None:
+            self.set_acl(self.compile_acl_data())
+            return
+        start = time.perf_counter()
+        changes = self.read_acl_changes(self.acl.hours, self.acl.rfids)
+        self.update_acl(changes, start)
+
+    def set_acl(self, acl):
+        """ Swaps in the compiled ACL `acl`.  `hours`, `rfids` and the masks
+        `lookup` uses all come from the one object, so a lookup sees either
+        the old ACL or the new one, never parts of both.
+        """
+        self.acl = acl
+        for reason in acl.invalid.values():
+            self.comms.logger.warning(reason)
+
+    def update_acl(self, changes, start):
+        """ Applies `changes` to the ACL in place, logging what changed and
+        how long the reload took since `start`.  Lookups run on the event
+        loop too, so they see the ACL before or after, never during.
+        """
+        hours, rfids = changes
+        delta = self.acl.update(hours, rfids)
+        for kind, keys in delta.items():
+            for change, changed in keys.items():
+                for key in changed:
+                    self.comms.logger.info(f"ACL {kind} {change}: {key}")
+        for key in (*hours, *rfids):
+            if key in self.acl.invalid:
+                self.comms.logger.warning(self.acl.invalid[key])
+        summary = "; ".join(
+            f"{kind} " + ", ".join(f"{len(changed)} {change}"
+                                   for change, changed in keys.items())
+            for kind, keys in delta.items())
+        elapsed = (time.perf_counter() - start) * 1e3
+        self.comms.logger.warning(
+            f"Reloaded ACL data in {elapsed:.1f} ms, {len(self.acl)} cards,"
+            f" {summary}")
+
+    async def reload_acl_data(self):
+        """ Reloads the access control data, reading the files and finding
+        what changed in a thread so requests are still served while large
+        files are read.  The current ACL is kept if the files can't be read.
+
+        Reloads, by the watcher or by `/reload`, run one at a time, so each
+        diffs against the ACL the one before it left.
+        """
+        async with self.reload_lock:
+            start = time.perf_counter()
+            acl = self.acl
+            loop = asyncio.get_running_loop()
+            try:
+                changes = await loop.run_in_executor(
+                    None, self.read_acl_changes,
+                    dict(acl.hours), dict(acl.rfids))
+            except (OSError, ValueError, KeyError, IndexError, csv.Error,
+                    sqlite3.Error) as e:
+                self.comms.logger.error(f"Keeping the current ACL data: {e}")
+                return False
+            self.update_acl(changes, start)
+            return True
+
+    async def try_reload_acl_data(self):
+        """ `reload_acl_data` for the watchers, which log any error they
+        didn't expect and keep watching.
+        """
+        try:
+            await self.reload_acl_data()
+        except Exception as e:
+            self.comms.logger.error(f"Reloading ACL data failed: {e}")
+
+    def acl_files(self):
+        """ The files the access control data is read from: `ACL_FILES` in
+        `data_dir`, or the database and its write-ahead log.
+        """
+        if self.database:
+            return [self.database, f"{self.database}-wal"]
+        return [os.path.join(self.data_dir, name) for name in ACL_FILES]
+
+    async def watch_acl_data(self):
+        """ Reloads the access control data when its files change, e.g.
+        when edited by hand, once their directory has been quiet for
+        `reload_delay` seconds, so a burst of writes reloads once.
+
+        Where there is no inotify the files are polled every `reload_delay`
+        seconds instead.
+        """
+        if not inotify.AVAILABLE:
+            return await self.poll_acl_data()
+
+        files = self.acl_files()
+        names = {os.path.basename(path) for path in files}
+        mask = inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO
+        if self.database:
+            # SQLite keeps the log open while writing, and closes the
+            # database after reads as if written, so only writes count
+            mask = inotify.IN_MODIFY | inotify.IN_MOVED_TO
+        watcher = inotify.Inotify()
+        try:
+            watcher.add_watch(os.path.dirname(files[0]) or ".", mask)
+        except OSError as e:
+            watcher.close()
+            self.comms.logger.error(f"Not watching ACL data: {e}")
+            return
+        try:
+            while True:
+                mask, name = await watcher.get()
+                if name not in names:
+                    continue
+                while True:
+                    try:
+                        await asyncio.wait_for(watcher.get(),
+                                               self.reload_delay)
+                    except asyncio.TimeoutError:
+                        break
+                await self.try_reload_acl_data()
+        finally:
+            watcher.close()
+
+    def acl_stamp(self):
+        stamp = []
+        for path in self.acl_files():
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamp.append(None)
+        return stamp
+
+    async def poll_acl_data(self):
+        """ Reloads once a change to the files has held for a poll """
+        last = current = self.acl_stamp()
+        while True:
+            await asyncio.sleep(self.reload_delay)
+            stamp = self.acl_stamp()
+            if stamp == last and stamp != current:
+                current = stamp
+                await self.try_reload_acl_data()
+            last = stamp
 
     def command_handler(self, request):
         commands = request.pop('permissions')
         for cmd in commands:
             if cmd.get('perm') == '/reload':
-                self.load_acl_data()
                 self.comms.logger.warning("Reloading ACL data")
+                self.comms.tasks['acl_reload'] = asyncio.create_task(
+                    self.try_reload_acl_data())
 
     def lookup(self, permission, ctx):
         """ Looks up the requested permission using data in the provided
@@ -36,24 +216,10 @@ class Authorizer:
         if "identity" not in ctx:
             raise ValueError("Request Missing Identity")
 
-        # Check that the requested ID is in the known RFIDs
         identity = ctx.pop('identity')
         self.comms.logger.info(f"attempt for: {identity}")
-        if identity not in self.rfids:
-            return False
-
-        # If RFID is known, check access rules
-        rules = self.rfids[identity]
-        allowed_hours = self.hours[rules['access_times']]
-        start_time, end_time = map(int, allowed_hours)
-        this_hour = datetime.now().hour  # local time, not UTC
-        # this_hour is before the endtime since end_time is the label of the
-        # hour a user should not have access.
-        if ((start_time <= this_hour) and (this_hour < end_time)):
-            return True
-
-        # attempted access outside allowed rules
-        return False
+        # unknown cards, and known ones outside their hours, are refused
+        return self.acl.allowed(identity, datetime.now().hour)  # local time
 
     def grant_permissions(self, request):
 
@@ -73,6 +239,9 @@ class Authorizer:
     async def process(self):
 
         self.comms.start()
+        if self.watch_acl:
+            self.comms.tasks['acl_watcher'] = asyncio.create_task(
+                self.watch_acl_data())
 
         while True:
             request = await self.comms.in_q.get()
@@ -81,6 +250,7 @@ class Authorizer:
             response['code'] = 0
             response['msg'] = "OK"
             response.pop('permissions')
+            response.pop('trace', None)
             await self.comms.out_q.put(response)
 
             target_id = request['target_id']
@@ -92,11 +262,18 @@ class Authorizer:
 
             req_grant = deepcopy(request)
 
+            trace = req_grant.get('trace')
+
             if target_id == 'front_door_latch':
-                self.grant_permissions(req_grant)
+                with self.comms.tracer.span(trace, "acl_lookup"):
+                    self.grant_permissions(req_grant)
 
-            self.comms.logger.debug(f"sent request: {req_grant}")
-            await self.comms.request(target_id, req_grant)
+            self.comms.logger.debug("sent request: %s", req_grant)
+            try:
+                await self.comms.request(target_id, req_grant)
+            except (OSError, RequestTimeout) as e:
+                self.comms.logger.error(f"Request to {target_id} failed: {e}")
+            self.comms.tracer.finish(trace)
 
 
 if __name__ == "__main__":
@@ -107,6 +284,5 @@ if __name__ == "__main__":
         from settings import Config as config
 
     auth = Authorizer(config)
-    loop = asyncio.get_event_loop()
-    loop.create_task(auth.process())
-    loop.run_forever()
+    loop = setup_event_loop(config)
+    loop.run_until_complete(auth.comms.serve(auth.process()))
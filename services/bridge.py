@@ -0,0 +1,102 @@
+""" The bridge lets components on this device reach components on other
+devices without knowing they are remote.
+
+For each name in the `BRIDGES` config, e.g.
+
+    BRIDGES = {"authorizer": ("10.0.0.10", 9100)}
+
+the bridge listens on the local `<socket_root>/authorizer.sock` and forwards
+everything it receives over TCP (TLS if configured) to the authorizer on the
+other device, which listens via its `TCP_ADDRESS`.  Responses come back the
+same way to the local component which made the request.
+
+This lets one authorizer serve readers and latches on several Pis, each
+of which only runs its reader or latch plus a bridge.
+
+Each link is named `bridge:<name>`, for its logs and stats, rather than
+taking the name of the component it forwards to, and doesn't announce
+itself or heartbeat that component's peers.  At most `BRIDGE_IN_FLIGHT`
+requests per link are forwarded at once, the rest wait their turn.
+
+Start this component from the command-line like:
+    `$ python bridge.py`
+"""
+import asyncio
+import os
+from secbot.comms import (
+    create_comms,
+    RequestTimeout,
+)
+from secbot.eventloop import setup_event_loop
+
+
+class Bridge:
+
+    def __init__(self, config):
+        self.links = []
+        self.in_flight = getattr(config, 'BRIDGE_IN_FLIGHT', 64)
+        for name, address in config.BRIDGES.items():
+            comms = create_comms(f"bridge:{name}", config)
+            comms.address = name
+            comms.announcing = False
+            comms.heartbeat_peers = []
+            comms.routes[name] = tuple(address)
+            self.links.append(comms)
+
+    async def forward(self, comms, req):
+        """ Forwards one request to the remote component and the response
+        back to the local client.  Requests without a `request_id` don't
+        expect a response.
+        """
+        name = comms.address
+        request_id = req.pop('request_id', None)
+        try:
+            if request_id is None:
+                await comms.request(name, req, False)
+                return
+            resp = await comms.request(name, req)
+        except (OSError, RequestTimeout) as e:
+            comms.logger.error(f"Forwarding to {name} failed: {e}")
+            if request_id is None:
+                return
+            resp = {
+                "source_id": req.get('source_id'),
+                "target_id": name,
+                "code": 1,
+                "msg": f"{e}"}
+
+        resp['request_id'] = request_id
+        await comms.out_q.put(resp)
+
+    async def link(self, comms):
+        comms.start()
+        comms.logger.info(
+            f"Bridging {comms.address} to {comms.routes[comms.address]}")
+        in_flight = asyncio.Semaphore(self.in_flight)
+
+        async def forward(req):
+            try:
+                await self.forward(comms, req)
+            finally:
+                in_flight.release()
+
+        while True:
+            await in_flight.acquire()
+            req = await comms.in_q.get()
+            asyncio.create_task(forward(req))
+
+    async def process(self):
+        await asyncio.gather(*[comms.serve(self.link(comms))
+                               for comms in self.links])
+
+
+if __name__ == "__main__":
+    config = None
+    if os.environ.get('QUEERIOUSLABS_ENV', None) == 'PROD':
+        from settings import ProdConfig as config
+    else:
+        from settings import Config as config
+
+    bridge = Bridge(config)
+    loop = setup_event_loop(config)
+    loop.run_until_complete(bridge.process())
@@ -19,11 +19,19 @@ service using the broadcast_client.py:
 The messages will be echoed to the TCP client throught he broadcast service.
 Any tcp client which can access the service can connect to receive broadcast
 messages.
+
+The health of the components the service watches, see HEARTBEAT_PEERS in
+settings.py, is broadcast too, as `/health/<name>/up` and
+`/health/<name>/down` events when it changes.
 '''
 import asyncio
-import json
 import os
-from secbot.comms import create_comms
+from secbot.comms import (
+    create_comms,
+    json_codec,
+)
+from secbot.eventloop import setup_event_loop
+from secbot.metrics import BATCH_BUCKETS
 
 
 MAX_EXTERNAL_CLIENTS = 20  # lmao max clients
@@ -33,6 +41,8 @@ async def process(comms_config):
 
     comms = create_comms("broadcast", comms_config)
     comms.start()
+    # health changes of the peers it watches go out to clients too
+    comms.subscribe("/health/*", comms.in_q)
 
     clients = []
 
@@ -54,28 +64,42 @@ async def process(comms_config):
 
     asyncio.create_task(asyncio.start_server(on_connect, '0.0.0.0', 8080))
 
-    # Broadcasting is one way, from this device out to cliends.  Never
-    # read from a client, they are awful, awful people with bad breath
-    while True:
-        data = await comms.in_q.get()
-        comms.logger.debug(f"{__file__}: Got data: {data}")
-        good = []
-        while clients:
-            reader, writer = clients.pop()
-            comms.logger.debug(f"{__file__}: sending to client")
-            try:
-                msg = json.dumps(data)
-                writer.write(msg.encode('utf-8') + b'\r\n')
-                await writer.drain()
-                good.append((reader, writer))
-            except ConnectionError:
-                writer.close()
-            except Exception as e:
-                comms.logger.debug(e)
-                writer.close()
-                await writer.wait_closed()
-
-        clients = good  # This '''pattern''' drops disconnected cliends
+    async def relay():
+        nonlocal clients
+        # Broadcasting is one way, from this device out to cliends.  Never
+        # read from a client, they are awful, awful people with bad breath
+        while True:
+            # a burst of events goes out in one write per client
+            batch = [await comms.in_q.get()]
+            while not comms.in_q.empty():
+                batch.append(comms.in_q.get_nowait())
+            comms.logger.debug("%s: Got data: %s", __file__, batch)
+            comms.metrics.observe("write_batch/broadcast", len(batch),
+                                  BATCH_BUCKETS)
+            msg = b''.join(json_codec().dumps(data) + b'\r\n'  # encoded once
+                           for data in batch)
+            good = []
+            while clients:
+                reader, writer = clients.pop()
+                comms.logger.debug("%s: sending to client", __file__)
+                try:
+                    writer.write(msg)
+                    await writer.drain()
+                    good.append((reader, writer))
+                except ConnectionError:
+                    writer.close()
+                except Exception as e:
+                    comms.logger.debug(e)
+                    writer.close()
+                    await writer.wait_closed()
+
+            clients = good  # This '''pattern''' drops disconnected cliends
+
+    try:
+        await comms.serve(relay())
+    finally:
+        # cancelled, e.g. by services/embedded.py, without shutting down
+        comms.stop()
 
 
 if __name__ == "__main__":
@@ -85,6 +109,5 @@ if __name__ == "__main__":
     else:
         from settings import Config as config
 
-    loop = asyncio.get_event_loop()
-    loop.create_task(process(config))
-    loop.run_forever()
+    loop = setup_event_loop(config)
+    loop.run_until_complete(process(config))
@@ -0,0 +1,98 @@
+""" Runs the front door's broadcast, latch, authorizer and rfid reader
+services as tasks in one process and one event loop, instead of one process
+each.
+
+The services talk over an in-memory transport (see `secbot.comms.MemoryHub`)
+which hands message objects between them directly, so a scan reaches the
+latch without any socket or JSON in between.  Each service still listens on
+its usual socket, so the TUI and unlock CLI work as before.
+
+If any service fails, the others are shut down and the process exits with
+an error, for systemd to restart the lot.  SIGTERM shuts them all down, see
+`Comms.shutdown`, and the process exits cleanly.  The separate services and their systemd units
+are unchanged and remain the default.
+
+Start this component from the command-line like:
+    `$ python embedded.py`
+"""
+import asyncio
+import logging
+import os
+import sys
+from secbot.comms import (
+    Comms,
+    MemoryHub,
+)
+from secbot.eventloop import setup_event_loop
+from authorizer import Authorizer
+from latch import (
+    RELAY,
+    Relay,
+)
+from rfid_reader import (
+    LABELS,
+    RfidReader,
+)
+import broadcast
+
+
+def embedded_config(config):
+    """ Extends `config` with a MemoryHub shared by all the services """
+    class EmbeddedConfig(config):
+        MEMORY_HUB = MemoryHub()
+
+    return EmbeddedConfig
+
+
+async def supervise(config, labels=LABELS):
+    """ Starts the services in dependency order, so each is in the hub
+    before anything connects to it, then waits for any of them to fail or
+    be shut down.  Returns True if a service failed.
+    """
+    logger = logging.getLogger("embedded")
+    latch = Relay("front_door_latch", config)
+    authorizer = Authorizer(config)
+    reader = RfidReader("front_door_rfid", labels, config)
+
+    services = {
+        "broadcast": broadcast.process(config),
+        "front_door_latch": latch.process(),
+        "authorizer": authorizer.process(),
+        "front_door_rfid": reader.process(),
+    }
+    tasks = {}
+    for name, coro in services.items():
+        tasks[asyncio.create_task(coro)] = name
+        await asyncio.sleep(0)
+    for comms in (latch.comms, authorizer.comms):
+        waiter = asyncio.create_task(comms.stopped.wait())
+        tasks[waiter] = f"{comms.name} comms"
+
+    done, pending = await asyncio.wait(
+        tasks, return_when=asyncio.FIRST_COMPLETED)
+    failed = False
+    for task in done:
+        if not task.cancelled() and task.exception():
+            logger.error(f"{tasks[task]} failed: {task.exception()!r}")
+            failed = True
+        else:
+            logger.warning(f"{tasks[task]} stopped")
+    await asyncio.gather(*[
+        comms.shutdown() for comms in
+        {latch.comms, authorizer.comms, reader.comms, *Comms.running}])
+    for task in pending:
+        task.cancel()
+    return failed
+
+
+if __name__ == "__main__":
+    config = None
+    if os.environ.get('QUEERIOUSLABS_ENV', None) == 'PROD':
+        from settings import ProdConfig as config
+    else:
+        from settings import Config as config
+
+    loop = setup_event_loop(config)
+    failed = loop.run_until_complete(supervise(embedded_config(config)))
+    RELAY.off()  # uhh...just in case an error occurred
+    sys.exit(1 if failed else 0)
@@ -33,6 +33,7 @@ import os
 import time
 from gpiozero import LED
 from secbot.comms import create_comms
+from secbot.eventloop import setup_event_loop
 
 RELAY = LED(23)
 
@@ -51,33 +52,23 @@ class Relay:
     async def cooldown(self):
         ''' If the latch is hot, waits for 3s before setting it to cool '''
         if not self.cool.is_set():
-            asyncio.create_task(
-                self.comms.request("broadcast",
-                                   {"source_id": "front_door_latch",
-                                    "event": "/front_door/cooling"},
-                                   False))
+            self.comms.publish("/front_door/cooling")
             await asyncio.sleep(3)  # cooldown time
             self.cool.set()         # latch is cool
-            asyncio.create_task(
-                self.comms.request("broadcast",
-                                   {"source_id": "front_door_latch",
-                                    "event": "/front_door/ready"},
-                                   False))
+            self.comms.publish("/front_door/ready")
 
-    def relay_on(self):
+    def relay_on(self, trace=None):
         ''' handles opening the actual relay via piplates.  Sets the
-        latch status to 'hot' by clearing the cool event.
+        latch status to 'hot' by clearing the cool event.  The relay call is
+        recorded as the `relay_on` span of `trace`.
         '''
 
         self.comms.logger.info("Unlocking Front Door")
-        RELAY.on()
+        with self.comms.tracer.span(trace, "relay_on"):
+            RELAY.on()
         self.cool.clear()  # relay is hot
         self.open.set()    # latch is open
-        asyncio.create_task(
-            self.comms.request("broadcast",
-                               {"source_id": "front_door_latch",
-                                "event": "/front_door/open"},
-                               False))
+        self.comms.publish("/front_door/open")
 
     def relay_off(self):
         ''' closes the relay, clearing the open event, and creating the
@@ -91,14 +82,11 @@ class Relay:
         ''' request to open was denied by authorizer, but we will broadcast
         the event from here '''
         self.comms.logger.info("Broadcasting relay denial")
-        asyncio.create_task(
-            self.comms.request("broadcast",
-                               {"source_id": "front_door_latch",
-                                "event": "/front_door/denied"},
-                               False))
-    async def unlock(self):
+        self.comms.publish("/front_door/denied")
+    async def unlock(self, trace=None):
         ''' Task to open the lock via the relay, then close the relay
-        after a 3s delay.
+        after a 3s delay.  `trace` is the trace of the request, if any,
+        which is finished once the relay is on.
 
         If the relay doesn't open after 1s, however, the relay is
         failed, which sets the "relay_failed" event and exits the
@@ -108,7 +96,8 @@ class Relay:
         cooldown_marker = time.time()  #: Track waiting time for relay to open
         while not self.open.is_set():
             try:
-                self.relay_on()
+                self.relay_on(trace)
+                self.comms.tracer.finish(trace)
                 break
             except AssertionError:
                 self.comms.logger.warning("Relay is missing")
@@ -127,21 +116,23 @@ class Relay:
         incoming request.  If the latch is open, ignore the request.  If the
         latch is cooling down, wait, then process the request for the
         correct permissions.
+
+        Latch events are published on `/front_door/*` to subscribers, and
+        forwarded to the broadcast service for its TCP clients.
         '''
         self.comms.start()
-        await self.comms.request(
-            "broadcast",
-            {"source_id": "front_door_latch",
-             "event": "/front_door/ready"}, False)
+        self.comms.forward_events("broadcast", "/front_door/*")
+        self.comms.publish("/front_door/ready")
 
         while not self.failed.is_set():
             req = await self.comms.in_q.get()
-            self.comms.logger.debug(f"got req: {req}")
+            self.comms.logger.debug("got req: %s", req)
             # send off response
             resp = deepcopy(req)
             resp.pop('permissions')
             resp['code'] = 0
             resp['msg'] = "OK"
+            resp.pop('trace', None)
             await self.comms.out_q.put(resp)
             self.comms.logger.debug("sending response")
 
@@ -159,9 +150,10 @@ class Relay:
                 # only need to handle the first grant to open door
                 if (perm['perm'] == "/open"):
                     if perm['grant']:
-                        asyncio.create_task(self.unlock())
+                        asyncio.create_task(self.unlock(req.get('trace')))
                     else:
                         self.deny()
+                        self.comms.tracer.finish(req.get('trace'))
                     break  # break for loop, only need first open perm
 
 
@@ -172,6 +164,6 @@ if __name__ == "__main__":
     else:
         from settings import Config as config
     front_door = Relay("front_door_latch", config)
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(front_door.process())
+    loop = setup_event_loop(config)
+    loop.run_until_complete(front_door.comms.serve(front_door.process()))
     RELAY.off()  # uhh...just in case an error occurred
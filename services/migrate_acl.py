@@ -0,0 +1,33 @@
+""" Copies the ACL from the CSV files in ACL_DATA_DIR into a SQLite
+database, see `secbot/database.py`.
+
+Run from the repository root like:
+    `$ python services/migrate_acl.py [database]`
+
+The database defaults to ACL_DATABASE, or `acl.sqlite3` in ACL_DATA_DIR.
+Running it again copies the CSV files over the database, writing only the
+rows which differ.  Set ACL_DATABASE in `services/settings.py` and restart
+the authorizer to switch to the database.
+"""
+import os
+import sys
+from secbot.database import migrate_csv
+
+
+def main(config, database=None):
+    data_dir = getattr(config, 'ACL_DATA_DIR', "data")
+    database = database or getattr(config, 'ACL_DATABASE', None) \
+        or os.path.join(data_dir, "acl.sqlite3")
+    levels, cards = migrate_csv(data_dir, database)
+    print(f"Copied {levels} access levels and {cards} cards from {data_dir}"
+          f" to {database}")
+
+
+if __name__ == "__main__":
+    config = None
+    if os.environ.get('QUEERIOUSLABS_ENV', None) == 'PROD':
+        from settings import ProdConfig as config
+    else:
+        from settings import Config as config
+
+    main(config, *sys.argv[1:2])
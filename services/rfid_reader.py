@@ -16,7 +16,17 @@ to fit the input criteria, storing key values until return is detected.
 import asyncio
 import evdev
 import os
-from secbot.comms import create_comms
+from secbot.comms import (
+    create_comms,
+    RequestTimeout,
+)
+from secbot.eventloop import (
+    event_loop_name,
+    setup_event_loop,
+)
+
+
+LABELS = ["Barcode Reader ", "HID 13ba:0018", "HID 413d:2107"]
 
 
 def make_request(source_id, identifier):
@@ -73,13 +83,29 @@ class RfidReader:
 
         When enter is found, the string is assemled and sent to the
         `authorizer` component with a permission request to open the front
-        door.
-        """
-        keys = []
+        door.  The latency budget for that hop is REQUEST_TIMEOUTS in the
+        config, so a stuck authorizer can't stop later scans being read.
+
+        With tracing on, the request starts a trace with an `enter` span
+        from the Enter key's event time to sending the request.
 
+        The authorizer is watched with heartbeats, see `Comms.watch`, so
+        its connection is already open when a card is scanned.
+
+        The reader serves no requests, but does serve its metrics and
+        traces at `<name>.stats.sock`, see `Comms.start_stats`.
+        """
         if not self.dev:
             raise ValueError(f"Missing device for {self.name}")
 
+        self.comms.logger.info(
+            f"Running on the {event_loop_name()} event loop")
+        self.comms.start_stats()
+        self.comms.watch_peers()
+        if self.comms.discovery:
+            self.comms.discover()
+        keys = []
+
         async for ev in self.dev.async_read_loop():
             if ev.type != evdev.ecodes.EV_KEY or ev.value != 0:
                 continue
@@ -87,20 +113,23 @@ class RfidReader:
             if ev.code != evdev.ecodes.KEY_ENTER:
                 c = evdev.categorize(ev)
                 self.comms.logger.debug(
-                    f"Appending keycode: {c.keycode}, {c.keycode[4:]}")
+                    "Appending keycode: %s, %s", c.keycode, c.keycode[4:])
                 try:
                     keys.append(int(c.keycode[4:]))
                 except ValueError as e:
                     pass
             else:
                 identifier = "".join(map(str, keys))
+                req = make_request(self.name, identifier)
+                if (trace := self.comms.start_trace()) is not None:
+                    self.comms.tracer.record(trace, "enter", ev.timestamp())
+                    req['trace'] = trace
                 try:
                     # ignores response
-                    await self.comms.request(
-                        "authorizer",
-                        make_request(self.name, identifier))
-                except ValueError as e:
+                    await self.comms.request("authorizer", req)
+                except (ValueError, OSError, RequestTimeout) as e:
                     self.comms.logger.error(f"Auth request failed with {e}")
+                self.comms.tracer.finish(trace)
                 keys = []
                 self.comms.logger.debug("Read complete")
 
@@ -112,7 +141,6 @@ if __name__ == "__main__":
     else:
         from settings import Config as config
 
-    labels = ["Barcode Reader ", "HID 13ba:0018", "HID 413d:2107"]
-    front_door_reader = RfidReader("front_door_rfid", labels, config)
-    loop = asyncio.get_event_loop()
+    front_door_reader = RfidReader("front_door_rfid", LABELS, config)
+    loop = setup_event_loop(config)
     loop.run_until_complete(front_door_reader.process())
@@ -48,14 +48,28 @@ def mod_user(rfids, target_rfid, access_hours, sponsor):
     add_user(rfids, target_rfid, access_hours, sponsor)
 
 
+def get_config():
+    if os.environ.get("QUEERIOUSLABS_ENV", None) == "PROD":
+        from settings import ProdConfig as config
+    else:
+        from settings import Config as config
+    return config
+
+
+def acl_location():
+    """ Where the ACL is kept, as the `data_dir` and `database` arguments of
+    `read_acl_data` and `write_rfid_data`.
+    """
+    config = get_config()
+    return (getattr(config, 'ACL_DATA_DIR', "data"),
+            getattr(config, 'ACL_DATABASE', None))
+
+
 async def notify_authorizer():
     """ Sends a message to the rfid authorizer service to reload the cached
     access control list, in the event it was updated.
     """
-    if os.environ.get("QUEERIOUSLABS_ENV", None) == "PROD":
-        from settings import ProdConfig as comms_config
-    else:
-        from settings import Config as comms_config
+    comms_config = get_config()
 
     link = comms.create_comms('shell', comms_config)
     request = {
@@ -67,10 +81,11 @@ async def notify_authorizer():
         }]}
     color_print([("magenta", "Notifying authorizer")])
     try:
-        resp = await link.request('authorizer', request)
-    except FileNotFoundError as e:
+        resp = await link.request('authorizer', request, idempotent=True)
+    except (OSError, comms.RequestTimeout) as e:
         color_print(
             [("yellow", "Authorizer not found, perhaps not running")])
+        comms.stop_logging(link)
         link.logger.handlers.clear()
         return
     msg = ""
@@ -82,7 +97,8 @@ async def notify_authorizer():
         msg = "Please check Authorizer."
     color_print([(color, msg)])
     await link.disconnect("authorizer")
-    # turn off logging handler for this link
+    # write out the queued log records, and turn off logging for this link
+    comms.stop_logging(link)
     link.logger.handlers.clear()
 
 
@@ -266,7 +282,7 @@ def commit_handler(rfids, hours, dirty):
         if not save:
             return dirty
         color_print([("magenta", "Saving changes")])
-        write_rfid_data(rfids)
+        write_rfid_data(rfids, *acl_location())
         color_print([("green", "Saved")])
         try:
             loop = asyncio.get_event_loop()
@@ -290,7 +306,7 @@ def quit_handler(rfids, hours, dirty):
 
 def run():
     """ Main operating loop """
-    acl_data = read_acl_data()
+    acl_data = read_acl_data(*acl_location())
     hours = acl_data['hours']
     rfids = acl_data['rfids']
     dirty = False
@@ -10,6 +10,48 @@ class Config:
     LOG_FILE = "acl.log"
     LOG_FORMAT = "%(asctime)s | %(pathname)s:%(lineno)d | %(funcName)s | %(levelname)s | %(message)s "
     LOG_LEVEL = logging.INFO
+    LOG_QUEUE = True  # write logs from a background thread
+    LOG_SAMPLE_RATE = 1  # keep 1 in N of each debug message
+    FRAMING = "json"  # "msgpack" is negotiated per connection if installed
+    BUFFERED_RECEIVE = True  # servers read with FrameProtocol, not streams
+    MAX_FRAME_SIZE = 65536  # bytes, longer frames close the connection
+    EVENT_LOOP = None  # "uvloop" or "asyncio", None for the fastest
+    JSON_CODEC = None  # "orjson", "ujson" or "json", None for the fastest
+    RECONNECT_ATTEMPTS = 5
+    RECONNECT_DELAY = 0.05  # seconds, doubled per attempt
+    RECONNECT_MAX_DELAY = 1.0
+    REQUEST_RETRIES = 2
+    REQUEST_TIMEOUT = 5  # seconds, default deadline for any request
+    REQUEST_TIMEOUTS = {  # per hop deadlines, by target
+        "authorizer": 1,
+        "front_door_latch": 1,
+    }
+    TCP_ADDRESS = None  # (host, port) to also serve components on over TCP
+    ROUTES = {}  # name: (host, port) of components on other devices
+    BRIDGES = {}  # name: (host, port) forwarded by services/bridge.py
+    BRIDGE_IN_FLIGHT = 64  # requests each bridge link forwards at once
+    TLS_CERT = None  # TCP uses TLS when set, with TLS_KEY
+    TLS_KEY = None
+    TLS_CA = None  # require peers to have certs signed by this CA
+    CLIENT_QUEUE_SIZE = 64  # outbound messages queued per connected client
+    OVERFLOW_POLICY = "drop_oldest"  # or "block", "disconnect"
+    FLUSH_DELAY = 0  # seconds to gather outbound messages to a peer
+    FLUSH_DELAYS = {}  # per peer flush delays, by name
+    SHUTDOWN_TIMEOUT = 5  # seconds to write out queued messages when stopping
+    HEARTBEAT_INTERVAL = 5  # seconds between heartbeats to watched peers
+    HEARTBEAT_MISSES = 3  # intervals unheard from before a peer is down
+    HEARTBEAT_PEERS = {}  # peers each component watches, by component name
+    DISCOVERY = True  # track components announced under SOCKET_ROOT
+    DISCOVERY_WAIT = 1  # seconds to wait for a local component to appear
+    STATS_SOCKET = True  # serve metrics at <SOCKET_ROOT>/<name>.stats.sock
+    METRICS_MAX_PEERS = 64  # peers named in metrics, the rest are "other"
+    TRACING = False  # trace each scan from the reader to the relay
+    TRACE_BUFFER_SIZE = 1024  # finished traces kept per component
+    VALIDATE = False  # check messages against secbot/schema.py
+    ACL_DATA_DIR = "data"  # hours.csv and rfids.csv, relative to the cwd
+    ACL_DATABASE = None  # SQLite ACL database to use instead of the CSVs
+    ACL_WATCH = True  # reload the ACL when its files change
+    ACL_RELOAD_DELAY = 0.5  # seconds of quiet after a change before reloading
 
 
 class ProdConfig(Config):
@@ -17,3 +59,9 @@ class ProdConfig(Config):
     LOG_ROOT = "/var/log/queeriouslabs/"
     LOG_LEVEL = logging.INFO
     SOCKET_ROOT = "/run/queeriouslabs"
+    TRACING = True
+    HEARTBEAT_PEERS = {
+        "front_door_rfid": ["authorizer"],
+        "authorizer": ["front_door_latch"],
+        "broadcast": ["authorizer", "front_door_latch"],
+    }
@@ -0,0 +1,83 @@
+""" Prints the metrics served on the stats sockets of running components,
+see `Comms.start_stats_server`.
+
+Counters and gauges are printed as they are, histograms as their count,
+mean, and estimated median and 99th percentile in milliseconds, and traces,
+see `secbot/tracing.py`, as percentiles of each span in milliseconds.
+
+Start this component from the command-line like:
+    `$ python stats.py [name ...]`
+
+or, to dump the finished traces kept by each component as JSON lines:
+    `$ python stats.py --traces [name ...]`
+
+Without names, every component with a stats socket under SOCKET_ROOT is
+read.
+"""
+import asyncio
+import os
+import sys
+from secbot.comms import json_codec
+from secbot.metrics import quantile
+
+
+def ms(bound):
+    return bound if isinstance(bound, str) else f"{bound * 1000:g}"
+
+
+async def read_stats(socket_root, name, command="stats"):
+    reader, writer = await asyncio.open_unix_connection(
+        f"{socket_root}/{name}.stats.sock")
+    writer.write(command.encode() + b'\n')
+    data = await reader.readline()
+    writer.close()
+    return json_codec().loads(data)
+
+
+def print_stats(stats):
+    print(f"{stats['name']} (pid {stats['pid']}, "
+          f"up {stats['uptime']:.0f}s, {stats['loop']})")
+    for name, value in sorted(stats['gauges'].items()):
+        print(f"  {name}: {value}")
+    for name, value in sorted(stats['counters'].items()):
+        print(f"  {name}: {value}")
+    for name, hist in sorted(stats['histograms'].items()):
+        mean = hist['sum'] / hist['count'] * 1000 if hist['count'] else 0
+        print(f"  {name}: n={hist['count']} mean={mean:.2f}ms "
+              f"p50<={ms(quantile(hist, 0.5))}ms "
+              f"p99<={ms(quantile(hist, 0.99))}ms")
+    traces = stats.get('traces', {})
+    if traces.get('total', {}).get('count'):
+        spans = {"total": traces['total'], **traces['spans']}
+        for name, summary in spans.items():
+            print(f"  trace {name}: n={summary['count']} " + " ".join(
+                f"{q}={summary[q] * 1000:.2f}ms"
+                for q in ("p50", "p90", "p99", "max")))
+
+
+async def main(config, names, traces=False):
+    if not names:
+        names = sorted(f[:-len(".stats.sock")]
+                       for f in os.listdir(config.SOCKET_ROOT)
+                       if f.endswith(".stats.sock"))
+    for name in names:
+        try:
+            if traces:
+                for trace in await read_stats(
+                        config.SOCKET_ROOT, name, "traces"):
+                    print(json_codec().dumps(trace).decode())
+            else:
+                print_stats(await read_stats(config.SOCKET_ROOT, name))
+        except OSError as e:
+            print(f"{name}: {e}")
+
+
+if __name__ == "__main__":
+    config = None
+    if os.environ.get('QUEERIOUSLABS_ENV', None) == 'PROD':
+        from settings import ProdConfig as config
+    else:
+        from settings import Config as config
+
+    names = [arg for arg in sys.argv[1:] if arg != "--traces"]
+    asyncio.run(main(config, names, "--traces" in sys.argv[1:]))
@@ -3,6 +3,7 @@ from unittest.mock import (
     patch,
     MagicMock,
 )
+import socket
 import sys
 sys.modules['gpiozero'] = MagicMock()
 import time
@@ -62,6 +63,14 @@ class MockEvDevice:
         return out
 
 
+@pytest.fixture
+def free_port():
+    """ A TCP port on localhost which nothing is listening on """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
 @pytest.fixture
 def ev_device():
     return MockEvDevice()
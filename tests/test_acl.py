@@ -0,0 +1,95 @@
+from secbot.acl import (
+    AccessList,
+    ALL_HOURS,
+    hour_mask,
+)
+
+
+def test_hour_mask():
+    assert hour_mask(0, 24) == ALL_HOURS
+    assert hour_mask("11", "22") == sum(1 << h for h in range(11, 22))
+    assert hour_mask(5, 5) == 0
+    assert hour_mask(22, 11) == 0
+
+
+def test_access_list():
+    acl = AccessList(
+        {'allhours': ['0', '24'], 'daytime': ['11', '22'],
+         'broken': ['11', 'noon']},
+        {'0000000001': {'access_times': 'allhours', 'sponsor': 'beka'},
+         '0000000002': {'access_times': 'daytime', 'sponsor': 'beka'},
+         '0000000003': {'access_times': 'broken', 'sponsor': 'beka'},
+         '0000000004': {'access_times': 'weekends', 'sponsor': 'beka'}})
+
+    assert len(acl) == 4 and '0000000001' in acl
+    assert all(acl.allowed('0000000001', h) for h in range(24))
+    assert [h for h in range(24) if acl.allowed('0000000002', h)] == \
+        list(range(11, 22))
+    assert not any(acl.allowed('0000000003', h) for h in range(24))
+    assert not any(acl.allowed('0000000004', h) for h in range(24))
+    assert not acl.allowed('0000000005', 12)
+    assert set(acl.invalid) == {'broken', '0000000004'}
+
+
+def test_access_list_update():
+    hours = {'allhours': ['0', '24'], 'daytime': ['11', '22']}
+    rfids = {'0000000001': {'access_times': 'allhours', 'sponsor': 'beka'},
+             '0000000002': {'access_times': 'daytime', 'sponsor': 'beka'},
+             '0000000003': {'access_times': 'daytime', 'sponsor': 'matt'}}
+    acl = AccessList(hours, rfids)
+
+    new_hours = {'allhours': ['0', '24'], 'daytime': ['11', '13'],
+                 'nights': ['0', '6']}
+    new_rfids = {'0000000001': {'access_times': 'nights', 'sponsor': 'beka'},
+                 '0000000002': {'access_times': 'daytime', 'sponsor': 'beka'},
+                 '0000000004': {'access_times': 'evening', 'sponsor': 'matt'}}
+    changes = acl.changes(new_hours, new_rfids)
+    assert changes == (
+        {'daytime': ['11', '13'], 'nights': ['0', '6']},
+        {'0000000001': new_rfids['0000000001'],
+         '0000000003': None,
+         '0000000004': new_rfids['0000000004']})
+
+    delta = acl.update(*changes)
+    assert delta == {
+        'hours': {'added': ['nights'], 'removed': [], 'changed': ['daytime']},
+        'rfids': {'added': ['0000000004'], 'removed': ['0000000003'],
+                  'changed': ['0000000001']}}
+    assert acl.version == 1
+    assert (acl.hours, acl.rfids) == (new_hours, new_rfids)
+    assert hours['daytime'] == ['11', '22'] and '0000000003' in rfids
+    assert acl.masks == AccessList(new_hours, new_rfids).masks
+    assert acl.cards == AccessList(new_hours, new_rfids).cards
+    assert set(acl.invalid) == {'0000000004'}
+
+    assert acl.changes(new_hours, new_rfids) == ({}, {})
+
+
+def test_access_list_update_level():
+    """ Changing a level's hours recompiles only that level's cards """
+    rfids = {f'{n:010}': {'access_times': 'daytime' if n < 3 else 'allhours'}
+             for n in range(1000)}
+    acl = AccessList({'allhours': ['0', '24'], 'daytime': ['11', '22']},
+                     rfids)
+    assert acl.cards['daytime'] == {'0000000000', '0000000001', '0000000002'}
+
+    compiled = []
+    set_card = acl.set_card
+    acl.set_card = lambda rfid, rules: (compiled.append(rfid),
+                                        set_card(rfid, rules))
+    acl.update({'daytime': ['11', '13'], 'allhours': None}, {})
+    assert len(compiled) == 1000
+    compiled.clear()
+
+    acl.update({'allhours': ['0', '24']}, {})
+    assert len(compiled) == 997
+    compiled.clear()
+
+    acl.update({'daytime': ['9', '17']},
+               {'0000000001': None,
+                '0000000002': {'access_times': 'allhours'}})
+    assert sorted(compiled) == ['0000000000', '0000000002']
+    assert acl.cards['daytime'] == {'0000000000'}
+    assert '0000000001' not in acl and '0000000001' not in acl.card_levels
+    assert acl.allowed('0000000000', 9) and not acl.allowed('0000000000', 17)
+    assert acl.allowed('0000000002', 23)
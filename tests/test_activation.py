@@ -0,0 +1,85 @@
+import asyncio
+import os
+import socket
+import sys
+import pytest
+from services.settings import Config as config
+from secbot.activation import (
+    listen_fds,
+    socket_address,
+)
+from secbot.comms import create_comms
+
+
+# Stands in for a service started by systemd: moves the socket it's given
+# to fd 3, as systemd does, answers one request and shuts down.
+SERVICE = """
+import asyncio, os, sys
+os.dup2(int(sys.argv[1]), 3)
+os.environ.update(LISTEN_PID=str(os.getpid()), LISTEN_FDS="1")
+from services.settings import Config as config
+from secbot.comms import create_comms
+
+async def main():
+    comms = create_comms("test_activated", config)
+    comms.start()
+    req = await comms.in_q.get()
+    resp = req.copy()
+    resp.pop('permissions')
+    resp['code'] = 0
+    resp['msg'] = str(os.getpid())
+    await comms.out_q.put(resp)
+    await comms.shutdown()
+
+asyncio.run(main())
+"""
+
+
+def test_listen_fds_for_another_process():
+    environ = {"LISTEN_PID": str(os.getpid() + 1), "LISTEN_FDS": "1"}
+    assert listen_fds(environ) == {}
+    assert environ == {}
+    assert socket_address("a/../b.sock") == os.path.abspath("b.sock")
+    assert socket_address(("::1", 8080, 0, 0)) == ("::1", 8080)
+
+
+@pytest.mark.asyncio
+async def test_socket_activation():
+    """ Requests made while the service restarts wait for the next one """
+    path = f"{config.SOCKET_ROOT}/test_activated.sock"
+    if os.path.exists(path):
+        os.unlink(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen()
+
+    async def run_service():
+        service = await asyncio.create_subprocess_exec(
+            sys.executable, "-c", SERVICE, str(sock.fileno()),
+            pass_fds=(sock.fileno(),), cwd=os.path.dirname(
+                os.path.dirname(os.path.abspath(__file__))))
+        return service
+
+    test_client_name = "test_client_name"
+    client = create_comms(test_client_name, config)
+    req = {
+        "source_id": test_client_name,
+        "target_id": "test_activated",
+        "permissions": [{"perm": "/perm", "context": {}}]}
+
+    pids = set()
+    for _ in range(2):
+        # the request is made before the service is running
+        request = asyncio.create_task(client.request("test_activated", req))
+        await asyncio.sleep(0.1)
+        service = await run_service()
+        resp = await asyncio.wait_for(request, 10)
+        assert resp['code'] == 0
+        pids.add(resp['msg'])
+        assert await asyncio.wait_for(service.wait(), 10) == 0
+        assert os.path.exists(path)
+
+    assert len(pids) == 2
+    client.stop()
+    sock.close()
+    os.unlink(path)
@@ -1,6 +1,7 @@
 import asyncio
 import copy
 from datetime import datetime
+import os
 from unittest.mock import (
     AsyncMock,
     Mock,
@@ -11,6 +12,11 @@ from services.settings import Config as comms_config
 from services.authorizer import (
     Authorizer,
 )
+from secbot.database import (
+    put_rfid,
+    write_hours_data,
+    write_rfid_data,
+)
 
 
 @patch("services.authorizer.read_acl_data")
@@ -270,10 +276,139 @@ async def test_authorizer_reload(read_data):
     await asyncio.sleep(0)
 
     await authy.comms.in_q.put(req)
-    await asyncio.sleep(0)
+    await asyncio.sleep(0.1)
 
+    # read and diffed off the event loop, like the watcher's reloads
+    assert 'acl_reload' in authy.comms.tasks
     assert authy.hours == test_data['hours']
     assert authy.rfids == test_data['rfids']
 
     authy.comms.stop()
     process.cancel()
+
+
+@pytest.mark.asyncio
+@patch('services.authorizer.datetime')
+async def test_authorizer_watches_acl_data(dt, tmp_path):
+    """ Saving the ACL files reloads them once, and a broken save keeps the
+    data already loaded """
+    (tmp_path / "hours.csv").write_text(
+        "name,start_hour,end_hour\nallhours,0,24\ndaytime,11,22\n")
+    (tmp_path / "rfids.csv").write_text(
+        "rfid,access_times,sponsor\n0000000001,allhours,beka\n")
+
+    class config(comms_config):
+        ACL_DATA_DIR = str(tmp_path)
+        ACL_RELOAD_DELAY = 0.05
+
+    dt.now = Mock(return_value=datetime(2023, 1, 2, 12, 30))
+    authy = Authorizer(config)
+    assert not authy.lookup("/open", {"identity": "0000000002"})
+    reloads = []
+    reload_acl_data = authy.reload_acl_data
+
+    async def counted():
+        reloads.append(await reload_acl_data())
+    authy.reload_acl_data = counted
+
+    process = asyncio.create_task(authy.process())
+    await asyncio.sleep(0.1)
+
+    # written a row at a time, and replaced by renaming, as editors do
+    with open(tmp_path / "rfids.csv", "a") as f:
+        f.write("0000000002,daytime,matt\n")
+    with open(tmp_path / "rfids.csv", "a") as f:
+        f.write("0000000003,allhours,matt\n")
+    (tmp_path / "hours.new").write_text(
+        "name,start_hour,end_hour\nallhours,0,24\ndaytime,11,13\n")
+    os.replace(tmp_path / "hours.new", tmp_path / "hours.csv")
+    await asyncio.sleep(0.3)
+
+    assert reloads == [True]
+    assert authy.lookup("/open", {"identity": "0000000002"})
+    assert authy.hours['daytime'] == ['11', '13']
+    assert len(authy.rfids) == 3
+
+    (tmp_path / "rfids.csv").write_text("card,access_times\n1,allhours\n")
+    await asyncio.sleep(0.3)
+    assert reloads == [True, False]
+    assert len(authy.rfids) == 3
+
+    authy.comms.stop()
+    process.cancel()
+
+
+@pytest.mark.asyncio
+@patch('services.authorizer.datetime')
+async def test_authorizer_watches_acl_database(dt, tmp_path):
+    database = str(tmp_path / "acl.sqlite3")
+    write_hours_data({'allhours': [0, 24]}, database=database)
+    write_rfid_data({'0000000001': {'access_times': 'allhours',
+                                    'sponsor': 'beka'}}, database=database)
+
+    class config(comms_config):
+        ACL_DATABASE = database
+        ACL_RELOAD_DELAY = 0.05
+
+    dt.now = Mock(return_value=datetime(2023, 1, 2, 12, 30))
+    authy = Authorizer(config)
+    reloads = []
+    reload_acl_data = authy.reload_acl_data
+
+    async def counted():
+        reloads.append(await reload_acl_data())
+    authy.reload_acl_data = counted
+
+    process = asyncio.create_task(authy.process())
+    await asyncio.sleep(0.1)
+    assert not authy.lookup("/open", {"identity": "0000000002"})
+
+    put_rfid(database, '0000000002', 'allhours', 'matt')
+    await asyncio.sleep(0.3)
+    assert reloads == [True]
+    assert authy.lookup("/open", {"identity": "0000000002"})
+
+    authy.comms.stop()
+    process.cancel()
+
+
+@pytest.mark.asyncio
+@patch('services.authorizer.datetime')
+async def test_authorizer_watcher_survives_errors(dt, tmp_path):
+    """ An unexpected error reloading is logged, and later changes still
+    reload, and the reload thread only sees copies of the ACL data """
+    (tmp_path / "hours.csv").write_text(
+        "name,start_hour,end_hour\nallhours,0,24\n")
+    (tmp_path / "rfids.csv").write_text(
+        "rfid,access_times,sponsor\n0000000001,allhours,beka\n")
+
+    class config(comms_config):
+        ACL_DATA_DIR = str(tmp_path)
+        ACL_RELOAD_DELAY = 0.05
+
+    dt.now = Mock(return_value=datetime(2023, 1, 2, 12, 30))
+    authy = Authorizer(config)
+    read_acl_changes = authy.read_acl_changes
+    seen = []
+
+    def failing(hours, rfids):
+        seen.append((hours, rfids))
+        if len(seen) == 1:
+            raise RuntimeError("dictionary changed size during iteration")
+        return read_acl_changes(hours, rfids)
+    authy.read_acl_changes = failing
+
+    process = asyncio.create_task(authy.process())
+    await asyncio.sleep(0.1)
+    try:
+        for rfid in ("0000000002", "0000000003"):
+            with open(tmp_path / "rfids.csv", "a") as f:
+                f.write(f"{rfid},allhours,matt\n")
+            await asyncio.sleep(0.3)
+        assert len(seen) == 2
+        assert all(rfids is not authy.acl.rfids for _, rfids in seen)
+        assert authy.lookup("/open", {"identity": "0000000003"})
+        assert not authy.comms.tasks['acl_watcher'].done()
+    finally:
+        authy.comms.stop()
+        process.cancel()
@@ -0,0 +1,143 @@
+import asyncio
+import os
+import pytest
+from services.bridge import Bridge
+from services.settings import Config
+from secbot.comms import create_comms
+
+
+@pytest.mark.asyncio
+async def test_bridge_forwards(tmp_path, free_port):
+    address = ("127.0.0.1", free_port)
+
+    class config(Config):
+        BRIDGES = {"test_bridged": address}
+
+    async def process(comms):
+        while True:
+            data = await comms.in_q.get()
+            resp = data.copy()
+            resp.pop('permissions')
+            resp['code'] = 0
+            resp['msg'] = f"Hello {data['source_id']}"
+            await comms.out_q.put(resp)
+
+    # the "remote" component, on its own device as far as sockets go
+    remote = create_comms("test_bridged", config)
+    remote.socket_root = str(tmp_path)
+    remote.tcp_address = address
+    remote.start()
+    remote_task = asyncio.create_task(process(remote))
+
+    bridge = Bridge(config)
+    bridge_task = asyncio.create_task(bridge.process())
+    await asyncio.sleep(0.1)
+
+    clients = [create_comms(f"test_client_{i}", config) for i in range(2)]
+    try:
+        resps = await asyncio.gather(*[
+            client.request("test_bridged", {
+                "source_id": client.name,
+                "target_id": "test_bridged",
+                "permissions": [{"perm": "/a/permission", "ctx": {}}]})
+            for client in clients])
+
+        assert [r['msg'] for r in resps] == [
+            "Hello test_client_0", "Hello test_client_1"]
+        # one TCP connection carries both clients
+        assert remote.clients["test_client_0"] is \
+            remote.clients["test_client_1"]
+        # the link serves test_bridged.sock, but isn't test_bridged
+        [link] = bridge.links
+        assert link.name == "bridge:test_bridged"
+        assert link.heartbeat_peers == []
+        assert not os.path.exists(link.registry.path("test_bridged"))
+    finally:
+        for client in clients:
+            await client.disconnect("test_bridged")
+        bridge_task.cancel()
+        for comms in bridge.links:
+            comms.stop()
+        remote_task.cancel()
+        remote.stop()
+
+
+@pytest.mark.asyncio
+async def test_bridge_remote_down(free_port):
+    address = ("127.0.0.1", free_port)
+
+    class config(Config):
+        BRIDGES = {"test_bridged": address}
+        RECONNECT_ATTEMPTS = 1
+
+    bridge = Bridge(config)
+    bridge_task = asyncio.create_task(bridge.process())
+    await asyncio.sleep(0.1)
+
+    client = create_comms("test_client", config)
+    try:
+        resp = await client.request("test_bridged", {
+            "source_id": "test_client",
+            "target_id": "test_bridged",
+            "permissions": [{"perm": "/a/permission", "ctx": {}}]})
+        assert resp['code'] == 1
+    finally:
+        await client.disconnect("test_bridged")
+        bridge_task.cancel()
+        for comms in bridge.links:
+            comms.stop()
+
+
+@pytest.mark.asyncio
+async def test_bridge_in_flight(tmp_path, free_port):
+    """ A link forwards at most BRIDGE_IN_FLIGHT requests at once """
+    address = ("127.0.0.1", free_port)
+
+    class config(Config):
+        BRIDGES = {"test_bridged": address}
+        BRIDGE_IN_FLIGHT = 2
+
+    handling = set()
+    most = []
+
+    async def process(comms):
+        while True:
+            data = await comms.in_q.get()
+            asyncio.create_task(respond(comms, data))
+
+    async def respond(comms, data):
+        handling.add(data['request_id'])
+        most.append(len(handling))
+        await asyncio.sleep(0.05)
+        handling.discard(data['request_id'])
+        resp = data.copy()
+        resp.pop('permissions')
+        resp['code'] = 0
+        await comms.out_q.put(resp)
+
+    remote = create_comms("test_bridged", config)
+    remote.socket_root = str(tmp_path)
+    remote.tcp_address = address
+    remote.start()
+    remote_task = asyncio.create_task(process(remote))
+    bridge = Bridge(config)
+    bridge_task = asyncio.create_task(bridge.process())
+    await asyncio.sleep(0.1)
+
+    client = create_comms("test_client", config)
+    try:
+        resps = await asyncio.gather(*[
+            client.request("test_bridged", {
+                "source_id": "test_client",
+                "target_id": "test_bridged",
+                "permissions": [{"perm": "/a/permission", "ctx": {}}]})
+            for _ in range(6)])
+        assert [r['code'] for r in resps] == [0] * 6
+        assert max(most) == 2
+    finally:
+        await client.disconnect("test_bridged")
+        bridge_task.cancel()
+        for comms in bridge.links:
+            comms.stop()
+        remote_task.cancel()
+        remote.stop()
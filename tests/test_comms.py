@@ -1,11 +1,31 @@
 # 81, 84-87, 91-94, 120, 135-136, 180
 import asyncio
+import json
+import logging
 import os
+import shutil
+import subprocess
+import time
 from unittest.mock import patch
 import pytest
 from services.settings import Config as config
-from secbot.comms import create_comms
-# from secbot import schema
+from secbot.comms import (
+    create_comms,
+    create_ssl_contexts,
+    FRAMINGS,
+    json_codec,
+    JSON_CODECS,
+    LazyQueueHandler,
+    MemoryConnection,
+    MemoryHub,
+    negotiate_framing,
+    RequestTimeout,
+    SamplingFilter,
+    set_json_codec,
+    stop_logging,
+    topic_matches,
+)
+from secbot import schema
 
 
 @pytest.mark.asyncio
@@ -30,9 +50,87 @@ async def test_comms_init():
     server.stop()
     assert not server.tasks
     assert f"{server.name}.sock" not in os.listdir(server.socket_root)
+    assert server.stopped.is_set()
 
-    with pytest.raises(SystemExit) as e:
-        server.cleanup()
+    server.start()
+    await asyncio.sleep(.1)
+    assert not server.stopped.is_set()
+    server.cleanup()
+    await asyncio.wait_for(server.stopped.wait(), 1)
+    assert not server.tasks
+    assert f"{server.name}.sock" not in os.listdir(server.socket_root)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("buffered", [False, True])
+async def test_shutdown_writes_out_responses(buffered):
+    """ Responses already queued when a server shuts down still reach the
+    client, and the component's main coroutine returns.
+    """
+
+    async def process(comms, count):
+        reqs = [await comms.in_q.get() for _ in range(count)]
+        comms.shutdown()
+        for data in reqs:
+            resp = data.copy()
+            resp.pop('permissions')
+            resp['code'] = 0
+            resp['msg'] = "OK"
+            await comms.out_q.put(resp)
+        await asyncio.sleep(10)
+
+    test_server_name = "test_server_name"
+    server = create_comms(test_server_name, config)
+    server.buffered = buffered
+    server.client_queue_size = 2
+    server.flush_delay = 0.05
+    server.start()
+    await asyncio.sleep(0)
+    served = asyncio.create_task(server.serve(process(server, 10)))
+
+    test_client_name = "test_client_name"
+    client = create_comms(test_client_name, config)
+    req = {
+        "source_id": test_client_name,
+        "target_id": test_server_name,
+        "permissions": [{"perm": "/perm", "context": {}}]}
+    resps = await asyncio.wait_for(asyncio.gather(*[
+        client.request(test_server_name, req) for _ in range(10)]), 2)
+    assert [resp['code'] for resp in resps] == [0] * 10
+
+    assert await asyncio.wait_for(served, 2) is None
+    assert server.stopped.is_set()
+    assert f"{server.name}.sock" not in os.listdir(server.socket_root)
+    with pytest.raises(OSError):
+        await client.request(test_server_name, req)
+    client.stop()
+
+
+@pytest.mark.asyncio
+async def test_shutdown_deadline():
+    """ A client which stopped reading doesn't hold up a shutdown past its
+    deadline.
+    """
+    test_server_name = "test_server_name"
+    server = create_comms(test_server_name, config)
+    server.start()
+    await asyncio.sleep(0.1)
+
+    test_client_name = "test_client_name"
+    reader, writer = await asyncio.open_unix_connection(
+        f"{config.SOCKET_ROOT}/{test_server_name}.sock")
+    writer.write(json_codec().dumps({"subscribe": ["*"],
+                                     "source_id": test_client_name}) + b'\n')
+    await writer.drain()
+    await asyncio.sleep(0.1)
+    for _ in range(20):
+        server.publish("/test", {"blob": "x" * 100_000})
+
+    started = time.monotonic()
+    await server.shutdown(timeout=0.2)
+    assert time.monotonic() - started < 1
+    assert server.stopped.is_set()
+    writer.close()
 
 
 @pytest.mark.asyncio
@@ -87,13 +185,13 @@ async def test_client_server_communication():
     permission = {
         "perm": perm,
         "context": perm_context }
-    # schema.validate_permission(permission)
+    schema.validate_permission(permission)
 
     request = {
         "source_id": test_client_name,
         "target_id": test_server_name,
         "permissions": [ permission ]}
-    # schema.validate_request(request)
+    schema.validate_request(request)
 
     grant = {
         "source_id": test_client_name,
@@ -101,7 +199,7 @@ async def test_client_server_communication():
         "perm": permission,
         "grant": True
     }
-    # schema.validate_grant(grant)
+    schema.validate_grant(grant)
 
     resp = {
         "source_id": test_client_name,
@@ -109,8 +207,889 @@ async def test_client_server_communication():
         "code": 0,
         "msg": "Success"
     }
-    # schema.validate_response(resp)
+    schema.validate_response(resp)
 
     server_response = await client.request(test_server_name, request)
     assert server_response == resp
     server.stop()
+
+
+@pytest.mark.asyncio
+async def test_client_pipelined_requests():
+    """ Responses sent out of order reach the request they belong to """
+
+    async def process(comms, count):
+        reqs = [await comms.in_q.get() for _ in range(count)]
+        for data in reversed(reqs):
+            resp = data.copy()
+            resp.pop('permissions')
+            resp['code'] = 0
+            resp['msg'] = data['permissions'][0]['perm']
+            await comms.out_q.put(resp)
+
+    test_server_name = "test_server_name"
+    server = create_comms(test_server_name, config)
+    server.start()
+    await asyncio.sleep(0)
+    asyncio.create_task(process(server, 5))
+
+    test_client_name = "test_client_name"
+    client = create_comms(test_client_name, config)
+
+    def make_req(i):
+        return {
+            "source_id": test_client_name,
+            "target_id": test_server_name,
+            "permissions": [{"perm": f"/perm/{i}", "context": {}}]}
+
+    responses = await asyncio.gather(
+        *[client.request(test_server_name, make_req(i)) for i in range(5)])
+
+    assert [r['msg'] for r in responses] == [f"/perm/{i}" for i in range(5)]
+    assert all('request_id' not in r for r in responses)
+    assert len(client.servers) == 1
+    assert not client.servers[test_server_name].pending
+
+    await client.disconnect(test_server_name)
+    server.stop()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("flush_delay", [0, 0.05])
+async def test_write_coalescing(flush_delay):
+    """ Messages to a peer in the same loop iteration, or within the flush
+    delay, are written together.
+    """
+
+    async def process(comms, count):
+        reqs = [await comms.in_q.get() for _ in range(count)]
+        for data in reqs:
+            resp = data.copy()
+            resp.pop('permissions')
+            resp['code'] = 0
+            resp['msg'] = "OK"
+            await comms.out_q.put(resp)
+
+    test_server_name = "test_server_name"
+    server = create_comms(test_server_name, config)
+    server.flush_delay = flush_delay
+    server.start()
+    await asyncio.sleep(0)
+    asyncio.create_task(process(server, 6))
+
+    test_client_name = "test_client_name"
+    client = create_comms(test_client_name, config)
+    client.flush_delays[test_server_name] = flush_delay
+    req = {
+        "source_id": test_client_name,
+        "target_id": test_server_name,
+        "permissions": [{"perm": "/perm", "context": {}}]}
+    await client.connect(test_server_name)
+
+    requests = [asyncio.create_task(client.request(test_server_name, req))
+                for _ in range(5)]
+    await asyncio.sleep(0.01)
+    requests.append(asyncio.create_task(
+        client.request(test_server_name, req)))
+    await asyncio.gather(*requests)
+
+    sent = client.stats()['histograms'][f"write_batch/{test_server_name}"]
+    answered = server.stats()['histograms'][
+        f"write_batch/{test_client_name}"]
+    assert sent['sum'] == answered['sum'] == 6
+    assert sent['count'] == (1 if flush_delay else 2)
+    assert answered['count'] == 1
+
+    await client.disconnect(test_server_name)
+    server.stop()
+
+
+@pytest.mark.asyncio
+async def test_burst_larger_than_client_queue():
+    """ A burst of responses to a client which is reading is written out,
+    not dropped, when it outgrows the client's queue.
+    """
+
+    async def process(comms, count):
+        reqs = [await comms.in_q.get() for _ in range(count)]
+        for data in reqs:
+            resp = data.copy()
+            resp.pop('permissions')
+            resp['code'] = 0
+            resp['msg'] = "OK"
+            await comms.out_q.put(resp)
+
+    test_server_name = "test_server_name"
+    server = create_comms(test_server_name, config)
+    server.client_queue_size = 4
+    server.start()
+    await asyncio.sleep(0)
+    asyncio.create_task(process(server, 20))
+
+    test_client_name = "test_client_name"
+    client = create_comms(test_client_name, config)
+    req = {
+        "source_id": test_client_name,
+        "target_id": test_server_name,
+        "permissions": [{"perm": "/perm", "context": {}}]}
+    resps = await asyncio.wait_for(asyncio.gather(*[
+        client.request(test_server_name, req) for _ in range(20)]), 5)
+
+    assert [resp['code'] for resp in resps] == [0] * 20
+    assert server.stats()['counters']["overflow/drop_oldest"] == 0
+
+    await client.disconnect(test_server_name)
+    server.stop()
+
+
+@pytest.mark.asyncio
+async def test_blocked_client_disconnects():
+    """ Under the "block" policy, a client which stops reading and then goes
+    away doesn't leave the server waiting to answer it forever.
+    """
+
+    async def process(comms):
+        while True:
+            data = await comms.in_q.get()
+            resp = data.copy()
+            resp.pop('permissions')
+            resp['code'] = 0
+            resp['msg'] = "OK"
+            await comms.out_q.put(resp)
+
+    test_server_name = "test_server_name"
+    server = create_comms(test_server_name, config)
+    server.overflow = "block"
+    server.client_queue_size = 2
+    server.start()
+    await asyncio.sleep(0.1)
+    processing = asyncio.create_task(process(server))
+
+    stalled_name = "test_client_0"
+    reader, writer = await asyncio.open_unix_connection(
+        f"{config.SOCKET_ROOT}/{test_server_name}.sock")
+    req = {
+        "source_id": stalled_name,
+        "target_id": test_server_name,
+        "padding": "x" * 20_000,
+        "permissions": [{"perm": "/perm", "context": {}}]}
+    writer.writelines([json.dumps(req).encode() + b'\n'] * 200)
+    await writer.drain()
+    await asyncio.sleep(0.5)
+    assert server.stats()['counters']["overflow/block"] >= 1
+    writer.close()
+    await asyncio.sleep(0.1)
+
+    test_client_name = "test_client_1"
+    client = create_comms(test_client_name, config)
+    resp = await asyncio.wait_for(client.request(test_server_name, {
+        "source_id": test_client_name,
+        "target_id": test_server_name,
+        "permissions": [{"perm": "/perm", "context": {}}]}), 2)
+    assert resp['code'] == 0
+
+    await client.shutdown()
+    processing.cancel()
+    server.stop()
+
+
+@pytest.mark.asyncio
+async def test_client_server_msgpack_framing():
+    pytest.importorskip("msgpack")
+
+    async def process(comms):
+        data = await comms.in_q.get()
+        resp = data.copy()
+        resp.pop('permissions')
+        resp['code'] = 0
+        resp['msg'] = "Success"
+        await comms.out_q.put(resp)
+
+    test_server_name = "test_server_name"
+    server = create_comms(test_server_name, config)
+    server.start()
+    await asyncio.sleep(0)
+    asyncio.create_task(process(server))
+
+    test_client_name = "test_client_name"
+    client = create_comms(test_client_name, config)
+    client.framing = "msgpack"
+
+    request = {
+        "source_id": test_client_name,
+        "target_id": test_server_name,
+        "permissions": [{"perm": "/a/permission", "context": {}}]}
+
+    resp = await client.request(test_server_name, request)
+    assert resp['msg'] == "Success"
+    assert client.servers[test_server_name].framing.name == "msgpack"
+    assert server.clients[test_client_name].framing.name == "msgpack"
+
+    await client.disconnect(test_server_name)
+    server.stop()
+
+
+@pytest.mark.asyncio
+async def test_client_server_unknown_framing():
+    """ A framing the server does not know falls back to JSON """
+    test_server_name = "test_server_name"
+    server = create_comms(test_server_name, config)
+    server.start()
+    await asyncio.sleep(0)
+
+    reader, writer = await asyncio.open_unix_connection(
+        f"{config.SOCKET_ROOT}/{test_server_name}.sock")
+    writer.write(b'{"framing": "carrier_pigeon"}\n')
+    await writer.drain()
+    assert json.loads(await reader.readline()) == {"framing": "json"}
+
+    writer.close()
+    server.stop()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("buffered", [False, True])
+@pytest.mark.parametrize("framing", ["json", "msgpack"])
+async def test_receive_paths(buffered, framing):
+    """ Both receive paths take frames split across reads, many frames in
+    one read, and frames larger than the read buffer.
+    """
+    if framing not in FRAMINGS:
+        pytest.skip(f"{framing} is not installed")
+
+    test_server_name = "test_server_name"
+    server = create_comms(test_server_name, config)
+    server.buffered = buffered
+    server.max_frame_size = 2 ** 18
+    server.start()
+    await asyncio.sleep(0)
+
+    reader, writer = await asyncio.open_unix_connection(
+        f"{config.SOCKET_ROOT}/{test_server_name}.sock")
+    wire = await negotiate_framing(reader, writer, framing)
+    assert wire.name == framing
+
+    def make_req(i, size=0):
+        return {
+            "source_id": "test_client_name",
+            "target_id": test_server_name,
+            "permissions": [{"perm": f"/perm/{i}", "context": {},
+                             "padding": "x" * size}]}
+
+    # larger than FrameProtocol's buffer, which grows to take it
+    size = 200_000
+    data = b"".join(wire.encode(make_req(i)) for i in range(100))
+    data += wire.encode(make_req(100, size))
+    for i in range(0, len(data), 7000):
+        writer.write(data[i:i + 7000])
+        await writer.drain()
+
+    for i in range(101):
+        req = await asyncio.wait_for(server.in_q.get(), 1)
+        assert req['permissions'][0]['perm'] == f"/perm/{i}"
+    assert len(req['permissions'][0]['padding']) == size
+
+    # a bad frame drops the connection
+    writer.write(b"{not json\n" if framing == "json" else b"\0\0\0\1\xc1")
+    await writer.drain()
+    assert await asyncio.wait_for(reader.read(), 1) == b''
+    assert server.stats()['counters']['connections/bad_frame'] == 1
+
+    writer.close()
+    server.stop()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("buffered", [False, True])
+@pytest.mark.parametrize("framing", ["json", "msgpack"])
+async def test_frame_too_large(buffered, framing):
+    """ A frame over max_frame_size drops the connection as soon as that is
+    known, rather than being read in however long it is.
+    """
+    if framing not in FRAMINGS:
+        pytest.skip(f"{framing} is not installed")
+
+    test_server_name = "test_server_name"
+    server = create_comms(test_server_name, config)
+    server.buffered = buffered
+    server.max_frame_size = 1024
+    server.start()
+    await asyncio.sleep(0)
+
+    reader, writer = await asyncio.open_unix_connection(
+        f"{config.SOCKET_ROOT}/{test_server_name}.sock")
+    wire = await negotiate_framing(reader, writer, framing)
+    req = {
+        "source_id": "test_client_name",
+        "target_id": test_server_name,
+        "permissions": [{"perm": "/perm", "context": {}}]}
+    writer.write(wire.encode(req))
+    assert (await asyncio.wait_for(server.in_q.get(), 1))['source_id']
+
+    if framing == "json":
+        data = b"x" * 4096  # and no newline
+    else:
+        data = wire.header.pack(2 ** 31) + b"x" * 4096
+    writer.write(data)
+    await writer.drain()
+    assert await asyncio.wait_for(reader.read(), 1) == b''
+    assert server.stats()['counters']['connections/bad_frame'] == 1
+    assert server.in_q.empty()
+
+    writer.close()
+    server.stop()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("buffered", [False, True])
+@pytest.mark.parametrize("framing", ["json", "msgpack"])
+@pytest.mark.parametrize("frame", [1, [1, 2], "x", None])
+async def test_frame_not_a_message(buffered, framing, frame):
+    """ A frame which isn't an object drops the connection and forgets its
+    client, like any other bad frame.
+    """
+    if framing not in FRAMINGS:
+        pytest.skip(f"{framing} is not installed")
+
+    test_server_name = "test_server_name"
+    server = create_comms(test_server_name, config)
+    server.buffered = buffered
+    server.start()
+    await asyncio.sleep(0)
+
+    reader, writer = await asyncio.open_unix_connection(
+        f"{config.SOCKET_ROOT}/{test_server_name}.sock")
+    try:
+        wire = await negotiate_framing(reader, writer, framing)
+        req = {
+            "source_id": "test_client_name",
+            "target_id": test_server_name,
+            "permissions": [{"perm": "/perm", "context": {}}]}
+        writer.write(wire.encode(req))
+        assert (await asyncio.wait_for(server.in_q.get(), 1))['source_id']
+        assert "test_client_name" in server.clients
+
+        writer.write(wire.encode(frame))
+        await writer.drain()
+        assert await asyncio.wait_for(reader.read(), 1) == b''
+        await asyncio.sleep(0.01)
+        assert server.stats()['counters']['connections/bad_frame'] == 1
+        assert "test_client_name" not in server.clients
+        assert server.in_q.empty()
+    finally:
+        writer.close()
+        server.stop()
+
+
+@pytest.mark.asyncio
+async def test_client_reconnects_after_server_restart():
+
+    async def process(comms):
+        while True:
+            data = await comms.in_q.get()
+            resp = data.copy()
+            resp.pop('permissions')
+            resp['code'] = 0
+            resp['msg'] = "Success"
+            await comms.out_q.put(resp)
+
+    async def start_server():
+        server = create_comms(test_server_name, config)
+        server.start()
+        await asyncio.sleep(0)
+        return server, asyncio.create_task(process(server))
+
+    test_server_name = "test_server_name"
+    test_client_name = "test_client_name"
+    request = {
+        "source_id": test_client_name,
+        "target_id": test_server_name,
+        "permissions": [{"perm": "/a/permission", "context": {}}]}
+
+    server, task = await start_server()
+    client = create_comms(test_client_name, config)
+    assert (await client.request(test_server_name, request))['msg']
+    first_conn = client.servers[test_server_name]
+
+    # restart the server, the client only finds out on its next request
+    task.cancel()
+    server.stop()
+    await asyncio.sleep(0.1)
+    assert first_conn.closed
+
+    async def delayed_start():
+        await asyncio.sleep(0.1)
+        return await start_server()
+
+    restart = asyncio.create_task(delayed_start())
+    resp = await client.request(test_server_name, request)
+    assert resp['msg'] == "Success"
+    assert client.servers[test_server_name] is not first_conn
+
+    server, task = await restart
+    await client.disconnect(test_server_name)
+    task.cancel()
+    server.stop()
+
+
+@pytest.mark.asyncio
+async def test_client_gives_up_connecting():
+    client = create_comms("test_client_name", config)
+    client.pool.attempts = 3
+    client.pool.delay = 0.01
+
+    request = {
+        "source_id": "test_client_name",
+        "target_id": "nobody_home",
+        "permissions": [{"perm": "/a/permission", "context": {}}]}
+
+    with pytest.raises(FileNotFoundError):
+        await client.request("nobody_home", request)
+    assert "nobody_home" not in client.servers
+
+
+async def stall_client(server_name, client_name):
+    """ Connects a raw client which identifies itself and never reads """
+    reader, writer = await asyncio.open_unix_connection(
+        f"{config.SOCKET_ROOT}/{server_name}.sock")
+    msg = {"source_id": client_name, "target_id": server_name,
+           "permissions": []}
+    writer.write(json.dumps(msg).encode('utf-8') + b'\n')
+    await writer.drain()
+    return reader, writer
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("overflow", ["drop_oldest", "disconnect"])
+async def test_stalled_client_does_not_block_others(overflow):
+
+    async def process(comms):
+        while True:
+            data = await comms.in_q.get()
+            if data['source_id'] == "stalled":
+                # far more than the socket buffers will hold
+                for _ in range(20):
+                    await comms.out_q.put(
+                        {"source_id": "stalled", "msg": "x" * 100_000})
+                continue
+            resp = data.copy()
+            resp.pop('permissions')
+            resp['code'] = 0
+            resp['msg'] = "Success"
+            await comms.out_q.put(resp)
+
+    test_server_name = "test_server_name"
+    server = create_comms(test_server_name, config)
+    server.client_queue_size = 2
+    server.overflow = overflow
+    server.start()
+    await asyncio.sleep(0)
+    task = asyncio.create_task(process(server))
+
+    _, stalled = await stall_client(test_server_name, "stalled")
+    await asyncio.sleep(0.1)
+
+    client = create_comms("test_client_name", config)
+    request = {
+        "source_id": "test_client_name",
+        "target_id": test_server_name,
+        "permissions": [{"perm": "/a/permission", "context": {}}]}
+    resp = await asyncio.wait_for(
+        client.request(test_server_name, request), 1)
+
+    assert resp['msg'] == "Success"
+    assert server.overflows[overflow] > 0
+    if overflow == "disconnect":
+        assert "stalled" not in server.clients
+
+    stalled.close()
+    await client.disconnect(test_server_name)
+    task.cancel()
+    server.stop()
+
+
+@pytest.mark.asyncio
+async def test_request_timeout():
+    """ A request which times out leaves the connection usable, and its late
+    response is not mistaken for the next one """
+
+    async def process(comms):
+        slow = await comms.in_q.get()
+        fast = await comms.in_q.get()
+        for data in (slow, fast):
+            resp = data.copy()
+            resp.pop('permissions')
+            resp['code'] = 0
+            resp['msg'] = data['permissions'][0]['perm']
+            await comms.out_q.put(resp)
+
+    test_server_name = "test_server_name"
+    server = create_comms(test_server_name, config)
+    server.start()
+    await asyncio.sleep(0)
+    task = asyncio.create_task(process(server))
+
+    test_client_name = "test_client_name"
+    client = create_comms(test_client_name, config)
+
+    def make_req(perm):
+        return {
+            "source_id": test_client_name,
+            "target_id": test_server_name,
+            "permissions": [{"perm": perm, "context": {}}]}
+
+    with pytest.raises(RequestTimeout):
+        await client.request(test_server_name, make_req("/slow"), timeout=.1)
+    conn = client.servers[test_server_name]
+    assert not conn.pending
+
+    client.timeouts[test_server_name] = 1
+    resp = await client.request(test_server_name, make_req("/fast"))
+    assert resp['msg'] == "/fast"
+    assert client.servers[test_server_name] is conn
+
+    await client.disconnect(test_server_name)
+    task.cancel()
+    server.stop()
+
+
+@pytest.fixture
+def tls_files(tmp_path):
+    """ A self-signed cert which also serves as its own CA """
+    if not shutil.which("openssl"):
+        pytest.skip("openssl is required to create test certificates")
+    cert, key = tmp_path / "cert.pem", tmp_path / "key.pem"
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+         "-keyout", str(key), "-out", str(cert), "-days", "1",
+         "-subj", "/CN=localhost",
+         "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"],
+        check=True, capture_output=True)
+    return str(cert), str(key)
+
+
+async def echo_process(comms):
+    while True:
+        data = await comms.in_q.get()
+        resp = data.copy()
+        resp.pop('permissions')
+        resp['code'] = 0
+        resp['msg'] = "Success"
+        await comms.out_q.put(resp)
+
+
+@pytest.mark.asyncio
+async def test_client_server_tls(tls_files, free_port):
+    cert, key = tls_files
+    address = ("127.0.0.1", free_port)
+
+    test_server_name = "test_tcp_server"
+    server = create_comms(test_server_name, config)
+    server.tcp_address = address
+    server.server_ssl, _ = create_ssl_contexts(cert, key, cert)
+    server.start()
+    await asyncio.sleep(0.1)
+    task = asyncio.create_task(echo_process(server))
+
+    test_client_name = "test_client_name"
+    client = create_comms(test_client_name, config)
+    client.routes[test_server_name] = address
+    _, client.client_ssl = create_ssl_contexts(cert, key, cert)
+
+    request = {
+        "source_id": test_client_name,
+        "target_id": test_server_name,
+        "permissions": [{"perm": "/a/permission", "context": {}}]}
+
+    try:
+        resp = await client.request(test_server_name, request)
+        assert resp['msg'] == "Success"
+        conn = client.servers[test_server_name]
+        assert conn.writer.get_extra_info('peername')[1] == address[1]
+        assert conn.writer.get_extra_info('ssl_object')
+
+        # reconnecting resumes the TLS session
+        await client.disconnect(test_server_name)
+        resp = await client.request(test_server_name, request)
+        assert resp['msg'] == "Success"
+        conn = client.servers[test_server_name]
+        assert conn.writer.get_extra_info('ssl_object').session_reused
+    finally:
+        await client.disconnect(test_server_name)
+        task.cancel()
+        server.stop()
+
+
+def test_topic_matches():
+    assert topic_matches("/front_door/*", "/front_door/open")
+    assert topic_matches("*", "/front_door/open")
+    assert topic_matches("/front_door/open", "/front_door/open")
+    assert not topic_matches("/front_door/open", "/front_door/opened")
+    assert not topic_matches("/back_door/*", "/front_door/open")
+
+
+@pytest.mark.asyncio
+async def test_heartbeats():
+    """ A watched peer is up while it answers heartbeats, down once it
+    stops, and up again when it comes back, with each change published.
+    """
+    test_server_name = "test_server_name"
+    server = create_comms(test_server_name, config)
+    server.start()
+    await asyncio.sleep(0.1)
+
+    test_client_name = "test_client_name"
+    client = create_comms(test_client_name, config)
+    client.heartbeat_interval = 0.05
+    client.heartbeat_misses = 2
+    client.pool.attempts = 1
+    health = client.subscribe("/health/*")
+    assert client.alive(test_server_name) is None
+    client.watch(test_server_name)
+
+    event = await asyncio.wait_for(health.get(), 1)
+    assert event['event'] == f"/health/{test_server_name}/up"
+    assert client.alive(test_server_name) is True
+    stats = server.stats()['counters']
+    assert stats[f"received/{test_client_name}/heartbeat"] >= 1
+    assert server.in_q.empty()
+
+    server.stop()
+    event = await asyncio.wait_for(health.get(), 1)
+    assert event['event'] == f"/health/{test_server_name}/down"
+    assert client.alive(test_server_name) is False
+
+    server.start()
+    event = await asyncio.wait_for(health.get(), 2)
+    assert event['event'] == f"/health/{test_server_name}/up"
+    assert client.stats()['gauges']['peers'] == {test_server_name: True}
+
+    await client.shutdown()
+    server.stop()
+
+
+@pytest.mark.asyncio
+async def test_registry():
+    """ Components see each other come and go, and a request to one which
+    isn't running yet waits for it to start rather than failing.
+    """
+    test_client_name = "test_client_name"
+    client = create_comms(test_client_name, config)
+    client.start()
+    registry = client.subscribe("/registry/*")
+    await asyncio.sleep(0.1)
+
+    test_server_name = "test_server_name"
+    server = create_comms(test_server_name, config)
+    req = {
+        "source_id": test_client_name,
+        "target_id": test_server_name,
+        "permissions": [{"perm": "/perm", "context": {}}]}
+    request = asyncio.create_task(client.request(test_server_name, req))
+    await asyncio.sleep(0.1)
+    assert not request.done()
+
+    server.start()
+    event = await asyncio.wait_for(registry.get(), 1)
+    assert event['event'] == f"/registry/{test_server_name}/up"
+    info = client.registry.get(test_server_name)
+    assert info['pid'] == os.getpid()
+    assert info['transport']['unix'].endswith(f"/{test_server_name}.sock")
+    assert info['json_codec'] == json_codec().name
+    assert set(info['framings']) == set(FRAMINGS)
+
+    data = await asyncio.wait_for(server.in_q.get(), 1)
+    resp = data.copy()
+    resp.pop('permissions')
+    resp['code'] = 0
+    await server.out_q.put(resp)
+    assert (await asyncio.wait_for(request, 1))['code'] == 0
+
+    server.stop()
+    event = await asyncio.wait_for(registry.get(), 1)
+    assert event['event'] == f"/registry/{test_server_name}/down"
+    assert test_server_name not in client.registry
+
+    await client.shutdown()
+    assert not os.path.exists(client.registry.path(test_client_name))
+
+
+@pytest.mark.asyncio
+async def test_registry_process_killed():
+    """ A component killed before it could withdraw its announcement is
+    seen to go all the same.
+    """
+    name = "test_killed"
+    test_client_name = "test_client_name"
+    client = create_comms(test_client_name, config)
+    client.start()
+    client.registry.poll_interval = 0.1
+    registry = client.subscribe(f"/registry/{name}/*")
+    await asyncio.sleep(0.1)
+
+    proc = subprocess.Popen(["sleep", "60"])
+    try:
+        client.registry.announce({"name": name, "pid": proc.pid})
+        event = await asyncio.wait_for(registry.get(), 1)
+        assert event['event'] == f"/registry/{name}/up"
+
+        proc.kill()
+        proc.wait()
+        event = await asyncio.wait_for(registry.get(), 1)
+        assert event['event'] == f"/registry/{name}/down"
+        assert name not in client.registry
+    finally:
+        proc.kill()
+        client.registry.withdraw(name)
+        await client.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_publish_subscribe():
+    test_server_name = "test_server_name"
+    server = create_comms(test_server_name, config)
+    server.start()
+    await asyncio.sleep(0)
+
+    local = server.subscribe("/front_door/*")
+
+    client = create_comms("test_client_name", config)
+    remote = await client.subscribe_remote(test_server_name, "/front_door/*")
+    others = await client.subscribe_remote(test_server_name, "/back_door/*")
+    await asyncio.sleep(0.1)
+
+    server.publish("/front_door/open")
+    server.publish("/back_door/open", {"who": "someone"})
+    server.publish("/side_door/open")
+
+    expected = {"source_id": test_server_name, "event": "/front_door/open"}
+    assert await asyncio.wait_for(local.get(), 1) == expected
+    assert await asyncio.wait_for(remote.get(), 1) == expected
+    back = await asyncio.wait_for(others.get(), 1)
+    assert back['context'] == {"who": "someone"}
+    assert local.empty() and remote.empty() and others.empty()
+    assert server.in_q.empty()
+
+    # subscriptions are dropped with the connection
+    await client.disconnect(test_server_name)
+    await asyncio.sleep(0.1)
+    assert not any(server.subscribers.values())
+
+    server.stop()
+
+
+@pytest.mark.asyncio
+async def test_memory_hub():
+    """ Components sharing a hub exchange message objects without sockets """
+
+    class HubConfig(config):
+        MEMORY_HUB = MemoryHub()
+
+    async def process(comms):
+        data = await comms.in_q.get()
+        resp = data.copy()
+        resp.pop('permissions')
+        resp['code'] = 0
+        resp['msg'] = "Success"
+        await comms.out_q.put(resp)
+
+    test_server_name = "test_server_name"
+    server = create_comms(test_server_name, HubConfig)
+    server.start()
+    await asyncio.sleep(0)
+    asyncio.create_task(process(server))
+
+    test_client_name = "test_client_name"
+    client = create_comms(test_client_name, HubConfig)
+    events = await client.subscribe_remote(test_server_name, "/front_door/*")
+
+    request = {
+        "source_id": test_client_name,
+        "target_id": test_server_name,
+        "permissions": [{"perm": "/a/permission", "context": {}}]}
+
+    resp = await client.request(test_server_name, request)
+    assert resp['msg'] == "Success"
+    assert 'request_id' not in resp
+    assert isinstance(client.servers[test_server_name], MemoryConnection)
+
+    server.publish("/front_door/open")
+    event = await asyncio.wait_for(events.get(), 1)
+    assert event['event'] == "/front_door/open"
+
+    # once the server leaves the hub, its connections are dropped
+    server.stop()
+    assert client.servers[test_server_name].closed
+    await client.disconnect(test_server_name)
+
+
+@pytest.mark.parametrize("codec", list(JSON_CODECS))
+def test_json_codecs(codec):
+    codec = JSON_CODECS[codec]
+    msg = {
+        "source_id": "front_door_rfid",
+        "target_id": "front_door_latch",
+        "permissions": [{"perm": "/open", "ctx": {"identity": "0123"}}],
+        "note": "ünïcode",
+    }
+    data = codec.dumps(msg)
+    assert isinstance(data, bytes)
+    assert json.loads(data) == msg
+    assert codec.loads(data + b'\n') == msg
+    with pytest.raises(ValueError):
+        codec.loads(b'{"not": json}')
+
+
+def test_set_json_codec():
+    current = json_codec()
+    set_json_codec("json")
+    assert json_codec().name == "json"
+    with pytest.raises(ValueError):
+        set_json_codec("not_a_codec")
+    set_json_codec(current.name)
+
+
+def test_queue_logging(tmp_path):
+
+    class log_config(config):
+        LOG_ROOT = str(tmp_path)
+        LOG_LEVEL = logging.DEBUG
+        LOG_QUEUE = True
+        LOG_SAMPLE_RATE = 3
+
+    comms = create_comms("test_queue_logging", log_config)
+    assert isinstance(comms.logger.handlers[-1], LazyQueueHandler)
+
+    scan = {"identity": "0123"}
+    for i in range(6):
+        scan['count'] = i
+        comms.logger.debug("scan %s", scan)
+    comms.logger.warning("not sampled")
+    comms.logger.warning("not sampled")
+    stop_logging(comms)
+    assert comms.log_listener is None
+    comms.logger.handlers.clear()
+
+    log = (tmp_path / "test_queue_logging.log").read_text()
+    assert "Logging enabled" in log
+    assert "'count': 0" in log and "'count': 3" in log
+    assert "'count': 1" not in log
+    assert log.count("not sampled") == 2
+
+
+def test_sampling_filter_bounded():
+    """ Only the messages logged most recently are counted """
+    sampler = SamplingFilter(3, max_keys=2)
+
+    def sampled(msg):
+        return sampler.filter(logging.LogRecord(
+            "test", logging.DEBUG, __file__, 0, msg, (), None))
+
+    assert [sampled("a") for _ in range(4)] == [True, False, False, True]
+    for i in range(100):
+        sampled(f"once {i}")
+    assert len(sampler.counts) == 2
+    # "a" was forgotten, so counts from its next record again
+    assert sampled("a")
+    assert sampled("b") and not sampled("b")
+    assert not sampled("a")
@@ -0,0 +1,112 @@
+import os
+import sqlite3
+from unittest.mock import patch
+import pytest
+from secbot.database import (
+    connect,
+    delete_rfid,
+    find_rfid,
+    find_sponsored,
+    migrate_csv,
+    put_rfid,
+    read_acl_data,
+    SCHEMA_VERSION,
+    SNAPSHOT_FILE,
+    write_hours_data,
+    write_rfid_data,
+)
+
+
+HOURS = {'allhours': ['0', '24'], 'daytime': ['11', '22']}
+RFIDS = {
+    '0000000001': {'access_times': 'allhours', 'sponsor': 'beka'},
+    '0000000002': {'access_times': 'daytime', 'sponsor': 'matt'},
+    '0000000003': {'access_times': 'daytime', 'sponsor': 'beka'},
+}
+
+
+def test_csv_round_trip(tmp_path):
+    write_hours_data(HOURS, tmp_path)
+    write_rfid_data(RFIDS, tmp_path)
+    assert read_acl_data(tmp_path) == {'hours': HOURS, 'rfids': RFIDS}
+
+
+def test_snapshot(tmp_path):
+    """ The CSV files are parsed only when they change """
+    write_hours_data(HOURS, tmp_path)
+    write_rfid_data(RFIDS, tmp_path)
+    assert read_acl_data(tmp_path) == {'hours': HOURS, 'rfids': RFIDS}
+    assert os.path.exists(tmp_path / SNAPSHOT_FILE)
+
+    with patch('secbot.database.csv') as csv:
+        assert read_acl_data(tmp_path) == {'hours': HOURS, 'rfids': RFIDS}
+        assert not csv.reader.called and not csv.DictReader.called
+
+    rfids = dict(RFIDS)
+    rfids['0000000004'] = {'access_times': 'daytime', 'sponsor': ''}
+    write_rfid_data(rfids, tmp_path)
+    stat = os.stat(tmp_path / "rfids.csv")
+    assert read_acl_data(tmp_path)['rfids'] == rfids
+
+    # the same size and mtime, but different cards
+    rfids['0000000004'] = {'access_times': 'alltime', 'sponsor': ''}
+    write_rfid_data(rfids, tmp_path)
+    os.utime(tmp_path / "rfids.csv", ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert os.stat(tmp_path / "rfids.csv").st_size == stat.st_size
+    assert read_acl_data(tmp_path)['rfids'] == rfids
+
+    (tmp_path / SNAPSHOT_FILE).write_bytes(b"SBACL")
+    assert read_acl_data(tmp_path)['rfids'] == rfids
+    assert read_acl_data(tmp_path, snapshot=False)['rfids'] == rfids
+
+
+def test_migrate_csv(tmp_path):
+    write_hours_data(HOURS, tmp_path)
+    write_rfid_data(RFIDS, tmp_path)
+    database = str(tmp_path / "acl.sqlite3")
+
+    assert migrate_csv(tmp_path, database) == (2, 3)
+    assert read_acl_data(database=database) == {'hours': HOURS, 'rfids': RFIDS}
+    assert migrate_csv(tmp_path, database) == (2, 3)
+    assert len(read_acl_data(database=database)['rfids']) == 3
+
+    with connect(database) as db:
+        assert db.execute("PRAGMA journal_mode").fetchone() == ('wal',)
+        assert db.execute("SELECT version FROM schema_version").fetchall() \
+            == [(SCHEMA_VERSION,)]
+
+
+def test_sqlite_acl_store(tmp_path):
+    database = str(tmp_path / "acl.sqlite3")
+    write_hours_data(HOURS, database=database)
+    write_rfid_data(RFIDS, database=database)
+
+    assert find_rfid(database, '0000000002') == RFIDS['0000000002']
+    assert find_rfid(database, '0000000009') is None
+    assert set(find_sponsored(database, 'beka')) == {'0000000001',
+                                                     '0000000003'}
+
+    put_rfid(database, '0000000004', 'allhours', 'matt')
+    put_rfid(database, '0000000002', 'allhours', 'matt')
+    delete_rfid(database, '0000000003')
+    rfids = read_acl_data(database=database)['rfids']
+    assert set(rfids) == {'0000000001', '0000000002', '0000000004'}
+    assert rfids['0000000002']['access_times'] == 'allhours'
+
+    rfids.pop('0000000001')
+    write_rfid_data(rfids, database=database)
+    assert read_acl_data(database=database)['rfids'] == rfids
+
+    write_hours_data({'allhours': [0, 24]}, database=database)
+    assert read_acl_data(database=database)['hours'] == \
+        {'allhours': ['0', '24']}
+
+
+def test_newer_schema(tmp_path):
+    database = str(tmp_path / "acl.sqlite3")
+    connect(database).close()
+    with sqlite3.connect(database) as db:
+        db.execute("UPDATE schema_version SET version = ?",
+                   (SCHEMA_VERSION + 1,))
+    with pytest.raises(ValueError):
+        read_acl_data(database=database)
@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+from services.settings import Config as config
+from secbot.comms import create_comms
+from secbot.eventloop import (
+    best_event_loop,
+    event_loop_name,
+    EVENT_LOOPS,
+    new_event_loop,
+    setup_event_loop,
+)
+
+
+def test_new_event_loop():
+    loop = new_event_loop("asyncio")
+    assert event_loop_name(loop) == "asyncio"
+    loop.close()
+
+    with pytest.raises(ValueError):
+        new_event_loop("twisted")
+
+    loop = setup_event_loop(config)
+    assert event_loop_name(loop) == best_event_loop()
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+@pytest.mark.parametrize("name", EVENT_LOOPS)
+def test_comms_on_event_loop(name):
+
+    async def process(comms):
+        data = await comms.in_q.get()
+        resp = data.copy()
+        resp.pop('permissions')
+        resp['code'] = 0
+        resp['msg'] = "Success"
+        await comms.out_q.put(resp)
+
+    async def round_trip():
+        test_server_name = "test_server_name"
+        server = create_comms(test_server_name, config)
+        server.start()
+        await asyncio.sleep(0.1)
+        asyncio.create_task(process(server))
+
+        test_client_name = "test_client_name"
+        client = create_comms(test_client_name, config)
+        resp = await client.request(test_server_name, {
+            "source_id": test_client_name,
+            "target_id": test_server_name,
+            "permissions": [{"perm": "/a/permission", "context": {}}]})
+        assert resp['code'] == 0
+        assert server.stats()['loop'] == name
+
+        await client.shutdown()
+        await server.shutdown()
+
+    loop = new_event_loop(name)
+    try:
+        loop.run_until_complete(round_trip())
+    finally:
+        loop.close()
+        asyncio.set_event_loop(None)
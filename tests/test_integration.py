@@ -8,7 +8,17 @@ from unittest.mock import (
 )
 import sys
 sys.modules['gpiozero'] = MagicMock()
+from secbot.comms import (
+    MemoryConnection,
+    MemoryHub,
+)
 from services import broadcast
+from services.authorizer import Authorizer
+from services.latch import Relay
+from services.rfid_reader import (
+    LABELS,
+    RfidReader,
+)
 from services.settings import Config as comms_config
 import pytest
 
@@ -120,3 +130,67 @@ async def test_access_control(dt,
     while tasks:
         tasks.pop().cancel()
     bcast_task.cancel()
+
+
+@pytest.mark.asyncio
+@patch('services.latch.RELAY.off')
+@patch('services.latch.RELAY.on')
+@patch('services.authorizer.datetime')
+@patch('services.authorizer.read_acl_data')
+@patch('services.rfid_reader.RfidReader.find_ev_device')
+async def test_access_control_embedded(find_ev_device,
+                                       read_acl_data,
+                                       dt,
+                                       relayON,
+                                       relayOFF,
+                                       ev_device):
+    """ The services run in one loop and talk over a MemoryHub """
+
+    class HubConfig(comms_config):
+        MEMORY_HUB = MemoryHub()
+        TRACING = True
+
+    find_ev_device.return_value = ev_device
+    read_acl_data.return_value = {
+        'hours': {'allhours': [0, 24]},
+        'rfids': {'0123456789': {'access_times': 'allhours',
+                                 'sponsor': 'beka'}}}
+    dt.now = Mock(return_value=datetime(2023, 1, 2, 9, 30))
+
+    relay = Relay("front_door_latch", HubConfig)
+    auth = Authorizer(HubConfig)
+    rfid_reader = RfidReader("test_rfid_reader", LABELS, HubConfig)
+
+    tasks = [asyncio.create_task(broadcast.process(HubConfig))]
+    for service in (relay, auth, rfid_reader):
+        tasks.append(asyncio.create_task(service.process()))
+        await asyncio.sleep(0)
+
+    events = await rfid_reader.comms.subscribe_remote(
+        "front_door_latch", "/front_door/*")
+
+    ev_device.scan('0123456789')
+    await asyncio.sleep(.1)
+    assert relayON.call_count == 1
+    assert (await asyncio.wait_for(events.get(), 1))['event'] == \
+        "/front_door/open"
+
+    # the scan was traced from the Enter key to the relay
+    trace, = relay.comms.tracer.dump()
+    assert [span[:2] for span in trace['spans']] == [
+        ["enter", "test_rfid_reader"],
+        ["receive", "authorizer"],
+        ["acl_lookup", "authorizer"],
+        ["receive", "front_door_latch"],
+        ["relay_on", "front_door_latch"]]
+    assert relay.comms.stats()['traces']['total']['count'] == 1
+
+    assert isinstance(rfid_reader.comms.servers['authorizer'],
+                      MemoryConnection)
+    assert isinstance(auth.comms.servers['front_door_latch'],
+                      MemoryConnection)
+
+    for service in (relay, auth, rfid_reader):
+        service.comms.stop()
+    while tasks:
+        tasks.pop().cancel()
@@ -45,6 +45,7 @@ async def test_open(relayOFF, relayON):
     front_door = latch.Relay("front_door", comms_config)
     task = asyncio.create_task(front_door.process())
 
+    events = front_door.comms.subscribe("/front_door/*")
     await asyncio.sleep(0)
 
     open_req = {
@@ -57,6 +58,12 @@ async def test_open(relayOFF, relayON):
     assert not front_door.cool.is_set()
     await front_door.cool.wait()
     assert not front_door.open.is_set()
+
+    topics = []
+    while not events.empty():
+        topics.append((await events.get())['event'])
+    assert topics == ["/front_door/ready", "/front_door/open",
+                      "/front_door/cooling", "/front_door/ready"]
     task.cancel()
     front_door.comms.logger.handlers.clear()
     front_door.comms.stop()
@@ -0,0 +1,118 @@
+import asyncio
+import pytest
+from services.settings import Config as config
+from services.stats import (
+    print_stats,
+    read_stats,
+)
+from secbot.comms import create_comms
+from secbot.metrics import (
+    Histogram,
+    MeteredQueue,
+    Metrics,
+    message_type,
+    quantile,
+)
+
+
+def test_message_type():
+    assert message_type({"permissions": []}) == "request"
+    assert message_type({"code": 0, "msg": "OK"}) == "response"
+    assert message_type({"event": "/front_door/open"}) == "event"
+    assert message_type({"subscribe": ["*"]}) == "subscribe"
+    assert message_type({"heartbeat": 1}) == "heartbeat"
+    assert message_type({}) == "other"
+
+
+def test_histogram():
+    hist = Histogram((0.001, 0.01, 0.1))
+    for value in (0.0005, 0.001, 0.005, 0.05, 0.05, 1):
+        hist.observe(value)
+
+    snapshot = hist.snapshot()
+    assert snapshot['count'] == 6
+    assert snapshot['buckets'] == [[0.001, 2], [0.01, 1], [0.1, 2],
+                                   ["inf", 1]]
+    assert hist.quantile(0.5) == 0.01
+    assert hist.quantile(0.99) == "inf"
+    assert quantile(Histogram().snapshot(), 0.5) is None
+
+
+@pytest.mark.asyncio
+async def test_metered_queue():
+    metrics = Metrics()
+    q = MeteredQueue(metrics, "wait")
+    msg = {"source_id": "someone", "permissions": []}
+    await q.put(msg)
+    assert await q.get() is msg
+
+    hist = metrics.snapshot()['histograms']['wait/someone/request']
+    assert hist['count'] == 1
+
+
+@pytest.mark.asyncio
+async def test_metrics_peers():
+    """ However many source_ids peers make up, only max_peers of them name
+    metrics, the rest are counted as other """
+    metrics = Metrics(max_peers=2)
+    q = MeteredQueue(metrics, "wait")
+    for i in range(100):
+        await q.put({"source_id": f"peer_{i}", "permissions": []})
+        await q.get()
+    await q.put({"source_id": ["not", "a", "name"], "permissions": []})
+    await q.get()
+
+    histograms = metrics.snapshot()['histograms']
+    assert set(histograms) == {
+        "wait/peer_0/request", "wait/peer_1/request", "wait/other/request"}
+    assert histograms["wait/other/request"]['count'] == 99
+    assert metrics.peer("peer_1") == "peer_1"
+
+
+@pytest.mark.asyncio
+async def test_comms_stats_socket(capsys):
+
+    async def process(comms):
+        data = await comms.in_q.get()
+        resp = data.copy()
+        resp.pop('permissions')
+        resp['code'] = 0
+        resp['msg'] = "Success"
+        await comms.out_q.put(resp)
+
+    test_server_name = "test_server_name"
+    server = create_comms(test_server_name, config)
+    server.start()
+    await asyncio.sleep(0.1)
+    asyncio.create_task(process(server))
+
+    test_client_name = "test_client_name"
+    client = create_comms(test_client_name, config)
+    request = {
+        "source_id": test_client_name,
+        "target_id": test_server_name,
+        "permissions": [{"perm": "/a/permission", "context": {}}]}
+    await client.request(test_server_name, request)
+
+    stats = await read_stats(config.SOCKET_ROOT, test_server_name)
+    assert stats['name'] == test_server_name
+    assert stats['counters'][f"received/{test_client_name}/request"] == 1
+    assert stats['counters'][f"sent/{test_client_name}/response"] == 1
+    assert stats['counters']["connections/accepted"] == 1
+    assert stats['gauges']['clients'] == 1
+    assert stats['gauges']['client_queues'] == {test_client_name: 0}
+    assert stats['gauges']['in_q'] == 0
+    assert f"in_q_wait/{test_client_name}/request" in stats['histograms']
+
+    rtt = client.stats()['histograms'][
+        f"request_rtt/{test_server_name}/request"]
+    assert rtt['count'] == 1
+
+    print_stats(stats)
+    assert test_server_name in capsys.readouterr().out
+
+    await client.disconnect(test_server_name)
+    await asyncio.sleep(0.1)
+    assert server.stats()['counters']["connections/closed"] == 1
+    server.stop()
+    client.stop()
@@ -15,6 +15,7 @@ from services.rfid_reader import (
     RfidReader,
 )
 from services.settings import Config as comms_config
+from services.stats import read_stats
 
 class MockEvDevice:
 
@@ -94,10 +95,17 @@ async def test_get_reader(find_ev_device):
     expected_req = make_request(name, test_string)
 
     asyncio.create_task(rfid.process())
-    await asyncio.sleep(1)
-    rfid.comms.request.assert_called()
-    rfid.comms.request.assert_awaited()
-    rfid.comms.request.assert_called_with("authorizer", expected_req)
+    try:
+        await asyncio.sleep(1)
+        rfid.comms.request.assert_called()
+        rfid.comms.request.assert_awaited()
+        rfid.comms.request.assert_called_with("authorizer", expected_req)
+
+        # the reader serves no requests, but does serve its stats
+        stats = await read_stats(comms_config.SOCKET_ROOT, name)
+        assert stats['name'] == name
+    finally:
+        rfid.comms.stop()
 
 
 @pytest.mark.asyncio
@@ -110,6 +118,7 @@ async def test_missing_dev(find_ev_device):
 
     with pytest.raises(ValueError):
         await rfid.process()
+    assert 'stats' not in rfid.comms.tasks
 
 
 @pytest.mark.asyncio
@@ -130,8 +139,11 @@ async def test_bad_key(find_ev_device):
     assert rfid.dev == mevdev
 
     asyncio.create_task(rfid.process())
-    await asyncio.sleep(1)
-
-    rfid.comms.request.assert_called()
-    rfid.comms.request.assert_awaited()
-    rfid.comms.request.assert_called_with("authorizer", expected_req)
+    try:
+        await asyncio.sleep(1)
+
+        rfid.comms.request.assert_called()
+        rfid.comms.request.assert_awaited()
+        rfid.comms.request.assert_called_with("authorizer", expected_req)
+    finally:
+        rfid.comms.stop()
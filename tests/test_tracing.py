@@ -0,0 +1,46 @@
+import pytest
+from secbot.tracing import (
+    percentiles,
+    Tracer,
+)
+
+
+def test_percentiles():
+    summary = percentiles(range(1, 101))
+    assert summary == {"count": 100, "max": 100,
+                       "p50": 50, "p90": 90, "p99": 99}
+    assert percentiles([]) == {"count": 0}
+    assert percentiles([3])['p99'] == 3
+
+
+def test_tracer():
+    reader = Tracer("reader")
+    latch = Tracer("latch", size=2)
+
+    for _ in range(3):
+        trace = reader.start()
+        reader.record(trace, "enter", 10.0, 10.5)
+        with latch.span(trace, "relay_on"):
+            pass
+        latch.finish(trace)
+        trace['spans'].clear()  # a finished trace is a copy
+
+    traces = latch.dump()
+    assert len(traces) == 2
+    assert [span[:2] for span in traces[0]['spans']] == [
+        ["enter", "reader"], ["relay_on", "latch"]]
+
+    summary = latch.summary()
+    assert summary['total']['count'] == 2
+    assert summary['spans']['reader/enter']['max'] == pytest.approx(0.5)
+    assert summary['spans']['latch/relay_on']['count'] == 2
+
+
+def test_tracer_without_trace():
+    tracer = Tracer("reader")
+    with tracer.span(None, "enter"):
+        pass
+    tracer.record(None, "enter", 0)
+    tracer.finish(None)
+    assert tracer.dump() == []
+    assert tracer.summary()['total'] == {"count": 0}
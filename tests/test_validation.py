@@ -0,0 +1,122 @@
+import asyncio
+import pytest
+from services.settings import Config as config
+from secbot import schema
+from secbot.comms import create_comms
+from secbot.validation import (
+    compile_schema,
+    ValidationError,
+)
+
+
+def test_validate_messages():
+    request = {
+        "source_id": "front_door_rfid",
+        "target_id": "front_door_latch",
+        "request_id": 1,
+        "permissions": [{"perm": "/open", "ctx": {"identity": "0123"}}]}
+    assert schema.validate_request(request) is request
+
+    with pytest.raises(ValidationError, match=r"\$: missing 'target_id'"):
+        schema.validate_request({"source_id": "a", "permissions": []})
+    with pytest.raises(ValidationError,
+                       match=r"\$.permissions\[1\].perm: expected string"):
+        schema.validate_request({
+            "source_id": "a", "target_id": "b",
+            "permissions": [{"perm": "/open"}, {"perm": 1}]})
+
+    schema.validate_response({
+        "source_id": "a", "target_id": "b", "code": 0, "msg": "OK"})
+    with pytest.raises(ValidationError, match="expected integer"):
+        schema.validate_response({
+            "source_id": "a", "target_id": "b", "code": True, "msg": "OK"})
+
+    schema.validate_event({"source_id": "a", "event": "/front_door/open"})
+    with pytest.raises(ValidationError, match="expected object"):
+        schema.validate_event({"source_id": "a", "event": "/x",
+                               "context": []})
+
+
+def test_compile_schema():
+    validate = compile_schema({
+        "$id": "/schemas/thing",
+        "type": "object",
+        "properties": {
+            "kind": {"enum": ["a", "b"]},
+            "sizes": {"type": "array", "items": {"type": ["integer", "null"]},
+                      "minItems": 1},
+        },
+        "required": ["kind"],
+        "additionalProperties": False,
+    })
+    assert validate.__name__ == "validate_thing"
+    validate({"kind": "a", "sizes": [1, None]})
+
+    for bad in ({"kind": "c"},
+                {"kind": "a", "sizes": []},
+                {"kind": "a", "sizes": [1.5]},
+                {"kind": "a", "other": 1},
+                ["kind"]):
+        with pytest.raises(ValidationError):
+            validate(bad)
+
+    with pytest.raises(ValueError, match="pattern"):
+        compile_schema({"$id": "x", "type": "string", "pattern": "^a"})
+
+
+@pytest.mark.asyncio
+async def test_comms_validation():
+
+    class ValidatingConfig(config):
+        VALIDATE = True
+
+    async def process(comms):
+        while True:
+            data = await comms.in_q.get()
+            resp = data.copy()
+            resp.pop('permissions')
+            if data['permissions'][0]['perm'] != "/bad/response":
+                resp['code'] = 0
+                resp['msg'] = "Success"
+            await comms.out_q.put(resp)
+
+    test_server_name = "test_server_name"
+    server = create_comms(test_server_name, ValidatingConfig)
+    server.start()
+    await asyncio.sleep(0)
+    task = asyncio.create_task(process(server))
+
+    test_client_name = "test_client_name"
+    client = create_comms(test_client_name, config)
+
+    def make_req(perm):
+        return {
+            "source_id": test_client_name,
+            "target_id": test_server_name,
+            "permissions": [{"perm": perm, "context": {}}]}
+
+    resp = await client.request(test_server_name, make_req("/a/permission"))
+    assert resp['code'] == 0
+
+    # a bad request is answered by the server, never reaching the service
+    resp = await client.request(test_server_name, make_req(1))
+    assert resp['code'] == 1
+    assert "expected string" in resp['msg']
+    assert server.in_q.empty()
+
+    # a bad response is dropped
+    with pytest.raises(asyncio.TimeoutError):
+        await client.request(
+            test_server_name, make_req("/bad/response"), timeout=0.2)
+    counters = server.stats()['counters']
+    assert counters[f"invalid/{test_client_name}/request"] == 1
+    assert counters[f"invalid/{test_client_name}/other"] == 1
+
+    # and a validating client won't send one
+    client.validate = True
+    with pytest.raises(ValidationError):
+        await client.request(test_server_name, make_req(None))
+
+    task.cancel()
+    await client.disconnect(test_server_name)
+    server.stop()